@@ -0,0 +1,6 @@
+"""
+PDF Colorizer Benchmarks
+
+Scripts measuring the latency and memory use of the application's hot paths
+on synthetic street-plan documents.
+"""
@@ -0,0 +1,100 @@
+"""Benchmark edge detection: whole-page float64 vs banded int16/float32 threads.
+
+Usage:
+    python -m benchmarks.bench_edges [--megapixels 50 100 150] [--repeats N]
+
+"float64" is the original edge step, Sobel and magnitude over the whole
+page in float64. "banded" is the current compute_edge_magnitude, which
+splits the page into overlapping bands computed on a thread pool; it is
+run with one worker and with every core. Pages are a synthetic A0 plan
+rendered at the zoom giving each size. Peak is the memory tracemalloc saw
+during one run. The float64 variant needs about 40 bytes per pixel, so it
+is skipped above --reference-limit megapixels.
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from benchmarks.synthetic import PAGE_SIZES, make_street_plan_pdf
+
+
+def whole_page_float64(image):
+    """The original edge step"""
+    import cv2
+    import numpy as np
+    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    sobelx = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
+    sobely = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
+    return np.minimum(np.sqrt(sobelx**2 + sobely**2), 255).astype(np.uint8)
+
+
+def measure(call, repeats):
+    """Best latency in ms, peak traced MB and the result of call()"""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = call()
+        timings.append(time.perf_counter() - start)
+        del result
+    
+    # Tracing slows allocation down, so memory is measured in a separate run
+    tracemalloc.start()
+    try:
+        result = call()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return 1000 * min(timings), peak / (1024 * 1024), result
+
+
+def render_page_of_size(pdf_path, megapixels):
+    """Render the plan at the zoom giving about megapixels pixels"""
+    import fitz
+    from colorizer_engine import render_page
+    width, height = PAGE_SIZES["A0"]
+    zoom = (megapixels * 1e6 / (width * height)) ** 0.5
+    with fitz.open(str(pdf_path)) as doc:
+        return render_page(doc, 0, zoom)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[50, 100, 150])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--reference-limit", type=float, default=100)
+    args = parser.parse_args()
+    
+    import numpy as np
+    from colorizer_engine import compute_edge_magnitude, preload_modules
+    preload_modules()
+    cores = os.cpu_count() or 1
+    
+    print(f"best of {args.repeats}; banded with 1 and {cores} worker(s)")
+    print(f"{'MP':>6}{'float64 ms':>12}{'1 worker ms':>13}{'all ms':>9}{'speedup':>9}"
+          f"{'float64 MB':>12}{'banded MB':>11}{'identical':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = make_street_plan_pdf(Path(tmp) / "plan.pdf", pages=1, size="A0")
+        for megapixels in args.megapixels:
+            image = render_page_of_size(pdf_path, megapixels)
+            single_ms, _, _ = measure(lambda: compute_edge_magnitude(image, 1), args.repeats)
+            banded_ms, banded_mb, banded = measure(lambda: compute_edge_magnitude(image),
+                                                   args.repeats)
+            if megapixels <= args.reference_limit:
+                reference_ms, reference_mb, reference = measure(
+                    lambda: whole_page_float64(image), args.repeats)
+                identical = "yes" if np.array_equal(banded, reference) else "NO"
+                del reference
+                columns = (f"{reference_ms:>12.0f}{single_ms:>13.0f}{banded_ms:>9.0f}"
+                           f"{f'{reference_ms / banded_ms:.1f}x':>9}{reference_mb:>12.0f}")
+            else:
+                identical = "-"
+                columns = f"{'-':>12}{single_ms:>13.0f}{banded_ms:>9.0f}{'-':>9}{'-':>12}"
+            print(f"{image.size / 3e6:>6.0f}{columns}{banded_mb:>11.0f}{identical:>11}")
+            del image, banded
+
+
+if __name__ == "__main__":
+    main()
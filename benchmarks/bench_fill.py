@@ -0,0 +1,117 @@
+"""Benchmark the flood fill: exact vs coarse-to-fine on large pages.
+
+Usage:
+    python -m benchmarks.bench_fill [--megapixels 50 100 150] [--repeats N]
+
+Fills are made on a synthetic A0 plan rendered at the zoom giving each
+size, repeatedly from one seed in alternating colors. "block" seeds a
+city block and "strip" the tall strip of margin left of the first column
+of blocks. "sheet" is a page with only
+a frame, filled from its middle. Visits are the pixels cv2.floodFill walks,
+plus the blocks the coarse pass floods. "map ms" is the one-off cost of
+the page's uniform block map, paid by the first coarse fill on a page.
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import fitz  # PyMuPDF
+
+from benchmarks.bench_suite import block_seeds
+from benchmarks.synthetic import PAGE_SIZES, make_street_plan_pdf
+
+RED = (255, 0, 0)
+BLUE = (0, 0, 255)
+
+
+def make_sheet_pdf(path):
+    """Write an A0 page holding only a frame and a title"""
+    width, height = PAGE_SIZES["A0"]
+    doc = fitz.open()
+    page = doc.new_page(width=width, height=height)
+    page.draw_rect(fitz.Rect(20, 20, width - 20, height - 20), color=(0, 0, 0), width=2)
+    page.insert_text(fitz.Point(40, height - 40), "Site plan", fontsize=24)
+    doc.save(str(path))
+    doc.close()
+    return path
+
+
+def fill(engine, seed, color, coarse):
+    """Time one fill and read the pixels it visited from its trace span"""
+    from colorizer_trace import tracer
+    tracer.clear()
+    start = time.perf_counter()
+    engine.flood_fill(*seed, color, tolerance=30, threshold=50, use_index=False, coarse=coarse)
+    elapsed = time.perf_counter() - start
+    visited = next(event[4]["visited"] for event in tracer.events if event[0] == "fill")
+    return 1000 * elapsed, visited
+
+
+def run_case(pdf_path, zoom, seed, repeats):
+    """Best ms and visits of each variant, the map cost and whether they agree"""
+    import numpy as np
+    from colorizer_engine import ColorizerEngine
+    engine = ColorizerEngine(zoom=zoom)
+    engine.load(str(pdf_path))
+    # Edge map and barrier mask are shared by both variants and built up front
+    engine.edge_cache.barrier_mask(0, engine.original_image, 50)
+    
+    results = {}
+    map_ms = None
+    for coarse in (False, True):
+        if coarse:
+            start = time.perf_counter()
+            engine.uniform_blocks.get(engine.colored_image)
+            map_ms = 1000 * (time.perf_counter() - start)
+        runs = [fill(engine, seed, BLUE if repeat % 2 else RED, coarse)
+                for repeat in range(repeats)]
+        results[coarse] = (min(ms for ms, _ in runs), runs[0][1])
+        engine.reset_page()
+    
+    engine.flood_fill(*seed, RED, use_index=False)
+    exact = engine.colored_image.copy()
+    engine.undo()
+    engine.flood_fill(*seed, RED, use_index=False, coarse=True)
+    identical = np.array_equal(engine.colored_image, exact)
+    engine.close()
+    return results, map_ms, identical
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[50, 100, 150])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    
+    import colorizer_engine
+    from colorizer_trace import tracer
+    colorizer_engine.preload_modules()
+    tracer.enabled = True
+    width, height = PAGE_SIZES["A0"]
+    
+    print(f"best of {args.repeats}; tolerance 30, threshold 50")
+    print(f"{'MP':>5}{'case':>7}{'exact ms':>10}{'coarse ms':>11}{'speedup':>9}"
+          f"{'exact visits':>14}{'coarse visits':>15}{'map ms':>8}{'identical':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        plan = make_street_plan_pdf(Path(tmp) / "plan.pdf", pages=1, size="A0")
+        sheet = make_sheet_pdf(Path(tmp) / "sheet.pdf")
+        for megapixels in args.megapixels:
+            zoom = (megapixels * 1e6 / (width * height)) ** 0.5
+            # The margin strip lies left of the blocks, which start a street's width in
+            street = max(width, height) / 12 / 6
+            cases = {
+                "block": (plan, block_seeds("A0", zoom, 1)[0]),
+                "strip": (plan, (round(street / 2 * zoom), round(height / 2 * zoom))),
+                "sheet": (sheet, (round(width / 2 * zoom), round(height / 2 * zoom))),
+            }
+            for name, (pdf_path, seed) in cases.items():
+                results, map_ms, identical = run_case(pdf_path, zoom, seed, args.repeats)
+                (exact_ms, exact_visits), (coarse_ms, coarse_visits) = results[False], results[True]
+                print(f"{megapixels:>5.0f}{name:>7}{exact_ms:>10.1f}{coarse_ms:>11.1f}"
+                      f"{f'{exact_ms / coarse_ms:.1f}x':>9}{exact_visits:>14}{coarse_visits:>15}"
+                      f"{map_ms:>8.0f}{'yes' if identical else 'NO':>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Benchmark page rasterization: PPM round trip vs zero-copy pixmap arrays.
+
+Usage:
+    python -m benchmarks.bench_render [--pages N] [--size A1]
+
+Each variant runs in a fresh interpreter so its peak memory is measured in
+isolation.
+"""
+import argparse
+import io
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from benchmarks.synthetic import make_street_plan_pdf
+
+
+def render_ppm(pdf_document, page_num, zoom):
+    """The original load_pdf path: PPM encode, decode, convert"""
+    import fitz
+    from PIL import Image
+    pix = pdf_document[page_num].get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+    img = Image.open(io.BytesIO(pix.tobytes("ppm")))
+    return img.convert("RGB")
+
+
+def render_zero_copy(pdf_document, page_num, zoom):
+    """The current path: wrap pixmap samples as a NumPy array"""
+    from colorizer_engine import render_page
+    return render_page(pdf_document, page_num, zoom)
+
+
+VARIANTS = {
+    "ppm": render_ppm,
+    "zero-copy": render_zero_copy,
+}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, if measurable"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_variant(variant, pdf_path, zoom):
+    """Render every page with one variant and print a JSON result line"""
+    import fitz
+    import colorizer_engine  # noqa: F401  (import cost is not part of the measurement)
+    
+    render = VARIANTS[variant]
+    doc = fitz.open(pdf_path)
+    baseline_mb = peak_rss_mb()
+    timings = []
+    for page_num in range(doc.page_count):
+        start = time.perf_counter()
+        page = render(doc, page_num, zoom)
+        timings.append(time.perf_counter() - start)
+        # Keep only the most recent page, as the page cache would under pressure
+        del page
+    doc.close()
+    
+    peak_mb = peak_rss_mb()
+    print(json.dumps({
+        "variant": variant,
+        "pages": len(timings),
+        "mean_ms": 1000 * sum(timings) / len(timings),
+        "min_ms": 1000 * min(timings),
+        "peak_delta_mb": None if peak_mb is None else peak_mb - baseline_mb,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--size", default="A1")
+    parser.add_argument("--zoom", type=float, default=1.5)
+    parser.add_argument("--variant", choices=VARIANTS, help=argparse.SUPPRESS)
+    parser.add_argument("--pdf", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.variant:
+        run_variant(args.variant, args.pdf, args.zoom)
+        return
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = make_street_plan_pdf(Path(tmp) / "plan.pdf", pages=args.pages, size=args.size)
+        print(f"{args.pages} x {args.size} page(s) at zoom {args.zoom}")
+        print(f"{'variant':<12}{'mean ms/page':>14}{'min ms':>10}{'peak MB':>10}")
+        for variant in VARIANTS:
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_render", "--variant", variant,
+                 "--pdf", str(pdf_path), "--zoom", str(args.zoom)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            peak = "n/a" if result["peak_delta_mb"] is None else f"{result['peak_delta_mb']:.1f}"
+            print(f"{variant:<12}{result['mean_ms']:>14.1f}{result['min_ms']:>10.1f}{peak:>10}")
+
+
+if __name__ == "__main__":
+    main()
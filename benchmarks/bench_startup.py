@@ -0,0 +1,93 @@
+"""Benchmark cold start: time from launch until the main window is shown.
+
+Usage:
+    python -m benchmarks.bench_startup [--runs N] [--offscreen]
+
+"eager" imports OpenCV, PyMuPDF, NumPy and Pillow before the window is
+built, as the application used to; "lazy" is the current startup, which
+defers them until first use. Each run is a fresh interpreter, so the
+timings include interpreter start and every import.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+VARIANTS = ["eager", "lazy"]
+
+
+def run_variant(variant, launched):
+    """Build and show the window, then print a JSON result line.
+
+    launched is the time.time() the parent started this interpreter at;
+    perf_counter values are not comparable across processes.
+    """
+    if variant == "eager":
+        from colorizer_engine import preload_modules
+        preload_modules()
+    from PyQt6.QtWidgets import QApplication
+    from colorizer_engine import HEAVY_MODULES, preload_modules
+    from pdf_colorizer import PDFColorizer
+    imported = time.time()
+    
+    app = QApplication(sys.argv)
+    window = PDFColorizer()
+    window.show()
+    app.processEvents()
+    shown = time.time()
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+    
+    # What the first file open or fill would otherwise wait for
+    preload_modules()
+    ready = time.time()
+    window.close()
+    
+    print(json.dumps({
+        "variant": variant,
+        "import_ms": 1000 * (imported - launched),
+        "window_ms": 1000 * (shown - launched),
+        "ready_ms": 1000 * (ready - launched),
+        "heavy_loaded": loaded,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--offscreen", action="store_true",
+                        help="use Qt's offscreen platform (no display needed)")
+    parser.add_argument("--variant", choices=VARIANTS, help=argparse.SUPPRESS)
+    parser.add_argument("--launched", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.variant:
+        run_variant(args.variant, args.launched)
+        return
+    
+    env = dict(os.environ)
+    if args.offscreen:
+        env["QT_QPA_PLATFORM"] = "offscreen"
+    
+    print(f"median of {args.runs} cold start(s)")
+    print(f"{'variant':<10}{'import ms':>11}{'window ms':>11}{'ready ms':>10}  loaded at window")
+    for variant in VARIANTS:
+        results = []
+        for _ in range(args.runs):
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_startup", "--variant", variant,
+                 "--launched", repr(time.time())],
+                check=True, capture_output=True, text=True, env=env,
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+        
+        import_ms, window_ms, ready_ms = (statistics.median(result[key] for result in results)
+                                          for key in ("import_ms", "window_ms", "ready_ms"))
+        loaded = ", ".join(results[-1]["heavy_loaded"]) or "none"
+        print(f"{variant:<10}{import_ms:>11.0f}{window_ms:>11.0f}{ready_ms:>10.0f}  {loaded}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""Benchmark the application's hot paths and compare them with baselines.
+
+Usage:
+    python -m benchmarks.bench_suite [--scenarios small,medium,large] [--repeats N]
+        [--save-baseline] [--baseline FILE] [--threshold 30]
+
+Each scenario is a synthetic street plan of a given paper size and page
+count, driven through the real window (offscreen) in a fresh interpreter so
+its peak memory is measured in isolation, with any render cache in a
+temporary directory. The operations timed are:
+
+    load      PDFColorizer.load_pdf, which renders the first page
+    fill      smart_flood_fill, first fill on a page (edge map included)
+              until applied; fills, loads and saves run on the task thread
+    refill    smart_flood_fill on a page whose edge map is cached
+    region    smart_flood_fill with a region index already built
+    brush     a brush stroke through the mouse handlers, per segment
+    display   update_display plus a synchronous repaint of the viewport
+    save      save_pdf keeping vectors, with every page edited
+    flatten   save_pdf as a flattened image PDF
+
+Results are compared with the stored baselines; an operation whose best
+latency or peak memory grew by more than the threshold is reported as a
+regression and the exit status is 1. --save-baseline stores this run
+instead. Baselines are machine specific, so refresh them when the
+benchmark machine changes.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.bench_render import peak_rss_mb
+from benchmarks.synthetic import PAGE_SIZES, make_street_plan_pdf
+
+# name: (paper size, pages)
+SCENARIOS = {
+    "small": ("A3", 1),
+    "medium": ("A1", 3),
+    "large": ("A0", 5),
+}
+
+DEFAULT_BASELINE = Path(__file__).with_name("baselines.json")
+
+# Brush segments per timed stroke
+BRUSH_SEGMENTS = 50
+
+# Viewport the display benchmark repaints
+WINDOW_SIZE = (1400, 900)
+
+
+class _Event:
+    """Minimal mouse event for driving the window's handlers"""
+    
+    def __init__(self, x, y):
+        from PyQt6.QtCore import QPointF
+        self._pos = QPointF(x, y)
+    
+    def position(self):
+        return self._pos
+
+
+def block_seeds(size, zoom, count):
+    """Render pixel seeds inside the first city blocks of a synthetic plan.
+    
+    Each seed lies just inside a block's top-left corner, clear of its
+    buildings, so a fill covers the block around them.
+    """
+    width, height = PAGE_SIZES[size]
+    block = max(width, height) / 12
+    street = block / 6
+    seeds = []
+    y = street
+    while y + block < height and len(seeds) < count:
+        x = street
+        while x + block < width and len(seeds) < count:
+            seeds.append((round((x + 0.025 * block) * zoom), round((y + 0.025 * block) * zoom)))
+            x += block + street
+        y += block + street
+    return seeds
+
+
+def timed(samples, function, *args):
+    """Call function, appending its latency in seconds to samples"""
+    start = time.perf_counter()
+    result = function(*args)
+    samples.append(time.perf_counter() - start)
+    return result
+
+
+def run_scenario(scenario, pdf_path, repeats, output_dir):
+    """Time every operation on one document and print a JSON result line"""
+    from PyQt6.QtWidgets import QApplication, QFileDialog, QMessageBox
+    from colorizer_engine import RENDER_ZOOM, preload_modules
+    from pdf_colorizer import PDFColorizer
+    
+    # Import cost is measured by bench_startup, not here
+    preload_modules()
+    size, pages = SCENARIOS[scenario]
+    app = QApplication([])
+    window = PDFColorizer()
+    window.resize(*WINDOW_SIZE)
+    window.show()
+    # Background prefetch would compete with the timed operations
+    window.prefetch_spinbox.setValue(0)
+    window.tool_combo.setCurrentText("Flood Fill (Smart)")
+    window.tolerance_spinbox.setValue(30)
+    
+    # Saving goes through the real save_pdf with the dialogs answered
+    save_target = {}
+    QFileDialog.getSaveFileName = staticmethod(lambda *args, **kwargs: save_target["answer"])
+    QMessageBox.information = staticmethod(lambda *args, **kwargs: None)
+    QMessageBox.critical = staticmethod(lambda *args, **kwargs: print(args[2], file=sys.stderr))
+    
+    results = {}
+    
+    def finished(function):
+        """function, returning once the background task it queues is applied"""
+        def run(*args):
+            function(*args)
+            window.tasks.wait()
+        return run
+    
+    def measure(name, unit, per_call, function):
+        """Run function repeats times, recording latency and peak growth"""
+        before = peak_rss_mb()
+        samples = []
+        for repeat in range(repeats):
+            function(samples, repeat)
+            app.processEvents()
+        after = peak_rss_mb()
+        median = statistics.median(samples)
+        results[name] = {
+            "median_ms": round(1000 * median, 2),
+            "min_ms": round(1000 * min(samples), 2),
+            "max_ms": round(1000 * max(samples), 2),
+            "per_second": round(per_call / median, 2) if median else None,
+            "unit": unit,
+            "peak_delta_mb": None if before is None else round(after - before, 1),
+        }
+    
+    window.pdf_path = str(pdf_path)
+    measure("load", "pages/s", 1, lambda samples, _: timed(samples, finished(window.load_pdf)))
+    
+    seeds = block_seeds(size, RENDER_ZOOM, repeats + 1)
+    
+    def fill(samples, repeat):
+        # A fresh page each time so the edge map is computed again
+        window.engine.open_page(repeat % pages)
+        window.engine.edge_cache.clear()
+        timed(samples, finished(window.smart_flood_fill), *seeds[0])
+    
+    window.fill_mode_combo.setCurrentText("Exact Flood")
+    measure("fill", "fills/s", 1, fill)
+    window.engine.open_page(0)
+    measure("refill", "fills/s", 1,
+            lambda samples, repeat: timed(samples, finished(window.smart_flood_fill),
+                                          *seeds[repeat + 1]))
+    
+    window.fill_mode_combo.setCurrentText("Region Index")
+    window.engine.region_index(window.edge_strength_threshold)
+    measure("region", "fills/s", 1,
+            lambda samples, repeat: timed(samples, finished(window.smart_flood_fill),
+                                          *seeds[repeat + 1]))
+    
+    def brush(samples, repeat):
+        window.tool_combo.setCurrentText("Brush Stroke")
+        x, y = seeds[repeat]
+        start = time.perf_counter()
+        window.on_image_click(_Event(x, y))
+        for step in range(1, BRUSH_SEGMENTS + 1):
+            window.on_mouse_move(_Event(x + 4 * step, y + 2 * (step % 2)))
+        window.on_mouse_release(_Event(x + 4 * BRUSH_SEGMENTS, y))
+        samples.append((time.perf_counter() - start) / BRUSH_SEGMENTS)
+    
+    measure("brush", "segments/s", 1, brush)
+    
+    def display(samples, _):
+        start = time.perf_counter()
+        window.update_display()
+        window.page_view.repaint()
+        samples.append(time.perf_counter() - start)
+    
+    measure("display", "frames/s", 1, display)
+    
+    # Every page carries an edit, as after a session of coloring
+    window.fill_mode_combo.setCurrentText("Exact Flood")
+    window.tool_combo.setCurrentText("Flood Fill (Smart)")
+    for page_num in range(1, pages):
+        window.engine.open_page(page_num)
+        finished(window.smart_flood_fill)(*seeds[0])
+    window.engine.open_page(0)
+    
+    def save(answer_filter):
+        def run(samples, repeat):
+            path = Path(output_dir) / f"{scenario}-{answer_filter[:12]}-{repeat}.pdf"
+            save_target["answer"] = (str(path), answer_filter)
+            timed(samples, finished(window.save_pdf))
+            path.unlink()
+        return run
+    
+    measure("save", "pages/s", pages, save("PDF - keep vectors (*.pdf)"))
+    measure("flatten", "pages/s", pages, save("PDF - flattened image (*.pdf)"))
+    
+    window.close_pdf()
+    window.close()
+    print(json.dumps({"scenario": scenario, "size": size, "pages": pages,
+                      "peak_mb": peak_rss_mb() and round(peak_rss_mb(), 1),
+                      "operations": results}))
+
+
+def compare(results, baseline, threshold, floor_ms):
+    """Print a regression report and return the number of regressions.
+
+    Latency is compared on the fastest repeat, which is far less noisy
+    than the median on a shared machine; changes under floor_ms are noise.
+    """
+    regressions = 0
+    print(f"{'scenario':<9}{'operation':<10}{'median ms':>11}{'best ms':>9}{'baseline':>10}"
+          f"{'change':>9}{'rate':>20}{'peak +MB':>10}  status")
+    for scenario, result in results.items():
+        base = baseline.get(scenario, {}).get("operations", {})
+        for name, stats in result["operations"].items():
+            reference = base.get(name)
+            status = "new"
+            change = ""
+            if reference is not None:
+                ratio = stats["min_ms"] / reference["min_ms"] - 1
+                change = f"{100 * ratio:+.0f}%"
+                status = "ok"
+                if abs(stats["min_ms"] - reference["min_ms"]) >= floor_ms:
+                    if ratio > threshold:
+                        status = "REGRESSION"
+                    elif ratio < -threshold:
+                        status = "faster"
+                # Growth in peak memory counts too, ignoring noise below 32 MB
+                peak, base_peak = stats["peak_delta_mb"], reference.get("peak_delta_mb")
+                if (peak is not None and base_peak is not None and peak - base_peak > 32
+                        and peak > base_peak * (1 + threshold)):
+                    status = "REGRESSION (memory)"
+                regressions += status.startswith("REGRESSION")
+            baseline_ms = "" if reference is None else f"{reference['min_ms']:.1f}"
+            rate = "" if stats["per_second"] is None else f"{stats['per_second']:.1f} {stats['unit']}"
+            peak = "n/a" if stats["peak_delta_mb"] is None else f"{stats['peak_delta_mb']:.0f}"
+            print(f"{scenario:<9}{name:<10}{stats['median_ms']:>11.1f}{stats['min_ms']:>9.1f}"
+                  f"{baseline_ms:>10}{change:>9}{rate:>20}{peak:>10}  {status}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="comma-separated scenarios to run")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store this run as the baseline instead of comparing")
+    parser.add_argument("--threshold", type=float, default=30,
+                        help="percent slowdown reported as a regression")
+    parser.add_argument("--floor-ms", type=float, default=2,
+                        help="smallest absolute change in ms that can be a regression")
+    parser.add_argument("--scenario", choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--pdf", help=argparse.SUPPRESS)
+    parser.add_argument("--output-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.scenario:
+        run_scenario(args.scenario, args.pdf, args.repeats, args.output_dir)
+        return 0
+    
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+    
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        # A render cache, if one is turned on, stays out of the user's own
+        env = dict(os.environ, QT_QPA_PLATFORM="offscreen",
+                   PDF_COLORIZER_CACHE=str(Path(tmp) / "render-cache"))
+        for scenario in scenarios:
+            size, pages = SCENARIOS[scenario]
+            pdf_path = make_street_plan_pdf(Path(tmp) / f"{scenario}.pdf", pages=pages, size=size)
+            print(f"{scenario}: {pages} x {size} page(s), {args.repeats} repeat(s)", flush=True)
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_suite", "--scenario", scenario,
+                 "--pdf", str(pdf_path), "--repeats", str(args.repeats), "--output-dir", tmp],
+                check=True, capture_output=True, text=True, env=env,
+            ).stdout
+            results[scenario] = json.loads(output.strip().splitlines()[-1])
+    
+    if args.save_baseline:
+        baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+        baseline.update(results)
+        args.baseline.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"baseline for {', '.join(results)} saved to {args.baseline}")
+        return 0
+    
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    regressions = compare(results, baseline, args.threshold / 100, args.floor_ms)
+    print(f"{regressions} regression(s) above {args.threshold:.0f}%")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
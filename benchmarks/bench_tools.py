@@ -0,0 +1,184 @@
+"""Benchmark the coloring tools: PIL page image vs one NumPy buffer edited in place.
+
+Usage:
+    python -m benchmarks.bench_tools [--size A1] [--repeats N]
+
+"pil" is the original tool path, which kept the working page as a PIL
+image, converted it to NumPy and BGR and back around every fill, and
+copied it again for every display update. "array" is the current engine,
+where every tool edits one contiguous RGB array in place and the view
+reads that array directly.
+
+For each operation the best latency and the page-sized copies it made are
+reported. Copies are the peak memory tracemalloc saw during the operation
+divided by the page size. Pillow's own buffers are invisible to
+tracemalloc, so the "pil" copies are a lower bound.
+"""
+import argparse
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from benchmarks.bench_suite import block_seeds
+from benchmarks.synthetic import make_street_plan_pdf
+
+RED = (255, 0, 0)
+BLUE = (0, 0, 255)
+
+OPERATIONS = ["fill", "region", "brush", "text", "display"]
+
+
+class PilPage:
+    """The original tools, editing a PIL image of the page"""
+    
+    def __init__(self, engine):
+        from PIL import Image
+        self.engine = engine
+        self.image = Image.fromarray(engine.original_image)
+    
+    def read_patch(self, rect):
+        import numpy as np
+        return np.array(self.image.crop(rect))
+    
+    def fill(self, x, y, color):
+        import cv2
+        import numpy as np
+        from PIL import Image
+        engine = self.engine
+        barrier_mask = engine.edge_cache.barrier_mask(engine.current_page, engine.original_image, 50)
+        colored_bgr = cv2.cvtColor(np.array(self.image), cv2.COLOR_RGBA2BGR)
+        mask = barrier_mask.copy()
+        red, green, blue = color
+        _, _, _, (rx, ry, rw, rh) = cv2.floodFill(colored_bgr, mask, (x, y), (blue, green, red),
+                                                  (30,) * 3, (30,) * 3)
+        self.read_patch((rx, ry, rx + rw, ry + rh))
+        self.image = Image.fromarray(cv2.cvtColor(colored_bgr, cv2.COLOR_BGR2RGBA), 'RGBA')
+    
+    def region(self, x, y, color):
+        import numpy as np
+        from PIL import Image
+        (x0, y0, x1, y1), mask = self.engine.region_index(50).region_at(x, y)
+        self.read_patch((x0, y0, x1, y1))
+        colored = np.array(self.image.convert('RGBA'))
+        colored[y0:y1, x0:x1][mask] = (*color, 255)
+        self.image = Image.fromarray(colored, 'RGBA')
+    
+    def brush(self, x, y, color):
+        from PIL import ImageDraw
+        self.read_patch((x - 3, y - 3, x + 24, y + 8))
+        ImageDraw.Draw(self.image, 'RGBA').line([(x, y), (x + 20, y + 4)], fill=(*color, 200),
+                                                width=5)
+    
+    def text(self, x, y, color):
+        from PIL import ImageDraw
+        from colorizer_engine import load_font
+        font = load_font(20)
+        draw = ImageDraw.Draw(self.image, 'RGBA')
+        self.read_patch(draw.textbbox((x, y), "Block", font=font))
+        draw.text((x, y), "Block", fill=(*color, 255), font=font)
+    
+    def display(self):
+        import numpy as np
+        return np.asarray(self.image)
+
+
+class ArrayPage:
+    """The current engine's tools"""
+    
+    def __init__(self, engine):
+        self.engine = engine
+    
+    def fill(self, x, y, color):
+        self.engine.flood_fill(x, y, color, tolerance=30, threshold=50, use_index=False)
+    
+    def region(self, x, y, color):
+        self.engine.flood_fill(x, y, color, threshold=50, use_index=True)
+    
+    def brush(self, x, y, color):
+        self.engine.brush_stroke([(x, y), (x + 20, y + 4)], color, 5)
+    
+    def text(self, x, y, color):
+        self.engine.add_text(x, y, "Block", color, 20)
+    
+    def display(self):
+        return self.engine.colored_image
+
+
+VARIANTS = {
+    "pil": PilPage,
+    "array": ArrayPage,
+}
+
+
+def measure(call, repeats, page_bytes):
+    """Best latency in ms and page copies of call(repeat), over repeats calls"""
+    timings = []
+    for repeat in range(repeats):
+        start = time.perf_counter()
+        call(repeat)
+        timings.append(time.perf_counter() - start)
+    
+    # Tracing slows allocation down, so copies are counted in a separate run
+    tracemalloc.start()
+    try:
+        call(repeats)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return 1000 * min(timings), peak / page_bytes
+
+
+def run_variant(variant, pdf_path, size, repeats):
+    """{operation: (best ms, page copies)} for one variant"""
+    from colorizer_engine import ColorizerEngine
+    engine = ColorizerEngine()
+    engine.load(str(pdf_path))
+    # Edge map and region index are shared by both paths and built up front
+    engine.region_index(50)
+    engine.edge_cache.barrier_mask(0, engine.original_image, 50)
+    page = VARIANTS[variant](engine)
+    page_bytes = engine.original_image.nbytes
+    x, y = block_seeds(size, engine.zoom, 1)[0]
+    
+    def colored(repeat):
+        return RED if repeat % 2 else BLUE
+    
+    calls = {
+        "fill": lambda repeat: page.fill(x, y, colored(repeat)),
+        "region": lambda repeat: page.region(x, y, colored(repeat)),
+        "brush": lambda repeat: page.brush(x, y, colored(repeat)),
+        "text": lambda repeat: page.text(x, y, colored(repeat)),
+        "display": lambda repeat: page.display(),
+    }
+    results = {name: measure(calls[name], repeats, page_bytes) for name in OPERATIONS}
+    engine.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", default="A1")
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+    
+    import colorizer_engine
+    colorizer_engine.preload_modules()
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = make_street_plan_pdf(Path(tmp) / "plan.pdf", pages=1, size=args.size)
+        results = {variant: run_variant(variant, pdf_path, args.size, args.repeats)
+                   for variant in VARIANTS}
+    
+    print(f"1 x {args.size} page, best of {args.repeats}; copies are page-sized buffers")
+    print(f"{'operation':<10}{'pil ms':>9}{'array ms':>10}{'speedup':>9}"
+          f"{'pil copies':>12}{'array copies':>14}")
+    for name in OPERATIONS:
+        (pil_ms, pil_copies), (array_ms, array_copies) = results["pil"][name], results["array"][name]
+        # Below the timer's resolution a ratio means nothing
+        speedup = f"{pil_ms / array_ms:.1f}x" if array_ms >= 0.01 else "-"
+        print(f"{name:<10}{pil_ms:>9.2f}{array_ms:>10.2f}{speedup:>9}"
+              f"{pil_copies:>12.2f}{array_copies:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
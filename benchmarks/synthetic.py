@@ -0,0 +1,60 @@
+"""Generate synthetic street-plan PDFs for benchmarking"""
+import random
+
+import fitz  # PyMuPDF
+
+# ISO paper sizes in PDF points (portrait)
+PAGE_SIZES = {
+    "A4": (595, 842),
+    "A3": (842, 1191),
+    "A2": (1191, 1684),
+    "A1": (1684, 2384),
+    "A0": (2384, 3370),
+}
+
+
+def draw_street_plan(page, seed=0):
+    """Draw a street grid with building outlines and labels onto a page"""
+    rng = random.Random(seed)
+    width, height = page.rect.width, page.rect.height
+    block = max(width, height) / 12
+    street = block / 6
+    shape = page.new_shape()
+    
+    # City blocks separated by streets, each holding a few buildings
+    y = street
+    while y + block < height:
+        x = street
+        while x + block < width:
+            shape.draw_rect(fitz.Rect(x, y, x + block, y + block))
+            for _ in range(rng.randint(1, 4)):
+                bx = x + rng.uniform(0.05, 0.55) * block
+                by = y + rng.uniform(0.05, 0.55) * block
+                bw = rng.uniform(0.15, 0.4) * block
+                bh = rng.uniform(0.15, 0.4) * block
+                shape.draw_rect(fitz.Rect(bx, by, bx + bw, by + bh))
+            x += block + street
+        y += block + street
+    shape.finish(color=(0, 0, 0), width=1.5)
+    
+    # Faint grid lines that fills are expected to cross
+    for gx in range(0, int(width), int(block / 2)):
+        shape.draw_line(fitz.Point(gx, 0), fitz.Point(gx, height))
+    shape.finish(color=(0.85, 0.85, 0.85), width=0.3)
+    shape.commit()
+    
+    for _ in range(int(width * height / 40000)):
+        point = fitz.Point(rng.uniform(0, width - 60), rng.uniform(10, height))
+        page.insert_text(point, f"Street {rng.randint(1, 99)}", fontsize=7)
+
+
+def make_street_plan_pdf(path, pages=1, size="A1", seed=0):
+    """Write a synthetic street-plan PDF and return its path"""
+    width, height = PAGE_SIZES[size]
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page(width=width, height=height)
+        draw_street_plan(page, seed=seed + page_num)
+    doc.save(str(path), deflate=True)
+    doc.close()
+    return path
@@ -0,0 +1,278 @@
+"""Batch colorizer: apply the same fills to many PDFs without the GUI.
+
+Usage:
+    pdf-colorizer-batch SPEC.json PLAN.pdf [PLAN.pdf ...] [-o OUTPUT_DIR]
+        [--format vector|raster] [--compression Flate] [--quality 85] [--workers N]
+
+The fill specification is JSON:
+
+    {
+      "tolerance": 30,
+      "threshold": 50,
+      "mode": "flood",
+      "fills": [
+        {"pages": "*", "seed": [100, 80], "color": "#ff0000"},
+        {"pages": [1, 3], "seed": [300, 80], "color": [0, 0, 255], "threshold": 80}
+      ]
+    }
+
+Seeds are in PDF points from the top-left corner of the page as displayed
+and pages are numbered from 1. Settings on a fill override the top-level
+ones. "flood" mode floods from the seed within the tolerance; "region"
+mode fills the whole area enclosed by edges stronger than the threshold.
+
+Pages of every file share one process pool with a bounded number of pages
+in flight, and each output is written as soon as its last page is done.
+Outputs are named after their input, so an input whose output another
+input already writes is reported as failed instead of overwriting it.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import fitz  # PyMuPDF
+
+from colorizer_engine import (ColorizerEngine, RASTER_COMPRESSIONS,
+                              DEFAULT_JPEG_QUALITY, add_raster_page, encode_png,
+                              encode_raster_image, insert_overlay, preload_modules)
+
+# Budgets for each worker's engine; pages are never revisited, so only the
+# page being processed has to fit
+WORKER_PAGE_CACHE_MB = 64
+WORKER_UNDO_MB = 16
+
+# Fill settings used when neither the fill nor the spec gives one
+FILL_DEFAULTS = {"tolerance": 30, "threshold": 50, "mode": "flood"}
+
+OUTPUT_FORMATS = ["vector", "raster"]
+
+
+def parse_color(value):
+    """(r, g, b) from "#rrggbb" or a list of three 0-255 integers"""
+    if isinstance(value, str):
+        digits = value.lstrip("#")
+        if len(digits) != 6:
+            raise ValueError(f"invalid color {value!r}")
+        return tuple(int(digits[i:i + 2], 16) for i in (0, 2, 4))
+    if len(value) != 3 or not all(isinstance(c, int) and 0 <= c <= 255 for c in value):
+        raise ValueError(f"invalid color {value!r}")
+    return tuple(value)
+
+
+def load_spec(spec):
+    """Validate a fill specification and resolve each fill's settings.
+
+    Returns a list of fills, each a dict with pages ("*" or a set of page
+    numbers from 1), seed, color, tolerance, threshold and mode.
+    """
+    defaults = {key: spec.get(key, value) for key, value in FILL_DEFAULTS.items()}
+    fills = []
+    for number, entry in enumerate(spec.get("fills", []), 1):
+        fill = {**defaults, **entry}
+        try:
+            pages = fill.get("pages", "*")
+            x, y = (float(v) for v in fill["seed"])
+            fills.append({
+                "pages": pages if pages == "*" else {int(p) for p in pages},
+                "seed": (x, y),
+                "color": parse_color(fill["color"]),
+                "tolerance": int(fill["tolerance"]),
+                "threshold": int(fill["threshold"]),
+                "mode": fill["mode"],
+            })
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"fill {number}: {e}") from e
+        if fills[-1]["mode"] not in ("flood", "region"):
+            raise ValueError(f"fill {number}: unknown mode {fill['mode']!r}")
+    return fills
+
+
+def fills_for_page(fills, page_num):
+    """The fills that apply to a page (numbered from 0)"""
+    return [fill for fill in fills if fill["pages"] == "*" or page_num + 1 in fill["pages"]]
+
+
+def output_path(pdf_path, output_dir):
+    """Where the colored copy of a PDF is written"""
+    return Path(output_dir) / f"{Path(pdf_path).stem}_colored.pdf"
+
+
+# Engine kept by each worker process across the pages it is given
+_worker_engine = None
+
+
+def _process_page(pdf_path, page_num, fills, output_format, compression, quality):
+    """Worker task: apply the fills to one page and encode the result.
+
+    For vector output returns (rect, png) for the page's overlay, or None
+    when nothing changed; for raster output returns the encoded page.
+    """
+    if not fills and output_format == "vector":
+        return None
+    global _worker_engine
+    if _worker_engine is None:
+        _worker_engine = ColorizerEngine(WORKER_PAGE_CACHE_MB, WORKER_UNDO_MB)
+    engine = _worker_engine
+    if engine.pdf_path != pdf_path:
+        engine.load(pdf_path, page_num)
+    else:
+        engine.open_page(page_num)
+
+    # Seeds are in points, like the fills of a recorded operation log
+    for fill in fills:
+        engine.apply_operation({"tool": "fill", "seed": list(fill["seed"]),
+                                "color": list(fill["color"]), "tolerance": fill["tolerance"],
+                                "threshold": fill["threshold"], "mode": fill["mode"]})
+    engine.commit_page_edits()
+    layer = engine.edit_layers.pop(page_num, None)
+
+    # Pages are never revisited, so their edge maps and indexes can go
+    engine.edge_cache.clear()
+    engine.region_indexes.clear()
+
+    if output_format == "raster":
+        image = engine.original_image if layer is None else layer.composite(engine.original_image)
+        return encode_raster_image(image, compression, quality)
+    overlay = layer.overlay() if layer is not None else None
+    if overlay is None:
+        return None
+    rect, rgba = overlay
+    return rect, encode_png(rgba)
+
+
+def run_batch(pdf_paths, fills, output_dir, output_format="vector", compression="Flate",
+              quality=DEFAULT_JPEG_QUALITY, max_workers=None, report=print):
+    """Colorize every page of every PDF and write one output per input.
+
+    Returns a result dict per input with its path, output, pages, seconds
+    and error (None on success). report receives one line per file.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    os.makedirs(output_dir, exist_ok=True)
+
+    results = []
+    files = []
+    # Inputs sharing a name, or given twice, would overwrite each other's output
+    claimed = {}
+    for path in pdf_paths:
+        result = {"path": str(path), "output": str(output_path(path, output_dir)),
+                  "pages": 0, "seconds": 0.0, "error": None}
+        results.append(result)
+        other = claimed.setdefault(os.path.normcase(os.path.abspath(result["output"])), result)
+        if other is not result:
+            result["error"] = f"{other['path']} is also written to {result['output']}"
+            report(f"{path}: skipped: {result['error']}")
+            continue
+        try:
+            with fitz.open(str(path)) as doc:
+                result["pages"] = doc.page_count
+                page_rects = [page.rect for page in doc]
+        except Exception as e:
+            result["error"] = str(e)
+            report(f"{path}: failed to open: {e}")
+            continue
+        files.append((result, page_rects))
+
+    tasks = [(result, page_rects, page_num)
+             for result, page_rects in files for page_num in range(len(page_rects))]
+    started = {}
+    outputs = {}
+
+    preload_modules()
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             mp_context=multiprocessing.get_context("spawn")) as executor:
+        pending = deque()
+        next_task = 0
+        for result, page_rects, page_num in tasks:
+            # Keep a couple of pages per worker queued, never whole files
+            while next_task < len(tasks) and len(pending) < 2 * max_workers:
+                task_result, _, task_page = tasks[next_task]
+                started.setdefault(task_result["output"], time.perf_counter())
+                page_fills = fills_for_page(fills, task_page)
+                # A vector page without fills is copied as it is, so is not rendered
+                pending.append(executor.submit(
+                    _process_page, task_result["path"], task_page,
+                    page_fills, output_format, compression, quality)
+                    if page_fills or output_format == "raster" else None)
+                next_task += 1
+            future = pending.popleft()
+            if result["error"] is not None:
+                if future is not None:
+                    future.cancel()
+                continue
+
+            try:
+                page_result = future.result() if future is not None else None
+                if page_num == 0:
+                    outputs[result["output"]] = (fitz.open(result["path"])
+                                                 if output_format == "vector" else fitz.open())
+                doc = outputs[result["output"]]
+                if output_format == "raster":
+                    add_raster_page(doc, page_rects[page_num], *page_result)
+                elif page_result is not None:
+                    insert_overlay(doc[page_num], *page_result)
+
+                if page_num == len(page_rects) - 1:
+                    doc.save(result["output"], garbage=3, deflate=True)
+                    result["seconds"] = time.perf_counter() - started[result["output"]]
+                    report(format_result(result))
+            except Exception as e:
+                result["error"] = str(e)
+                report(f"{result['path']}: failed on page {page_num + 1}: {e}")
+
+            if result["error"] is not None or page_num == len(page_rects) - 1:
+                doc = outputs.pop(result["output"], None)
+                if doc is not None:
+                    doc.close()
+    return results
+
+
+def format_result(result):
+    """One report line for a finished file"""
+    seconds = result["seconds"]
+    rate = result["pages"] / seconds if seconds else float("inf")
+    size_mb = os.path.getsize(result["output"]) / (1024 * 1024)
+    return (f"{result['path']}: {result['pages']} pages in {seconds:.2f} s "
+            f"({rate:.1f} pages/s) -> {result['output']} ({size_mb:.1f} MB)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="pdf-colorizer-batch",
+                                     description=__doc__.splitlines()[0])
+    parser.add_argument("spec", help="JSON fill specification")
+    parser.add_argument("pdfs", nargs="+", help="PDF files to colorize")
+    parser.add_argument("-o", "--output-dir", default="colored")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="vector",
+                        help="vector keeps the pages and overlays the fills; "
+                             "raster flattens each page to an image")
+    parser.add_argument("--compression", choices=RASTER_COMPRESSIONS, default="Flate")
+    parser.add_argument("--quality", type=int, default=DEFAULT_JPEG_QUALITY)
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per core)")
+    args = parser.parse_args(argv)
+
+    try:
+        with open(args.spec, encoding="utf-8") as spec_file:
+            fills = load_spec(json.load(spec_file))
+    except (OSError, ValueError) as e:
+        parser.error(f"bad spec {args.spec}: {e}")
+
+    start = time.perf_counter()
+    results = run_batch(args.pdfs, fills, args.output_dir, args.format,
+                        args.compression, args.quality, args.workers)
+    elapsed = time.perf_counter() - start
+
+    done = [result for result in results if result["error"] is None]
+    pages = sum(result["pages"] for result in done)
+    print(f"{len(done)} of {len(results)} file(s), {pages} pages in {elapsed:.2f} s "
+          f"({pages / elapsed:.1f} pages/s)")
+    return 0 if len(done) == len(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1825 @@
+"""Headless PDF colorizing engine.
+
+Rendering, caching, the coloring tools, undo and saving, with no GUI
+dependency, so documents can be processed from batch jobs and benchmarks
+as well as from the Qt window in pdf_colorizer.
+"""
+import copy
+import hashlib
+import importlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+
+from colorizer_trace import tracer
+
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access.
+
+    OpenCV, PyMuPDF, NumPy and Pillow take most of the startup time and
+    nothing needs them until a document is opened.
+    """
+
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        module = self.__dict__.get("_module")
+        if module is None:
+            module = self._module = importlib.import_module(self._name)
+        return getattr(module, attr)
+
+
+cv2 = LazyModule("cv2")
+np = LazyModule("numpy")
+Image = LazyModule("PIL.Image")
+ImageDraw = LazyModule("PIL.ImageDraw")
+ImageFont = LazyModule("PIL.ImageFont")
+fitz = LazyModule("fitz")  # PyMuPDF
+
+# Modules deferred above, in the order preload_modules imports them
+HEAVY_MODULES = ["numpy", "cv2", "PIL.Image", "PIL.ImageDraw", "PIL.ImageFont", "fitz"]
+
+# Resolution pages are rasterized at for editing (1.0 = 72 DPI)
+RENDER_ZOOM = 1.5
+
+# Default memory budget for rendered pages held in the page cache
+DEFAULT_PAGE_CACHE_MB = 512
+
+# Pixels per band of a page the edge magnitude is computed in, and the
+# fewest rows a band may have
+EDGE_BAND_PIXELS = 1 << 21
+EDGE_BAND_MIN_ROWS = 64
+
+# Memory budget for per-page edge maps and the barrier masks derived from them
+EDGE_CACHE_MB = 256
+
+# Default disk budget for the render cache shared across sessions
+DEFAULT_RENDER_CACHE_MB = 2048
+
+# Environment variable overriding where the render cache is kept
+CACHE_DIR_ENV = "PDF_COLORIZER_CACHE"
+
+# Bumped when the render cache's file layout changes, orphaning old entries
+RENDER_CACHE_VERSION = 1
+
+# Writes queued for the render cache's writer thread before new ones are dropped
+RENDER_CACHE_PENDING_WRITES = 4
+
+# Bytes read from each end of a PDF for its render cache key
+DOCUMENT_KEY_SAMPLE_BYTES = 1024 * 1024
+
+# Memory budget for per-page region label indexes
+REGION_INDEX_CACHE_MB = 256
+
+# Fill modes offered by the smart flood fill
+FILL_MODES = ["Region Index", "Exact Flood", "Coarse-to-Fine"]
+
+# Edge length in pixels of the blocks the coarse-to-fine fill floods first
+FILL_BLOCK_SIZE = 32
+
+# Default memory budget for undo and redo history
+DEFAULT_UNDO_BUDGET_MB = 256
+
+# Edge length in pixels of the tiles edit layers are stored in
+EDIT_TILE_SIZE = 256
+
+# Page image compressions offered by the flattened raster export
+RASTER_COMPRESSIONS = ["Flate", "JPEG", "Palette"]
+
+# Default JPEG quality for raster export
+DEFAULT_JPEG_QUALITY = 85
+
+# Identifies project files holding a document's operation log
+PROJECT_FORMAT = "pdf-colorizer-project"
+PROJECT_VERSION = 1
+
+
+class OperationCancelled(Exception):
+    """Raised by a progress callback to stop a long operation"""
+
+
+def preload_modules():
+    """Import the deferred modules now, e.g. from a background thread.
+
+    Call it before starting a spawn process pool: cv2 changes sys.path
+    while it is imported, and workers started meanwhile inherit that path.
+    It waits for an import another thread has begun.
+    """
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
+
+
+class UndoHistory:
+    """Undo/redo history that stores only the pixels each action changed.
+
+    An action is a group of (rect, patch) pairs holding the pixels under
+    rect before each step, so a whole brush stroke undoes as one action.
+    The history does not touch the image itself: callers pass read(rect)
+    and write(rect, patch) functions. The oldest actions are dropped once
+    the stored patches exceed the byte budget.
+    """
+
+    def __init__(self, max_mb=DEFAULT_UNDO_BUDGET_MB):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.nbytes = 0
+        self._undo = []
+        self._redo = []
+        self._group = None
+
+    @property
+    def can_undo(self):
+        return bool(self._undo)
+
+    @property
+    def can_redo(self):
+        return bool(self._redo)
+
+    def begin(self):
+        """Start collecting the steps of one action"""
+        self._group = []
+
+    def record(self, rect, patch):
+        """Store the pixels under rect before a step of the current action"""
+        if self._group is None:
+            self.begin()
+        self._group.append((rect, patch))
+
+    def end(self):
+        """Finish the current action and make it undoable"""
+        group, self._group = self._group, None
+        if not group:
+            return
+        self._clear_redo()
+        self._undo.append(group)
+        self.nbytes += self._group_bytes(group)
+        self._evict()
+
+    def abort(self, write):
+        """Discard the current action, restoring the pixels it changed"""
+        group, self._group = self._group, None
+        for rect, patch in reversed(group or []):
+            write(rect, patch)
+
+    def undo(self, read, write):
+        """Revert the last action; returns the rectangle it covered or None"""
+        return self._replay(self._undo, self._redo, read, write, reverse=True)
+
+    def redo(self, read, write):
+        """Reapply the last undone action; returns its rectangle or None"""
+        return self._replay(self._redo, self._undo, read, write, reverse=False)
+
+    def set_budget(self, max_mb):
+        """Change the byte budget, dropping old actions if it shrank"""
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._evict()
+
+    def revert(self, read, write):
+        """Undo the last action for good, leaving nothing to redo"""
+        rect = self.undo(read, write)
+        if rect is not None:
+            self._clear_redo()
+        return rect
+
+    def clear(self):
+        """Forget all history"""
+        self._undo = []
+        self._redo = []
+        self._group = None
+        self.nbytes = 0
+
+    def _replay(self, source, target, read, write, reverse):
+        """Move an action between stacks, swapping its patches with the image"""
+        if not source:
+            return None
+        group = source.pop()
+        steps = reversed(group) if reverse else iter(group)
+        swapped = []
+        for rect, patch in steps:
+            swapped.append((rect, read(rect)))
+            write(rect, patch)
+        if reverse:
+            swapped.reverse()
+        target.append(swapped)
+        return bounding_rect(rect for rect, _ in group)
+
+    def _clear_redo(self):
+        """Drop redo history once a new action is made"""
+        self.nbytes -= sum(self._group_bytes(group) for group in self._redo)
+        self._redo = []
+
+    def _evict(self):
+        """Drop the oldest actions until within budget, keeping the newest"""
+        while self.nbytes > self.max_bytes and len(self._undo) > 1:
+            self.nbytes -= self._group_bytes(self._undo.pop(0))
+
+    @staticmethod
+    def _group_bytes(group):
+        return sum(patch.nbytes for _, patch in group)
+
+
+class EditLayer:
+    """Sparse RGBA layer holding a page's edits over its base render.
+
+    The page is divided into fixed-size tiles and only tiles containing
+    edited pixels are allocated. Edited pixels are stored with their final
+    color and alpha 255; everything else is transparent.
+    """
+
+    def __init__(self, width, height, tile_size=EDIT_TILE_SIZE, backing=None):
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.tiles = {}
+        # Optional (height, width, 4) array, such as a memmap, tiles are kept in
+        self.backing = backing
+
+    def __getstate__(self):
+        # Pickled for export workers without the backing file's other pixels
+        state = dict(self.__dict__, backing=None)
+        state["tiles"] = {key: np.array(tile) for key, tile in self.tiles.items()}
+        return state
+
+    @property
+    def nbytes(self):
+        return sum(tile.nbytes for tile in self.tiles.values())
+
+    def is_empty(self):
+        return not self.tiles
+
+    def tile_rect(self, tx, ty):
+        """Page rectangle (x0, y0, x1, y1) covered by a tile"""
+        size = self.tile_size
+        return (tx * size, ty * size,
+                min((tx + 1) * size, self.width), min((ty + 1) * size, self.height))
+
+    def capture(self, rect, base, read):
+        """Update the tiles under rect from the edited page.
+
+        base is the page's unedited RGB render and read(rect) returns the
+        edited page's pixels under a rectangle.
+        """
+        size = self.tile_size
+        x0, y0, x1, y1 = rect
+        tx0, ty0 = max(0, x0) // size, max(0, y0) // size
+        tx1, ty1 = (min(x1, self.width) - 1) // size, (min(y1, self.height) - 1) // size
+        if tx1 < tx0 or ty1 < ty0:
+            return
+        
+        span = (tx0 * size, ty0 * size, min((tx1 + 1) * size, self.width),
+                min((ty1 + 1) * size, self.height))
+        edited = read(span)[..., :3]
+        for ty in range(ty0, ty1 + 1):
+            for tx in range(tx0, tx1 + 1):
+                left, top, right, bottom = self.tile_rect(tx, ty)
+                pixels = edited[top - span[1]:bottom - span[1], left - span[0]:right - span[0]]
+                changed = np.any(pixels != base[top:bottom, left:right], axis=2)
+                if changed.any():
+                    if self.backing is not None:
+                        tile = self.backing[top:bottom, left:right]
+                    else:
+                        tile = np.empty(pixels.shape[:2] + (4,), dtype=np.uint8)
+                    tile[..., :3] = pixels
+                    tile[..., 3] = changed * np.uint8(255)
+                    self.tiles[(tx, ty)] = tile
+                else:
+                    self.tiles.pop((tx, ty), None)
+
+    def composite(self, base):
+        """Return a copy of the base RGB render with the edits applied"""
+        result = base.copy()
+        for (tx, ty), tile in self.tiles.items():
+            left, top, right, bottom = self.tile_rect(tx, ty)
+            target = result[top:bottom, left:right]
+            changed = tile[..., 3] > 0
+            target[changed] = tile[..., :3][changed]
+        return result
+
+    def overlay(self):
+        """Return (rect, rgba) covering every edited pixel, or None.
+
+        rect is the bounding box of the edits and rgba is a transparent
+        image of that size holding only the edited pixels.
+        """
+        if not self.tiles:
+            return None
+        rect = bounding_rect(self.tile_rect(tx, ty) for tx, ty in self.tiles)
+        x0, y0, x1, y1 = rect
+        rgba = np.zeros((y1 - y0, x1 - x0, 4), dtype=np.uint8)
+        for (tx, ty), tile in self.tiles.items():
+            left, top, right, bottom = self.tile_rect(tx, ty)
+            rgba[top - y0:bottom - y0, left - x0:right - x0] = tile
+        
+        # Trim to the edited pixels themselves
+        rows = np.flatnonzero(rgba[..., 3].any(axis=1))
+        cols = np.flatnonzero(rgba[..., 3].any(axis=0))
+        top, bottom = int(rows[0]), int(rows[-1]) + 1
+        left, right = int(cols[0]), int(cols[-1]) + 1
+        return (x0 + left, y0 + top, x0 + right, y0 + bottom), rgba[top:bottom, left:right]
+
+
+def encode_png(rgba):
+    """Encode an RGBA image as PNG bytes"""
+    return cv2.imencode('.png', cv2.cvtColor(rgba, cv2.COLOR_RGBA2BGRA))[1].tobytes()
+
+
+def insert_overlay(page, rect, image, zoom=RENDER_ZOOM):
+    """Draw an RGBA image over a PDF page at a rectangle of its render.
+
+    rect is in pixels of a render at the given zoom, so the image lands on
+    exactly the pixels it was taken from whatever the page's rotation.
+    image is an RGBA array or the PNG bytes from encode_png.
+    """
+    x0, y0, x1, y1 = (int(v) for v in rect)
+    png = image if isinstance(image, bytes) else encode_png(image)
+    target = fitz.Rect(x0, y0, x1, y1) / zoom * page.derotation_matrix
+    return page.insert_image(target, stream=png, overlay=True, rotate=page.rotation)
+
+
+def bounding_rect(rects):
+    """Smallest (x0, y0, x1, y1) rectangle containing all the given ones"""
+    rects = list(rects)
+    return (min(r[0] for r in rects), min(r[1] for r in rects),
+            max(r[2] for r in rects), max(r[3] for r in rects))
+
+
+def _edge_band(image, magnitude, top, bottom):
+    """Write the edge magnitude of rows top:bottom of image into magnitude.
+
+    The band is read with one row of overlap on each side, which is all a
+    3x3 Sobel looks at, so band edges match the whole-page result; at the
+    page's own edges the borders are reflected as they would be anyway.
+    """
+    halo_top, halo_bottom = max(0, top - 1), min(image.shape[0], bottom + 1)
+    gray = cv2.cvtColor(image[halo_top:halo_bottom], cv2.COLOR_RGB2GRAY)
+    # Gradients of uint8 pixels lie within +-1020, so int16 holds them exactly
+    sobelx = cv2.Sobel(gray, cv2.CV_16S, 1, 0, ksize=3)
+    sobely = cv2.Sobel(gray, cv2.CV_16S, 0, 1, ksize=3)
+    # Squared lengths stay below 2**24, exact in float32, and a correctly
+    # rounded float32 square root never crosses an integer below 255, so
+    # truncating gives the same bytes as float64. cv2.magnitude's square
+    # root is approximate and does cross them.
+    rows = slice(top - halo_top, bottom - halo_top)
+    sobelx = sobelx[rows].astype(np.float32)
+    sobely = sobely[rows].astype(np.float32)
+    length = np.square(sobelx, out=sobelx)
+    length += np.square(sobely, out=sobely)
+    np.sqrt(length, out=length)
+    np.minimum(length, 255, out=length)
+    # Assigning float to uint8 truncates, as astype does
+    magnitude[top:bottom] = length
+
+
+def compute_edge_magnitude(image, max_workers=None):
+    """Sobel edge magnitude of an RGB page, saturated to uint8.
+
+    Large pages are split into horizontal bands computed on a thread pool;
+    OpenCV releases the GIL, so the bands run in parallel.
+    """
+    with tracer.span("edges") as span:
+        height, width = image.shape[:2]
+        magnitude = np.empty((height, width), dtype=np.uint8)
+        band_rows = max(EDGE_BAND_MIN_ROWS, EDGE_BAND_PIXELS // max(width, 1))
+        bands = [(top, min(top + band_rows, height)) for top in range(0, height, band_rows)]
+        max_workers = min(max_workers or os.cpu_count() or 1, len(bands))
+        span.set(bands=len(bands), workers=max_workers)
+        if max_workers <= 1:
+            for top, bottom in bands:
+                _edge_band(image, magnitude, top, bottom)
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for future in [executor.submit(_edge_band, image, magnitude, top, bottom)
+                               for top, bottom in bands]:
+                    future.result()
+        if tracer.enabled:
+            # The range guides the choice of edge strength threshold
+            span.set(min=int(magnitude.min()), max=int(magnitude.max()))
+        return magnitude
+
+
+class EdgeMapCache:
+    """Per-page edge magnitudes and barrier masks for the smart flood fill.
+
+    Edge magnitude is computed once per page from its original render, so
+    earlier fills never turn into barriers. Barrier masks are memoized per
+    edge strength threshold in the padded layout cv2.floodFill expects.
+    """
+
+    def __init__(self, max_mb=EDGE_CACHE_MB):
+        self.edges = PageCache(max_mb / 2)
+        self.barriers = PageCache(max_mb / 2)
+        # Optional DocumentCache edge maps are also kept in across sessions
+        self.disk = None
+
+    def edge_magnitude(self, page_num, image):
+        """Return the page's uint8 edge magnitude, computing it if needed"""
+        magnitude = self.stored_magnitude(page_num)
+        if magnitude is None:
+            magnitude = compute_edge_magnitude(image)
+            self.store(page_num, magnitude)
+        return magnitude
+
+    def stored_magnitude(self, page_num):
+        """Return the page's edge magnitude if already computed, or None"""
+        magnitude = self.edges.get(page_num)
+        if magnitude is None and self.disk is not None:
+            magnitude = self.disk.load(page_num, "edges")
+            if magnitude is not None:
+                self.edges.put(page_num, magnitude)
+        return magnitude
+
+    def store(self, page_num, magnitude):
+        """Keep an edge magnitude computed elsewhere, e.g. for a region index"""
+        if page_num in self.edges:
+            return
+        self.edges.put(page_num, magnitude)
+        if self.disk is not None:
+            self.disk.save(page_num, "edges", magnitude)
+
+    def barrier_mask(self, page_num, image, threshold):
+        """Return a (height + 2, width + 2) mask that is 1 on barrier pixels"""
+        key = (page_num, threshold)
+        mask = self.barriers.get(key)
+        if mask is None:
+            magnitude = self.edge_magnitude(page_num, image)
+            mask = np.zeros((magnitude.shape[0] + 2, magnitude.shape[1] + 2), dtype=np.uint8)
+            np.greater(magnitude, threshold, out=mask[1:-1, 1:-1].view(bool))
+            self.barriers.put(key, mask)
+        return mask
+
+    def open_blocks(self, page_num, threshold, barrier_mask, block_size=FILL_BLOCK_SIZE):
+        """Return a (rows, cols) grid, True where a whole block has no barrier pixel.
+
+        barrier_mask is the page's mask from barrier_mask() at threshold.
+        """
+        key = (page_num, threshold, block_size)
+        blocks = self.barriers.get(key)
+        if blocks is None:
+            blocks = block_extremes(barrier_mask[1:-1, 1:-1], block_size)[1] == 0
+            self.barriers.put(key, blocks)
+        return blocks
+
+    def clear(self):
+        """Drop every cached map"""
+        self.edges.clear()
+        self.barriers.clear()
+
+
+def block_extremes(image, block_size):
+    """Per-block minimum and maximum of an image.
+
+    Returns two arrays of shape (rows, cols) plus the image's channels,
+    one entry per whole block; partial blocks at the edges are left out.
+    """
+    rows, cols = image.shape[0] // block_size, image.shape[1] // block_size
+    whole = image[:rows * block_size, :cols * block_size]
+    if whole.size == 0:
+        return whole[:rows, :cols], whole[:rows, :cols]
+    kernel = np.ones((block_size, block_size), dtype=np.uint8)
+    # Anchored at the corner, each block's window is the block itself
+    low = cv2.erode(whole, kernel, anchor=(0, 0))[::block_size, ::block_size]
+    high = cv2.dilate(whole, kernel, anchor=(0, 0))[::block_size, ::block_size]
+    return low, high
+
+
+def uniform_blocks(image, block_size=FILL_BLOCK_SIZE):
+    """(rows, cols) grid, True where a whole block of an RGB image is one color"""
+    # In bands of block rows, so the filtered copies stay small
+    step = block_size * max(1, EDGE_BAND_PIXELS // (block_size * max(image.shape[1], 1)))
+    grids = []
+    for top in range(0, image.shape[0], step):
+        low, high = block_extremes(image[top:top + step], block_size)
+        grids.append(np.all(low == high, axis=2))
+    if not grids:
+        return np.zeros((0, image.shape[1] // block_size), dtype=bool)
+    return np.concatenate(grids)
+
+
+def block_interiors(image, block_size):
+    """View of an image's whole blocks without their one-pixel borders.
+
+    Shaped (rows, cols, block_size - 2, block_size - 2) plus channels, so
+    indexing it with a (rows, cols) grid selects block interiors.
+    """
+    rows, cols = image.shape[0] // block_size, image.shape[1] // block_size
+    blocks = image[:rows * block_size, :cols * block_size].reshape(
+        rows, block_size, cols, block_size, *image.shape[2:])
+    return blocks[:, 1:-1, :, 1:-1].swapaxes(1, 2)
+
+
+class UniformBlocks:
+    """Which blocks of the page being edited are a single color.
+
+    Computed on first use, then kept current by marking the rectangles
+    edits change as stale; only stale blocks are checked again.
+    """
+
+    def __init__(self, block_size=FILL_BLOCK_SIZE):
+        self.block_size = block_size
+        self.blocks = None
+        self.stale = None
+
+    def reset(self):
+        """Forget the map, e.g. when another page is opened"""
+        self.blocks = None
+        self.stale = None
+
+    def mark_stale(self, rect):
+        """Note that pixels under an (x0, y0, x1, y1) rectangle changed"""
+        if self.blocks is None:
+            return
+        size = self.block_size
+        x0, y0, x1, y1 = rect
+        self.stale[max(0, y0) // size:-(-y1 // size), max(0, x0) // size:-(-x1 // size)] = True
+
+    def mark_uniform(self, blocks):
+        """Note that the blocks set in a (rows, cols) grid are now one color each"""
+        if self.blocks is not None:
+            self.blocks[blocks] = True
+            self.stale[blocks] = False
+
+    def get(self, image):
+        """Return the up-to-date grid for image"""
+        size = self.block_size
+        if self.blocks is None:
+            self.blocks = uniform_blocks(image, size)
+            self.stale = np.zeros(self.blocks.shape, dtype=bool)
+        # One check per row of blocks, spanning its stale ones
+        for row in np.flatnonzero(self.stale.any(axis=1)):
+            cols = np.flatnonzero(self.stale[row])
+            left, right = cols[0], cols[-1] + 1
+            self.blocks[row, left:right] = uniform_blocks(
+                image[row * size:(row + 1) * size, left * size:right * size], size)[0]
+            self.stale[row] = False
+        return self.blocks
+
+
+class RegionIndex:
+    """Connected regions of a page's non-barrier pixels.
+
+    Label 0 marks barrier pixels; every other label is one region enclosed
+    by barrier lines, with its bounding box taken from the label stats.
+    """
+
+    def __init__(self, labels, stats):
+        self.labels = labels
+        self.stats = stats
+        self.labels.flags.writeable = False
+
+    @property
+    def nbytes(self):
+        return self.labels.nbytes + self.stats.nbytes
+
+    def region_at(self, x, y):
+        """Return (bounding box, mask within it) of the region under a pixel.
+
+        The bounding box is (x0, y0, x1, y1); None is returned for barrier
+        pixels and pixels off the page.
+        """
+        height, width = self.labels.shape
+        if not (0 <= x < width and 0 <= y < height):
+            return None
+        label = self.labels[y, x]
+        if label == 0:
+            return None
+        left, top, width, height = self.stats[label, :4]
+        rect = (int(left), int(top), int(left + width), int(top + height))
+        return rect, self.labels[rect[1]:rect[3], rect[0]:rect[2]] == label
+
+
+def build_region_index(image, threshold, magnitude=None):
+    """Label the regions enclosed by barrier lines on a page.
+
+    Reuses the page's edge magnitude if given; returns the magnitude along
+    with the RegionIndex so the caller can cache both.
+    """
+    with tracer.span("region_index", threshold=threshold) as span:
+        if magnitude is None:
+            magnitude = compute_edge_magnitude(image)
+        open_mask = np.less_equal(magnitude, threshold).view(np.uint8)
+        # 4-connectivity matches the neighbourhood cv2.floodFill walks
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(
+            open_mask, connectivity=4, ltype=cv2.CV_32S
+        )
+        # Label 0 is the barrier background
+        if count <= np.iinfo(np.uint16).max:
+            labels = labels.astype(np.uint16)
+        span.set(regions=count - 1)
+        return magnitude, RegionIndex(labels, stats)
+
+
+class _PixmapBuffer:
+    """Exposes a pixmap's samples to NumPy and keeps the pixmap alive.
+
+    Arrays created from this object reference it as their base, so the
+    pixel memory owned by MuPDF stays valid for as long as the array does.
+    """
+
+    def __init__(self, pix):
+        self.pix = pix
+        self.__array_interface__ = {
+            "version": 3,
+            "shape": (pix.height, pix.width, pix.n),
+            "typestr": "|u1",
+            "strides": (pix.stride, pix.n, 1),
+            "data": (pix.samples_ptr, False),
+        }
+
+
+def pixmap_to_array(pix):
+    """Wrap a pixmap's samples as an (height, width, n) uint8 array without copying"""
+    return np.ascontiguousarray(np.asarray(_PixmapBuffer(pix)))
+
+
+def render_page(pdf_document, page_num, zoom=RENDER_ZOOM):
+    """Rasterize a single PDF page to an RGB uint8 array"""
+    with tracer.span("render", page=page_num):
+        page = pdf_document[page_num]
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+        return pixmap_to_array(pix)
+
+
+def cached_render(pdf_document, page_num, zoom=RENDER_ZOOM, disk_cache=None):
+    """Render a page, or load it from a DocumentCache if it was rendered before"""
+    image = None
+    if disk_cache is not None:
+        image = disk_cache.load(page_num, "render")
+    if image is None:
+        image = render_page(pdf_document, page_num, zoom)
+        if disk_cache is not None:
+            disk_cache.save(page_num, "render", image)
+    return image
+
+
+def palettize(image):
+    """Split an RGB image into 8-bit color indices and an RGB palette.
+
+    Exact when the image has at most 256 colors, as flat-colored plans
+    usually do; otherwise the colors are quantized.
+    """
+    packed = ((image[..., 0].astype(np.uint32) << 16)
+              | (image[..., 1].astype(np.uint32) << 8) | image[..., 2])
+    colors, indices = np.unique(packed.ravel(), return_inverse=True)
+    if len(colors) <= 256:
+        palette = (np.stack([colors >> 16, colors >> 8, colors], axis=1) & 0xFF).astype(np.uint8)
+        return indices.astype(np.uint8).reshape(image.shape[:2]), palette
+    
+    quantized = Image.fromarray(image).quantize(256, method=Image.Quantize.FASTOCTREE)
+    indices = np.asarray(quantized)
+    palette = np.array(quantized.getpalette()[:3 * (int(indices.max()) + 1)], dtype=np.uint8)
+    return indices, palette.reshape(-1, 3)
+
+
+def encode_raster_image(image, compression="Flate", quality=DEFAULT_JPEG_QUALITY):
+    """Encode an RGB image as a compressed PDF image stream.
+
+    Returns (width, height, colorspace, filter, stream) for add_raster_page.
+    """
+    height, width = image.shape[:2]
+    if compression == "JPEG":
+        bgr = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+        data = cv2.imencode('.jpg', bgr, [cv2.IMWRITE_JPEG_QUALITY, quality])[1]
+        return width, height, "/DeviceRGB", "/DCTDecode", data.tobytes()
+    if compression == "Palette":
+        indices, palette = palettize(image)
+        colorspace = f"[/Indexed /DeviceRGB {len(palette) - 1} <{palette.tobytes().hex()}>]"
+        return width, height, colorspace, "/FlateDecode", zlib.compress(indices.tobytes())
+    if compression == "Flate":
+        data = zlib.compress(np.ascontiguousarray(image).tobytes())
+        return width, height, "/DeviceRGB", "/FlateDecode", data
+    raise ValueError(f"Unknown raster compression: {compression}")
+
+
+def add_raster_page(doc, rect, width, height, colorspace, image_filter, stream):
+    """Append a page of the given size showing an already encoded image"""
+    xref = doc.get_new_xref()
+    doc.update_object(xref, f"<</Type/XObject/Subtype/Image/Width {width}/Height {height}"
+                            f"/ColorSpace {colorspace}/BitsPerComponent 8>>")
+    # update_stream drops /Filter when not compressing, so set it afterwards
+    doc.update_stream(xref, stream, compress=False)
+    doc.xref_set_key(xref, "Filter", image_filter)
+    page = doc.new_page(width=rect.width, height=rect.height)
+    page.insert_image(page.rect, xref=xref)
+
+
+def image_nbytes(image):
+    """Memory footprint of a cached entry (page render, map or index) in bytes"""
+    return image.nbytes
+
+
+class PageCache:
+    """LRU cache of rendered pages bounded by a memory budget.
+
+    Pages marked dirty (currently being edited) are never evicted; clean
+    pages are dropped least-recently-used first once the budget is exceeded
+    and simply re-rendered on their next access. The most recently used
+    entry is kept even if it alone exceeds the budget, so an edge map of a
+    very large page is not recomputed on every fill.
+    """
+
+    def __init__(self, max_mb=DEFAULT_PAGE_CACHE_MB):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.current_bytes = 0
+        self._pages = OrderedDict()
+        self._dirty = set()
+
+    def __contains__(self, page_num):
+        return page_num in self._pages
+
+    def __len__(self):
+        return len(self._pages)
+
+    def get(self, page_num):
+        """Return the cached page image, or None if it is not cached"""
+        image = self._pages.get(page_num)
+        if image is not None:
+            self._pages.move_to_end(page_num)
+        return image
+
+    def put(self, page_num, image):
+        """Add a page image to the cache, evicting clean pages if needed"""
+        # Cached renders are shared with the window, so guard them from edits
+        if isinstance(image, np.ndarray):
+            image.flags.writeable = False
+        if page_num in self._pages:
+            self.current_bytes -= image_nbytes(self._pages.pop(page_num))
+        self._pages[page_num] = image
+        self.current_bytes += image_nbytes(image)
+        self._evict()
+
+    def mark_dirty(self, page_num):
+        """Protect a page from eviction while it has unsaved edits"""
+        self._dirty.add(page_num)
+
+    def mark_clean(self, page_num):
+        """Allow a page to be evicted again"""
+        self._dirty.discard(page_num)
+        self._evict()
+
+    def set_budget(self, max_mb):
+        """Change the memory budget, evicting pages if it shrank"""
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._evict()
+
+    def clear(self):
+        """Drop all cached pages"""
+        self._pages.clear()
+        self._dirty.clear()
+        self.current_bytes = 0
+
+    def _evict(self):
+        """Evict least recently used clean pages until within budget"""
+        for page_num in list(self._pages)[:-1]:
+            if self.current_bytes <= self.max_bytes:
+                break
+            if page_num in self._dirty:
+                continue
+            self.current_bytes -= image_nbytes(self._pages.pop(page_num))
+
+
+class PageStore:
+    """Page renders and edit layers kept in memory-mapped files.
+
+    Renders written here are mapped back read-only, so the OS page cache
+    holds them rather than the process, and a page dropped from the
+    in-memory cache reopens without rendering it again. Files live in a
+    private directory under root (the system temp directory by default),
+    removed by close().
+    """
+
+    def __init__(self, root=None):
+        self.directory = tempfile.mkdtemp(prefix="pdf-colorizer-", dir=root)
+        self._layer_count = 0
+
+    def render_path(self, page_num):
+        return os.path.join(self.directory, f"render-{page_num}.npy")
+
+    def has_render(self, page_num):
+        return os.path.exists(self.render_path(page_num))
+
+    def save_render(self, page_num, image):
+        """Write a page render and return it mapped read-only"""
+        stored = np.lib.format.open_memmap(self.render_path(page_num), mode="w+",
+                                           dtype=image.dtype, shape=image.shape)
+        stored[...] = image
+        stored.flush()
+        del stored
+        return self.load_render(page_num)
+
+    def load_render(self, page_num):
+        """Return a stored page render mapped read-only, or None"""
+        try:
+            return np.load(self.render_path(page_num), mmap_mode="r")
+        except FileNotFoundError:
+            return None
+
+    def edit_backing(self, page_num, width, height):
+        """A zeroed (height, width, 4) file-backed array for a new edit layer"""
+        # Each layer gets its own file; an old one may still be mapped
+        self._layer_count += 1
+        path = os.path.join(self.directory, f"edits-{page_num}-{self._layer_count}.npy")
+        # Only edited tiles are written; filesystems with sparse files, unlike
+        # NTFS, leave the rest of the file unallocated
+        return np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8,
+                                         shape=(height, width, 4))
+
+    def close(self):
+        """Delete the store's files"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def default_cache_dir():
+    """Where the render cache lives unless PDF_COLORIZER_CACHE says otherwise"""
+    if os.environ.get(CACHE_DIR_ENV):
+        return os.environ[CACHE_DIR_ENV]
+    if os.name == "nt":
+        root = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    elif sys.platform == "darwin":
+        root = os.path.expanduser("~/Library/Caches")
+    else:
+        root = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(root, "pdf-colorizer")
+
+
+def document_key(pdf_path):
+    """Hex digest identifying a PDF in the render cache.
+
+    The key depends only on the contents, so a copied or downloaded-again
+    plan finds its earlier entries. Hashing a whole plan set would hold up
+    its first page, so only its size and the first and last
+    DOCUMENT_KEY_SAMPLE_BYTES are hashed; saving a PDF rewrites its end.
+    """
+    size = os.path.getsize(pdf_path)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{size}\0".encode())
+    with open(pdf_path, "rb") as pdf_file:
+        digest.update(pdf_file.read(DOCUMENT_KEY_SAMPLE_BYTES))
+        if size > DOCUMENT_KEY_SAMPLE_BYTES:
+            pdf_file.seek(max(DOCUMENT_KEY_SAMPLE_BYTES, size - DOCUMENT_KEY_SAMPLE_BYTES))
+            digest.update(pdf_file.read())
+    return digest.hexdigest()
+
+
+class RenderCache:
+    """Compressed page renders and edge maps kept on disk across sessions.
+
+    Entries are found by the caller's key, so a document seen before
+    reopens by decompressing its pages rather than rasterizing them again.
+    Each file is a JSON header line (dtype and shape) followed by the
+    zlib-compressed pixels. Reads touch a file's modification time and
+    writes delete the least recently used files beyond the disk budget.
+    Several processes may share the directory.
+
+    Writing and trimming happen on a writer thread of the cache's own, so
+    callers never wait for compression or disk I/O.
+    """
+
+    def __init__(self, directory=None, max_mb=DEFAULT_RENDER_CACHE_MB):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._start_writer()
+
+    def _start_writer(self):
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="render-cache")
+        self._write_slots = threading.BoundedSemaphore(RENDER_CACHE_PENDING_WRITES)
+
+    def __getstate__(self):
+        # Pickled for worker processes, which start writers of their own
+        state = dict(self.__dict__)
+        del state["_writer"], state["_write_slots"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._start_writer()
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.v{RENDER_CACHE_VERSION}.page")
+
+    def get(self, key):
+        """Return the cached array, or None"""
+        path = self.path(key)
+        try:
+            with open(path, "rb") as cache_file:
+                header = json.loads(cache_file.readline())
+                data = zlib.decompress(cache_file.read())
+            os.utime(path)
+        except (OSError, ValueError, zlib.error):
+            # Missing, evicted by another process meanwhile, or corrupt
+            return None
+        return np.frombuffer(data, dtype=header["dtype"]).reshape(header["shape"])
+
+    def put(self, key, array):
+        """Queue an array to be stored under key, then the cache trimmed.
+
+        The array must not change afterwards. The cache is only a shortcut,
+        so when the writer is behind by RENDER_CACHE_PENDING_WRITES the
+        array is not stored.
+        """
+        if not self._write_slots.acquire(blocking=False):
+            return
+        future = self._writer.submit(self._write, key, array)
+        future.add_done_callback(lambda _: self._write_slots.release())
+
+    def flush(self):
+        """Wait until every queued write and trim has finished"""
+        self._writer.submit(lambda: None).result()
+
+    def _write(self, key, array):
+        """Store an array under key (on the writer thread)"""
+        path = self.path(key)
+        if os.path.exists(path):
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        header = json.dumps({"dtype": array.dtype.str, "shape": list(array.shape)})
+        # Level 1 keeps writes quick; flat-colored plans compress well anyway
+        data = zlib.compress(np.ascontiguousarray(array), 1)
+        # Written under a private name first, so readers never see half a file
+        handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as cache_file:
+                cache_file.write(header.encode() + b"\n")
+                cache_file.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self.trim()
+
+    def set_budget(self, max_mb):
+        """Change the disk budget, deleting files in the background if it shrank"""
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._writer.submit(self.trim)
+
+    def trim(self):
+        """Delete least recently used files until within the disk budget"""
+        entries = []
+        try:
+            with os.scandir(self.directory) as scan:
+                for entry in scan:
+                    if entry.name.endswith(".page"):
+                        try:
+                            stat = entry.stat()
+                        except FileNotFoundError:
+                            continue
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except FileNotFoundError:
+            return
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        """Delete every cached file"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class DocumentCache:
+    """One document's entries in a RenderCache, at one render zoom.
+
+    Picklable, so worker processes can share the cache.
+    """
+
+    def __init__(self, render_cache, document, zoom=RENDER_ZOOM):
+        self.render_cache = render_cache
+        self.document = document
+        self.zoom = zoom
+
+    def key(self, page_num, kind):
+        return f"{self.document}-{page_num}-{self.zoom:g}-{kind}"
+
+    def load(self, page_num, kind):
+        """Return a page's cached "render" or "edges" array, or None"""
+        return self.render_cache.get(self.key(page_num, kind))
+
+    def save(self, page_num, kind, array):
+        self.render_cache.put(self.key(page_num, kind), array)
+
+
+# Document opened once per worker process, and its optional DocumentCache
+_worker_document = None
+_worker_cache = None
+
+
+def _open_worker_document(pdf_path, disk_cache=None):
+    """Worker initializer: open the document for this process"""
+    global _worker_document, _worker_cache
+    _worker_document = fitz.open(pdf_path)
+    _worker_cache = disk_cache
+
+
+def _render_worker_page(page_num):
+    """Worker task: render one page of the worker's document"""
+    zoom = RENDER_ZOOM if _worker_cache is None else _worker_cache.zoom
+    return cached_render(_worker_document, page_num, zoom, _worker_cache)
+
+
+def _export_worker_page(page_num, layer, compression, quality, zoom=RENDER_ZOOM):
+    """Export worker task: render, composite and encode one page"""
+    image = render_page(_worker_document, page_num, zoom)
+    if layer is not None:
+        image = layer.composite(image)
+    return encode_raster_image(image, compression, quality)
+
+
+def export_raster_pdf(pdf_path, file_path, edit_layers, compression="Flate",
+                      quality=DEFAULT_JPEG_QUALITY, max_workers=None, zoom=RENDER_ZOOM,
+                      progress=None):
+    """Write a flattened PDF with one compressed image per page.
+
+    Pages are rendered, composited with their edit layers and encoded in a
+    process pool, then added to the output in order. Only a few pages per
+    worker are rendered at once, but the output is built in memory until it
+    is saved, so memory grows with the size of the encoded file.
+    progress(done, total) is called as each page is added.
+    """
+    with tracer.span("save", format="raster", compression=compression):
+        with fitz.open(pdf_path) as source:
+            page_rects = [page.rect for page in source]
+        max_workers = max_workers or os.cpu_count() or 1
+        preload_modules()
+        
+        output = fitz.open()
+        try:
+            with ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_open_worker_document,
+                initargs=(pdf_path,),
+            ) as executor:
+                pending = deque()
+                next_page = 0
+                try:
+                    for done, rect in enumerate(page_rects, 1):
+                        while next_page < len(page_rects) and len(pending) < 2 * max_workers:
+                            pending.append(executor.submit(
+                                _export_worker_page, next_page, edit_layers.get(next_page),
+                                compression, quality, zoom))
+                            next_page += 1
+                        add_raster_page(output, rect, *pending.popleft().result())
+                        if progress is not None:
+                            progress(done, len(page_rects))
+                except BaseException:
+                    # Stop queued pages instead of waiting for them on shutdown
+                    for future in pending:
+                        future.cancel()
+                    raise
+            
+            # Write beside the target first; it may be the open source file
+            temp_path = f"{file_path}.part"
+            output.save(temp_path, garbage=1)
+            os.replace(temp_path, file_path)
+        finally:
+            output.close()
+
+
+def load_font(size):
+    """Arial at the given size, or PIL's default font where it is missing"""
+    try:
+        return ImageFont.truetype("arial.ttf", size)
+    except OSError:
+        try:
+            return ImageFont.truetype("C:\\Windows\\Fonts\\arial.ttf", size)
+        except OSError:
+            return ImageFont.load_default()
+
+
+class ColorizerEngine:
+    """Editing session over one PDF document.
+
+    Holds the open document, page renders, each page's edits and the undo
+    history, and applies the coloring tools to the current page. Points
+    are pixels of the page render at zoom and colors are (r, g, b) tuples.
+    Tools return the rectangle they changed, or None. The current page
+    being edited, colored_image, is one contiguous RGB uint8 array that
+    every tool edits in place.
+
+    Every tool action is also logged, in PDF points, in operations
+    ({page_num: [operation, ...]}), so the edits can be saved as a project
+    and replayed at any resolution.
+
+    With store_dir set, each opened document gets a PageStore there, so
+    renders and edit layers are kept on disk and mapped back as needed.
+    With a render_cache, renders and edge maps also outlive the session,
+    so a document opened before skips rasterizing its pages; they are
+    written to it in the background.
+    """
+
+    def __init__(self, page_cache_mb=DEFAULT_PAGE_CACHE_MB, undo_mb=DEFAULT_UNDO_BUDGET_MB,
+                 zoom=RENDER_ZOOM, store_dir=None, render_cache=None):
+        self.zoom = zoom
+        self.store_dir = store_dir
+        self.page_store = None
+        self.render_cache = render_cache
+        self.document_cache = None  # The open document's entries in render_cache
+        self.pdf_path = None
+        # The document as opened; a private copy once pdf_path is saved over
+        self.source_path = None
+        self._source_copy = None
+        self.document = None
+        self.total_pages = 0
+        self.current_page = 0
+        self.page_cache = PageCache(page_cache_mb)
+        self.edge_cache = EdgeMapCache()
+        self.region_indexes = PageCache(REGION_INDEX_CACHE_MB)
+        self.uniform_blocks = UniformBlocks()  # Of colored_image, for coarse fills
+        self.history = UndoHistory(undo_mb)
+        self.edit_layers = {}
+        self.pending_edit_rect = None
+        self.dirty_pages = set()  # Pages edited since the last vector save
+        self.save_target = None  # File the last vector save wrote
+        self.overlay_xrefs = {}  # Overlay image xref per page in save_target
+        self.original_image = None
+        self.colored_image = None
+        # Optional page_num -> image callable tried before rendering a page
+        self.page_source = None
+        self.operations = {}
+        self._recording = True
+        self._open_operations = []  # Logged by the action in progress
+        self._action_sizes = []  # Operations per undoable action on this page
+        self._undone_operations = []
+
+    def load(self, pdf_path, page_num=0):
+        """Open a PDF at page_num; pages are rendered on demand as they are opened"""
+        with tracer.span("load"):
+            document = fitz.open(pdf_path)
+            self.close()
+            self.pdf_path = pdf_path
+            self.source_path = pdf_path
+            self.document = document
+            if self.store_dir is not None:
+                self.page_store = PageStore(self.store_dir)
+            if self.render_cache is not None:
+                self.document_cache = DocumentCache(self.render_cache, document_key(pdf_path),
+                                                    self.zoom)
+                self.edge_cache.disk = self.document_cache
+            self.total_pages = document.page_count
+            self.save_target = pdf_path
+            self.open_page(page_num)
+
+    def close(self):
+        """Close the document and drop its pages, edits and history"""
+        if self.document is not None:
+            self.document.close()
+            self.document = None
+        self.document_cache = None
+        self.edge_cache.disk = None
+        if self._source_copy is not None:
+            os.unlink(self._source_copy)
+            self._source_copy = None
+        self.source_path = None
+        self.page_cache.clear()
+        self.edge_cache.clear()
+        self.region_indexes.clear()
+        self.history.clear()
+        self.original_image = None
+        self.colored_image = None
+        self.uniform_blocks.reset()
+        self.edit_layers = {}
+        self.pending_edit_rect = None
+        self.dirty_pages.clear()
+        self.save_target = None
+        self.overlay_xrefs = {}
+        self.operations = {}
+        self._action_sizes = []
+        self._undone_operations = []
+        self.current_page = 0
+        self.total_pages = 0
+        # Last, once nothing here maps its files; mapped files cannot be
+        # deleted on Windows
+        if self.page_store is not None:
+            self.page_store.close()
+            self.page_store = None
+
+    def open_page(self, page_num):
+        """Make page_num the page the tools edit; edits stay with their page"""
+        with tracer.span("open_page", page=page_num):
+            self.commit_page_edits()
+            self.page_cache.mark_clean(self.current_page)
+            self.current_page = page_num
+            self.history.clear()
+            self._action_sizes = []
+            self._undone_operations = []
+            
+            # The cached render is read-only; the tools edit one RGB copy in place
+            self.original_image = self.get_page_image(page_num)
+            self.colored_image = self.composite_page(page_num)
+            self.uniform_blocks.reset()
+
+    def get_page_image(self, page_num):
+        """Return the rendered page, rendering it if it is not cached or stored"""
+        image = self.page_cache.get(page_num)
+        if image is None and self.page_store is not None:
+            image = self.page_store.load_render(page_num)
+            if image is not None:
+                self.page_cache.put(page_num, image)
+        if image is None:
+            if self.page_source is not None:
+                image = self.page_source(page_num)
+            if image is None:
+                image = cached_render(self.document, page_num, self.zoom, self.document_cache)
+            image = self.cache_page(page_num, image)
+        return image
+
+    def cache_page(self, page_num, image):
+        """Keep a page render, writing it to the page store if there is one.
+
+        Returns the image kept, which is mapped from disk with a store.
+        """
+        if self.page_store is not None:
+            image = self.page_store.save_render(page_num, image)
+        self.page_cache.put(page_num, image)
+        return image
+
+    def has_page(self, page_num):
+        """Whether a page is available without rendering it"""
+        return page_num in self.page_cache or (self.page_store is not None
+                                               and self.page_store.has_render(page_num))
+
+    def composite_page(self, page_num):
+        """Return a copy of a page's base render with its saved edits applied"""
+        base = self.get_page_image(page_num)
+        layer = self.edit_layers.get(page_num)
+        return base.copy() if layer is None else layer.composite(base)
+
+    def commit_page_edits(self):
+        """Move the current page's recent edits into its edit layer"""
+        with tracer.span("commit"):
+            if self.pending_edit_rect is None or self.colored_image is None:
+                return
+            height, width = self.original_image.shape[:2]
+            layer = self.edit_layers.get(self.current_page)
+            if layer is None:
+                backing = None
+                if self.page_store is not None:
+                    backing = self.page_store.edit_backing(self.current_page, width, height)
+                layer = self.edit_layers[self.current_page] = EditLayer(width, height,
+                                                                        backing=backing)
+            layer.capture(self.pending_edit_rect, self.original_image, self.read_patch)
+            if layer.is_empty():
+                del self.edit_layers[self.current_page]
+            self.pending_edit_rect = None
+
+    def mark_edited(self, rect):
+        """Note that pixels under rect changed and must reach the edit layer"""
+        self.dirty_pages.add(self.current_page)
+        self.uniform_blocks.mark_stale(rect)
+        if self.pending_edit_rect is None:
+            self.pending_edit_rect = rect
+        else:
+            self.pending_edit_rect = bounding_rect([self.pending_edit_rect, rect])
+
+    def region_index(self, threshold):
+        """Return the current page's region index, building it if needed"""
+        index = self.region_indexes.get((self.current_page, threshold))
+        if index is None:
+            magnitude, index = build_region_index(
+                self.original_image, threshold, self.edge_cache.stored_magnitude(self.current_page)
+            )
+            self.store_region_index(self.current_page, threshold, magnitude, index)
+        return index
+
+    def store_region_index(self, page_num, threshold, magnitude, index):
+        """Keep a region index, and the edge map it came from, for later fills"""
+        self.edge_cache.store(page_num, magnitude)
+        self.region_indexes.put((page_num, threshold), index)
+
+    def clip_rect(self, rect):
+        """Clip an (x0, y0, x1, y1) rectangle to the page"""
+        x0, y0, x1, y1 = rect
+        height, width = self.colored_image.shape[:2]
+        return (max(0, x0), max(0, y0), min(width, x1), min(height, y1))
+
+    def read_patch(self, rect):
+        """Copy the pixels of the working page under rect"""
+        x0, y0, x1, y1 = rect
+        return self.colored_image[y0:y1, x0:x1].copy()
+
+    def write_patch(self, rect, patch):
+        """Overwrite the pixels of the working page under rect"""
+        x0, y0, x1, y1 = rect
+        self.colored_image[y0:y1, x0:x1] = patch
+        self.uniform_blocks.mark_stale(rect)
+
+    @contextmanager
+    def drawing(self, rect):
+        """PIL drawing over just the working page's pixels under rect.
+
+        Coordinates are relative to the rect's top-left corner; the pixels
+        are written back to the page when the block exits.
+        """
+        x0, y0, x1, y1 = rect
+        if x1 <= x0 or y1 <= y0:
+            # Nothing on the page to draw on
+            yield ImageDraw.Draw(Image.new('RGB', (1, 1)), 'RGBA')
+            return
+        patch = Image.fromarray(self.colored_image[y0:y1, x0:x1])
+        yield ImageDraw.Draw(patch, 'RGBA')
+        self.colored_image[y0:y1, x0:x1] = np.asarray(patch)
+
+    def record_undo(self, rect):
+        """Save the pixels under rect before they change; returns the clipped rect"""
+        rect = self.clip_rect(rect)
+        self.history.record(rect, self.read_patch(rect))
+        self.mark_edited(rect)
+        return rect
+
+    def to_points(self, x, y):
+        """PDF point coordinates of a render pixel, as logged in operations"""
+        return [round(x / self.zoom, 2), round(y / self.zoom, 2)]
+
+    def to_pixels(self, point):
+        """Render pixel coordinates of a logged point"""
+        return round(point[0] * self.zoom), round(point[1] * self.zoom)
+
+    def begin_action(self):
+        """Start an action, such as a brush stroke, that undoes as one step"""
+        self.history.begin()
+
+    def end_action(self):
+        """Finish the action and log the operations it made"""
+        self.history.end()
+        operations, self._open_operations = self._open_operations, []
+        if operations:
+            self.operations.setdefault(self.current_page, []).extend(operations)
+            self._action_sizes.append(len(operations))
+            self._undone_operations = []
+
+    def abort_action(self):
+        """Discard the action in progress, restoring the pixels it changed"""
+        self.history.abort(self.write_patch)
+        self._open_operations = []
+
+    def log(self, operation):
+        """Add an operation to the action in progress"""
+        if self._recording:
+            self._open_operations.append(operation)
+
+    def flood_fill(self, x, y, color, tolerance=30, threshold=50, use_index=True, coarse=False,
+                   index=None):
+        """Fill from (x, y) without crossing edges stronger than threshold.
+
+        With use_index, a region index already built for the threshold
+        fills the whole enclosed region and tolerance is ignored; index
+        gives that index directly rather than looking it up. With
+        coarse, open areas are flooded a block at a time first, which
+        fills the same pixels as the exact flood with fewer visits.
+        """
+        with tracer.span("fill", threshold=threshold) as span:
+            self.begin_action()
+            try:
+                self.page_cache.mark_dirty(self.current_page)
+                operation = {"tool": "fill", "seed": self.to_points(x, y), "color": list(color),
+                             "tolerance": tolerance, "threshold": threshold, "mode": "flood"}
+                
+                # Seeds off the page fill nothing, whichever way the fill is made
+                colored = self.colored_image
+                if not (0 <= x < colored.shape[1] and 0 <= y < colored.shape[0]):
+                    return None
+                
+                # A ready region index resolves the click to a precomputed region
+                if use_index:
+                    if index is None:
+                        index = self.region_indexes.get((self.current_page, threshold))
+                    if index is not None:
+                        span.set(mode="region")
+                        dirty_rect = self.fill_region(index, x, y, color)
+                        if dirty_rect is not None:
+                            self.log({**operation, "mode": "region"})
+                        return dirty_rect
+                
+                # Edges come from the original render and are cached per page,
+                # so repeat fills only pay for the flood itself
+                span.set(mode="flood", tolerance=tolerance)
+                barrier_mask = self.edge_cache.barrier_mask(
+                    self.current_page, self.original_image, threshold
+                )
+                
+                # Check if starting point is on a barrier - if so, don't fill
+                if barrier_mask[y + 1, x + 1]:
+                    span.set(on_barrier=True)
+                    return None
+                
+                # The cached mask is shared; flood fill marks the region with 2 in
+                # its copy and leaves the page alone, so undo can save it first
+                mask = barrier_mask.copy()
+                seed, reached, visited = (x, y), None, 0
+                if coarse:
+                    span.set(mode="coarse")
+                    seed, reached, visited = self.fill_blocks(mask, x, y, tolerance, threshold)
+                flags = 4 | cv2.FLOODFILL_MASK_ONLY | (2 << 8)
+                area, _, _, (rx, ry, rw, rh) = cv2.floodFill(
+                    colored, mask, seed, 0, (tolerance,) * 3, (tolerance,) * 3, flags
+                )
+                span.set(visited=visited + area)
+                
+                # Only the filled rectangle is kept for undo, then painted in place
+                dirty_rect = self.record_undo((rx, ry, rx + rw, ry + rh))
+                filled = mask[ry + 1:ry + rh + 1, rx + 1:rx + rw + 1] == 2
+                colored[ry:ry + rh, rx:rx + rw][filled] = color
+                if reached is not None:
+                    # Whole blocks filled, borders included, so each is one color
+                    block_interiors(colored, self.uniform_blocks.block_size)[reached] = color
+                    self.uniform_blocks.mark_uniform(reached)
+                self.log(operation)
+                return dirty_rect
+            except Exception:
+                self.abort_action()
+                raise
+            finally:
+                # Close the undo action (a no-op once it has been aborted)
+                self.end_action()
+
+    def fill_blocks(self, mask, x, y, tolerance, threshold):
+        """Coarse pass of the coarse-to-fine fill.
+
+        Floods the grid of solid blocks, those with no barrier pixel and a
+        single color, from the block under (x, y), and marks the interiors
+        of the blocks reached with 3 in the flood mask. The exact flood then
+        only walks their one-pixel borders, which connect them just as their
+        interiors would, and the pixels outside them. Returns the seed for
+        that flood, the (rows, cols) grid of blocks reached, or None, and
+        the number of blocks visited.
+        """
+        size = self.uniform_blocks.block_size
+        colored = self.colored_image
+        # The mask is still an unmarked copy of the barrier mask here
+        solid = self.uniform_blocks.get(colored) & self.edge_cache.open_blocks(
+            self.current_page, threshold, mask, size
+        )
+        rows, cols = solid.shape
+        bx, by = x // size, y // size
+        if bx >= cols or by >= rows or not solid[by, bx]:
+            return (x, y), None, 0
+        
+        # Each block is one color, so one pixel stands for it and adjacent
+        # blocks join exactly when their pixels along the shared edge would
+        samples = np.ascontiguousarray(colored[:rows * size:size, :cols * size:size])
+        block_mask = np.ones((rows + 2, cols + 2), dtype=np.uint8)
+        block_mask[1:-1, 1:-1] = ~solid
+        flags = 4 | cv2.FLOODFILL_MASK_ONLY | (2 << 8)
+        visited = cv2.floodFill(samples, block_mask, (bx, by), 0, (tolerance,) * 3,
+                                (tolerance,) * 3, flags)[0]
+        reached = block_mask[1:-1, 1:-1] == 2
+        
+        # Interiors are marked 3, walls to the exact flood like its own marks
+        # of 2, so the caller can paint them a block at a time
+        block_interiors(mask[1:-1, 1:-1], size)[reached] = 3
+        # The block's corner is on its border, which the exact flood walks
+        return (bx * size, by * size), reached, visited
+
+    def fill_region(self, index, x, y, color):
+        """Paint the precomputed region under (x, y)"""
+        region = index.region_at(x, y)
+        if region is None:
+            return None  # Starting point is on a strong edge, don't fill
+        
+        (x0, y0, x1, y1), mask = region
+        rect = self.record_undo((x0, y0, x1, y1))
+        self.colored_image[y0:y1, x0:x1][mask] = color
+        return rect
+
+    def brush(self, start, end, color, width=5):
+        """Draw one brush segment from start to end, inside an action"""
+        with tracer.span("brush"):
+            (x0, y0), (x1, y1) = start, end
+            reach = width // 2 + 1
+            dirty_rect = self.record_undo((min(x0, x1) - reach, min(y0, y1) - reach,
+                                           max(x0, x1) + reach + 1, max(y0, y1) + reach + 1))
+            self.page_cache.mark_dirty(self.current_page)
+            left, top = dirty_rect[:2]
+            with self.drawing(dirty_rect) as draw:
+                draw.line([(x0 - left, y0 - top), (x1 - left, y1 - top)], fill=(*color, 200),
+                          width=width)
+            
+            # Segments continuing the stroke extend one polyline operation
+            point, size = self.to_points(x1, y1), round(width / self.zoom, 2)
+            stroke = self._open_operations[-1] if self._open_operations else None
+            if (stroke is not None and stroke["tool"] == "brush" and stroke["color"] == list(color)
+                    and stroke["width"] == size and stroke["points"][-1] == self.to_points(x0, y0)):
+                stroke["points"].append(point)
+            else:
+                self.log({"tool": "brush", "points": [self.to_points(x0, y0), point],
+                          "color": list(color), "width": size})
+            return dirty_rect
+
+    def brush_stroke(self, points, color, width=5):
+        """Draw a polyline through points as one undoable stroke"""
+        self.begin_action()
+        try:
+            rects = [self.brush(start, end, color, width)
+                     for start, end in zip(points, points[1:])]
+        finally:
+            self.end_action()
+        return bounding_rect(rects) if rects else None
+
+    def rectangle(self, start, end, color, width=5):
+        """Draw the outline of the rectangle spanned by two corners"""
+        with tracer.span("rectangle"):
+            (x0, y0), (x1, y1) = start, end
+            left, top, right, bottom = min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)
+            self.begin_action()
+            try:
+                self.page_cache.mark_dirty(self.current_page)
+                dirty_rect = self.record_undo((left, top, right + 1, bottom + 1))
+                dx, dy = dirty_rect[:2]
+                with self.drawing(dirty_rect) as draw:
+                    draw.rectangle((left - dx, top - dy, right - dx, bottom - dy),
+                                   outline=(*color, 200), width=width)
+                self.log({"tool": "rectangle", "rect": self.to_points(left, top) + self.to_points(right, bottom),
+                          "color": list(color), "width": round(width / self.zoom, 2)})
+                return dirty_rect
+            except Exception:
+                self.abort_action()
+                raise
+            finally:
+                self.end_action()
+
+    def add_text(self, x, y, text, color, font_size=20):
+        """Draw text with its top-left corner at (x, y)"""
+        with tracer.span("text"):
+            self.begin_action()
+            try:
+                self.page_cache.mark_dirty(self.current_page)
+                font = load_font(font_size)
+                # Measuring the text needs no page pixels
+                bbox = ImageDraw.Draw(Image.new('RGB', (1, 1))).textbbox((x, y), text, font=font)
+                dirty_rect = self.record_undo(bbox)
+                left, top = dirty_rect[:2]
+                with self.drawing(dirty_rect) as draw:
+                    draw.text((x - left, y - top), text, fill=(*color, 255), font=font)
+                self.log({"tool": "text", "origin": self.to_points(x, y), "text": text,
+                          "color": list(color), "size": round(font_size / self.zoom, 2)})
+                return dirty_rect
+            except Exception:
+                self.abort_action()
+                raise
+            finally:
+                self.end_action()
+
+    def apply_operation(self, operation):
+        """Apply a logged operation to the current page at this engine's zoom"""
+        tool = operation["tool"]
+        color = tuple(operation["color"])
+        if tool == "fill":
+            x, y = self.to_pixels(operation["seed"])
+            region = operation.get("mode") == "region"
+            # The index is passed on, as one over the cache budget is not kept there
+            index = self.region_index(operation["threshold"]) if region else None
+            return self.flood_fill(x, y, color, operation["tolerance"], operation["threshold"],
+                                   use_index=region, index=index)
+        if tool == "brush":
+            points = [self.to_pixels(point) for point in operation["points"]]
+            return self.brush_stroke(points, color, self.to_length(operation["width"]))
+        if tool == "rectangle":
+            rect = operation["rect"]
+            return self.rectangle(self.to_pixels(rect[:2]), self.to_pixels(rect[2:]), color,
+                                  self.to_length(operation["width"]))
+        if tool == "text":
+            x, y = self.to_pixels(operation["origin"])
+            return self.add_text(x, y, operation["text"], color, self.to_length(operation["size"]))
+        raise ValueError(f"Unknown operation: {tool!r}")
+
+    def to_length(self, points):
+        """Render pixel length, at least one, of a logged length in points"""
+        return max(1, round(points * self.zoom))
+
+    def replay(self, operations, progress=None):
+        """Apply an operation log ({page_num: [operation, ...]}) to the document.
+
+        progress(done, total) is called after each page's operations.
+        """
+        with tracer.span("replay"):
+            current = self.current_page
+            pages = [(page_num, page_operations)
+                     for page_num, page_operations in sorted(operations.items()) if page_operations]
+            self._recording = False
+            try:
+                for done, (page_num, page_operations) in enumerate(pages, 1):
+                    self.open_page(page_num)
+                    for operation in page_operations:
+                        self.apply_operation(operation)
+                    self.operations.setdefault(page_num, []).extend(copy.deepcopy(page_operations))
+                    if progress is not None:
+                        progress(done, len(pages))
+            finally:
+                # Also after a cancelled replay, whose finished pages are kept
+                self._recording = True
+                self.open_page(current)
+
+    def undo(self):
+        """Undo the last action on the current page"""
+        if self.colored_image is None:
+            return None
+        dirty_rect = self.history.undo(self.read_patch, self.write_patch)
+        if dirty_rect is not None:
+            self.mark_edited(dirty_rect)
+            if self._action_sizes:
+                count = self._action_sizes.pop()
+                operations = self.operations[self.current_page]
+                self._undone_operations.append(operations[-count:])
+                del operations[-count:]
+        return dirty_rect
+
+    def redo(self):
+        """Redo the last undone action on the current page"""
+        if self.colored_image is None:
+            return None
+        dirty_rect = self.history.redo(self.read_patch, self.write_patch)
+        if dirty_rect is not None:
+            self.mark_edited(dirty_rect)
+            if self._undone_operations:
+                operations = self._undone_operations.pop()
+                self.operations.setdefault(self.current_page, []).extend(operations)
+                self._action_sizes.append(len(operations))
+        return dirty_rect
+
+    def revert_action(self):
+        """Undo the last action on the current page without keeping it for redo"""
+        if self.colored_image is None:
+            return None
+        dirty_rect = self.history.revert(self.read_patch, self.write_patch)
+        if dirty_rect is not None:
+            self.mark_edited(dirty_rect)
+            if self._action_sizes:
+                del self.operations[self.current_page][-self._action_sizes.pop():]
+        return dirty_rect
+
+    def reset_page(self):
+        """Drop every edit on the current page"""
+        if self.original_image is None:
+            return
+        np.copyto(self.colored_image, self.original_image)
+        self.uniform_blocks.reset()
+        if self.edit_layers.pop(self.current_page, None) is not None:
+            self.dirty_pages.add(self.current_page)
+        self.operations.pop(self.current_page, None)
+        self._action_sizes = []
+        self._undone_operations = []
+        self.pending_edit_rect = None
+        self.history.clear()
+        self.page_cache.mark_clean(self.current_page)
+
+    def save_project(self, file_path):
+        """Save the document's operation log as a project file"""
+        write_project(file_path, self.pdf_path, self.operations)
+
+    def load_project(self, file_path):
+        """Open a project's PDF and replay its operations"""
+        pdf_path, operations = read_project(file_path)
+        self.load(pdf_path)
+        self.replay(operations)
+
+    def is_save_target(self, file_path):
+        """Whether file_path is the file the last vector save wrote"""
+        return (self.save_target is not None and os.path.exists(file_path)
+                and os.path.samefile(file_path, self.save_target))
+
+    def preserve_source(self, file_path):
+        """Copy the unedited document aside before a save overwrites it.
+
+        Saves, exports and replays start from source_path, which must keep
+        the original pages however often the user saves over the PDF.
+        """
+        if not (os.path.exists(file_path) and os.path.samefile(file_path, self.source_path)):
+            return
+        handle, copy_path = tempfile.mkstemp(prefix="pdf-colorizer-source-", suffix=".pdf")
+        with os.fdopen(handle, "wb") as copy_file, open(self.source_path, "rb") as source:
+            shutil.copyfileobj(source, copy_file)
+        self.source_path = self._source_copy = copy_path
+
+    def save_raster(self, file_path, compression="Flate", quality=DEFAULT_JPEG_QUALITY,
+                    max_workers=None, progress=None):
+        """Write every page, with its edits, as a flattened image PDF"""
+        self.commit_page_edits()
+        if self.is_save_target(file_path):
+            self.save_target = None
+        self.preserve_source(file_path)
+        export_raster_pdf(self.source_path, file_path, self.edit_layers,
+                          compression, quality, max_workers, self.zoom, progress)
+
+    def save_overlay(self, file_path, progress=None):
+        """Write the original PDF with each page's edits drawn over it.
+
+        Pages keep their vector content and text; only the edited pixels
+        are added, as one transparent image per edited page. Saving again
+        to the same file appends updates for the dirty pages only.
+        progress(done, total) is called after each page; raising
+        OperationCancelled from it leaves the target file untouched.
+        """
+        with tracer.span("save", format="vector"):
+            self.commit_page_edits()
+            self.preserve_source(file_path)
+            
+            incremental = self.is_save_target(file_path)
+            doc = fitz.open(file_path if incremental else self.source_path)
+            try:
+                if incremental and not doc.can_save_incrementally():
+                    doc.close()
+                    incremental = False
+                    doc = fitz.open(self.source_path)
+                
+                if incremental:
+                    page_nums = sorted(self.dirty_pages)
+                    xrefs = dict(self.overlay_xrefs)
+                else:
+                    page_nums = sorted(self.edit_layers)
+                    xrefs = {}
+                
+                for done, page_num in enumerate(page_nums, 1):
+                    page = doc[page_num]
+                    # Replace the overlay an earlier save left on this page
+                    if page_num in xrefs:
+                        page.delete_image(xrefs.pop(page_num))
+                    layer = self.edit_layers.get(page_num)
+                    overlay = layer.overlay() if layer is not None else None
+                    if overlay is not None:
+                        xrefs[page_num] = insert_overlay(page, *overlay, self.zoom)
+                    if progress is not None:
+                        progress(done, len(page_nums))
+                
+                if incremental:
+                    if page_nums:
+                        doc.save(file_path, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
+                else:
+                    # Write beside the target first; it may be the open source file.
+                    # Garbage level 1 drops unused objects without renumbering the
+                    # rest, so overlay_xrefs stay valid for later incremental saves
+                    temp_path = f"{file_path}.part"
+                    doc.save(temp_path, garbage=1, deflate=True)
+                    os.replace(temp_path, file_path)
+            finally:
+                doc.close()
+            
+            self.save_target = file_path
+            self.overlay_xrefs = xrefs
+            self.dirty_pages.clear()
+
+
+def write_project(file_path, pdf_path, operations):
+    """Write an operation log to a compact JSON project file.
+
+    The PDF is referenced relative to the project file where possible, so
+    the two can be moved together.
+    """
+    try:
+        pdf_ref = os.path.relpath(pdf_path, os.path.dirname(os.path.abspath(file_path)))
+    except ValueError:  # On another drive
+        pdf_ref = os.path.abspath(pdf_path)
+    project = {
+        "format": PROJECT_FORMAT,
+        "version": PROJECT_VERSION,
+        "pdf": pdf_ref,
+        "pages": {str(page_num + 1): page_operations
+                  for page_num, page_operations in sorted(operations.items()) if page_operations},
+    }
+    with open(file_path, "w", encoding="utf-8") as project_file:
+        json.dump(project, project_file, separators=(",", ":"))
+
+
+def read_project(file_path):
+    """Return (pdf_path, operations) from a project file"""
+    with open(file_path, encoding="utf-8") as project_file:
+        project = json.load(project_file)
+    if not isinstance(project, dict) or project.get("format") != PROJECT_FORMAT:
+        raise ValueError(f"{file_path} is not a PDF colorizer project")
+    if project.get("version", 0) > PROJECT_VERSION:
+        raise ValueError(f"{file_path} was written by a newer version")
+    pdf_path = os.path.join(os.path.dirname(os.path.abspath(file_path)), project["pdf"])
+    operations = {int(page) - 1: page_operations for page, page_operations in project["pages"].items()}
+    return pdf_path, operations
+
+
+def export_operations(pdf_path, operations, file_path, dpi, output_format="vector",
+                      compression="Flate", quality=DEFAULT_JPEG_QUALITY, progress=None):
+    """Replay an operation log with pages rendered at dpi and save the result.
+
+    output_format is "vector" for an overlay on the original pages or
+    "raster" for a flattened PDF. progress(done, total) reports the replay
+    and then the save.
+    """
+    engine = ColorizerEngine(zoom=dpi / 72)
+    try:
+        engine.load(pdf_path)
+        engine.replay(operations, progress)
+        if output_format == "raster":
+            engine.save_raster(file_path, compression, quality, progress=progress)
+        else:
+            engine.save_overlay(file_path, progress)
+    finally:
+        engine.close()
@@ -0,0 +1,129 @@
+"""Timing spans for profiling the colorizer.
+
+Tracing is off by default, and a span then costs one attribute check.
+When it is on, finished spans are kept in memory and can be exported as a
+Chrome trace, which chrome://tracing and https://ui.perfetto.dev open.
+
+Set PDF_COLORIZER_TRACE=trace.json to trace a whole run; the trace is
+written when the process exits.
+"""
+import atexit
+import json
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+
+# Environment variable naming a file to trace the whole run into
+TRACE_ENV = "PDF_COLORIZER_TRACE"
+
+# Finished spans kept for export; the oldest are dropped beyond this
+MAX_TRACE_EVENTS = 200_000
+
+
+class _NullSpan:
+    """The span handed out while tracing is off"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """A timed region; set() attaches values shown with it in the trace"""
+
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer.record(self.name, self.start, time.perf_counter_ns(), self.args)
+        return False
+
+    def set(self, **args):
+        self.args.update(args)
+
+
+class Tracer:
+    """Collects timing spans from any thread of this process.
+
+    Use as ``with tracer.span("fill", mode="flood") as span:``; latest
+    holds each span name's most recent duration in milliseconds.
+    """
+
+    def __init__(self, max_events=MAX_TRACE_EVENTS):
+        self.enabled = False
+        self.events = deque(maxlen=max_events)
+        self.latest = {}
+        self._origin = time.perf_counter_ns()
+
+    def span(self, name, **args):
+        """Time a with-block under name"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, args)
+
+    def record(self, name, start, end, args=None):
+        """Add a finished span; start and end are perf_counter_ns values"""
+        # deque.append and dict assignment are atomic, so no lock is needed
+        self.events.append((name, start, end, threading.get_ident(), args))
+        self.latest[name] = (end - start) / 1e6
+
+    def clear(self):
+        """Drop every recorded span"""
+        self.events.clear()
+        self.latest.clear()
+
+    def summary(self):
+        """{name: (count, total ms, max ms)} over the recorded spans"""
+        totals = {}
+        for name, start, end, _, _ in list(self.events):
+            count, total, longest = totals.get(name, (0, 0.0, 0.0))
+            duration = (end - start) / 1e6
+            totals[name] = (count + 1, total + duration, max(longest, duration))
+        return totals
+
+    def chrome_trace(self):
+        """The recorded spans in Chrome's trace event format"""
+        pid = os.getpid()
+        events = [{
+            "name": name,
+            "ph": "X",
+            "ts": (start - self._origin) / 1000,
+            "dur": (end - start) / 1000,
+            "pid": pid,
+            "tid": tid,
+            "args": args or {},
+        } for name, start, end, tid, args in list(self.events)]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export(self, file_path):
+        """Write the recorded spans to a Chrome trace JSON file"""
+        with open(file_path, "w", encoding="utf-8") as trace_file:
+            json.dump(self.chrome_trace(), trace_file, default=str)
+
+
+# The process-wide tracer the engine and GUI report to
+tracer = Tracer()
+
+# Worker processes inherit the environment but must not overwrite the trace
+if os.environ.get(TRACE_ENV) and multiprocessing.parent_process() is None:
+    tracer.enabled = True
+    atexit.register(tracer.export, os.environ[TRACE_ENV])
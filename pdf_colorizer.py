@@ -1,32 +1,683 @@
 import sys
-import cv2
-import numpy as np
-from PIL import Image, ImageDraw, ImageFont
+import tempfile
+import threading
 from pathlib import Path
-import io
+from collections import OrderedDict, deque
+from concurrent.futures import CancelledError, ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QLabel, QSpinBox, QPushButton, QColorDialog,
-                             QFileDialog, QComboBox, QSlider, QMessageBox, QTextEdit)
-from PyQt6.QtGui import QPixmap, QImage, QColor, QIcon, QFont
-from PyQt6.QtCore import Qt, pyqtSignal, QSize
+                             QFileDialog, QComboBox, QSlider, QMessageBox, QTextEdit,
+                             QCheckBox, QProgressBar)
+from PyQt6.QtGui import QImage, QColor, QIcon, QFont, QPainter, QKeySequence
+from PyQt6.QtCore import (Qt, pyqtSignal, QSize, QObject, QTimer, QRect, QCoreApplication,
+                          QEventLoop, QSettings)
 from PyQt6.QtWidgets import QScrollArea
-import fitz  # PyMuPDF
+from colorizer_trace import tracer
+from colorizer_engine import (ColorizerEngine, LazyModule, PageCache, RENDER_ZOOM,
+                              DEFAULT_PAGE_CACHE_MB, FILL_MODES, RASTER_COMPRESSIONS,
+                              DEFAULT_JPEG_QUALITY, OperationCancelled, RenderCache,
+                              build_region_index, export_operations, image_nbytes,
+                              pixmap_to_array, preload_modules, read_project,
+                              _open_worker_document, _render_worker_page)
+
+# Imported on first use so the window appears without waiting for them
+cv2 = LazyModule("cv2")
+np = LazyModule("numpy")
+fitz = LazyModule("fitz")  # PyMuPDF
+
+# Default number of pages on each side of the current one rendered ahead
+DEFAULT_PREFETCH_PAGES = 2
+
+# Saved preferences: an INI file under the user's configuration directory
+SETTINGS_APPLICATION = "PDF Colorizer"
+DISK_CACHE_SETTING = "disk_cache_mb"
+
+# Delay after the last interaction before the display is redrawn at full quality
+DISPLAY_IDLE_MS = 150
+
+# Approximate on-screen size of a display tile in pixels
+TILE_SIZE = 256
+
+# Tiles beyond each edge of the viewport produced ahead of scrolling
+TILE_MARGIN = 1
+
+# Memory budget for display tiles across all zoom levels
+TILE_CACHE_MB = 96
+
+# Memory budget for tiles re-rendered from the PDF's vector content
+VECTOR_TILE_CACHE_MB = 128
+
+# Spans whose latest timings the status bar shows while tracing
+TRACE_OVERLAY_SPANS = ["render", "edges", "fill", "brush", "display", "paint", "save"]
+
+# How often the status bar timings refresh while tracing
+TRACE_OVERLAY_MS = 250
+
+
+class RegionIndexBuilder(QObject):
+    """Builds region indexes on a background thread.
+
+    OpenCV releases the GIL while labelling, so this does not stall the GUI.
+    Only the most recently requested index is kept; older requests are
+    cancelled or their results dropped.
+    """
+    index_ready = pyqtSignal(int, int, object, object)
+    _finished = pyqtSignal(object, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._job = None
+        self._finished.connect(self._deliver)
+
+    def build(self, page_num, threshold, image, magnitude=None, disk_cache=None):
+        """Start building the index for a page, superseding earlier requests.
+
+        Without a magnitude, one kept in disk_cache (a DocumentCache) is read
+        on the worker thread before computing it from the image.
+        """
+        self.cancel()
+        future = self._executor.submit(self._build, page_num, threshold, image, magnitude,
+                                       disk_cache)
+        job = (page_num, threshold, future)
+        self._job = job
+        future.add_done_callback(lambda f: self._on_done(job, f))
+
+    @staticmethod
+    def _build(page_num, threshold, image, magnitude, disk_cache):
+        if magnitude is None and disk_cache is not None:
+            magnitude = disk_cache.load(page_num, "edges")
+        return build_region_index(image, threshold, magnitude)
+
+    def cancel(self):
+        """Cancel or disown the outstanding request"""
+        if self._job is not None:
+            self._job[2].cancel()
+            self._job = None
+
+    def wait(self, page_num, threshold):
+        """Wait for the outstanding build if it is for this page and threshold.
+
+        Returns its (magnitude, index), or None when no such build is
+        outstanding or it was cancelled.
+        """
+        job = self._job
+        if job is None or job[:2] != (page_num, threshold):
+            return None
+        try:
+            return job[2].result()
+        except CancelledError:
+            return None
+
+    def _on_done(self, job, future):
+        """Forward a finished build (called on the worker thread)"""
+        if not future.cancelled() and self._job is job:
+            self._finished.emit(job, future)
+
+    def _deliver(self, job, future):
+        """Publish a finished build unless it was superseded"""
+        if self._job is not job:
+            return
+        self._job = None
+        if future.exception() is None:
+            magnitude, index = future.result()
+            self.index_ready.emit(job[0], job[1], magnitude, index)
+
+
+def resize_image(image, size, fast=False):
+    """Resize an RGB array to (width, height) for display.
+
+    Fast mode uses nearest-neighbour sampling for use while the user is
+    interacting; otherwise area averaging is used when shrinking and
+    Lanczos when enlarging.
+    """
+    height, width = image.shape[:2]
+    if (width, height) == tuple(size):
+        return image
+    if fast:
+        interpolation = cv2.INTER_NEAREST
+    elif size[0] < width:
+        interpolation = cv2.INTER_AREA
+    else:
+        interpolation = cv2.INTER_LANCZOS4
+    return cv2.resize(image, tuple(size), interpolation=interpolation)
+
+
+def array_to_qimage(image):
+    """Create a QImage over an RGB or RGBA uint8 array without copying its pixels"""
+    image = np.ascontiguousarray(image)
+    height, width, channels = image.shape
+    image_format = QImage.Format.Format_RGBA8888 if channels == 4 else QImage.Format.Format_RGB888
+    qimage = QImage(image.data, width, height, image.strides[0], image_format)
+    # QImage does not own the buffer, so keep the array alive alongside it
+    qimage._array = image
+    return qimage
+
+
+class PageView(QWidget):
+    """Displays a page image by painting cached, fixed-size tiles.
+
+    Tiles are produced on demand for the exposed part of the widget, plus a
+    margin around the viewport, so zooming and scrolling cost scales with
+    the screen rather than the page. Tile edges fall on source pixel
+    boundaries so neighbouring tiles never drift apart.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.image = None
+        self.zoom = 1.0
+        self.fast = False
+        self.tiles = OrderedDict()
+        self.tile_bytes = 0
+        self.max_tile_bytes = TILE_CACHE_MB * 1024 * 1024
+        self.renderer = None
+        self._margin_pending = False
+
+    def tile_source_size(self, zoom=None):
+        """Edge length of a tile in source image pixels at the given zoom"""
+        zoom = self.zoom if zoom is None else zoom
+        return max(16, round(TILE_SIZE / zoom))
+
+    def set_image(self, image, dirty_rect=None):
+        """Show a new page image.
+
+        dirty_rect (x0, y0, x1, y1 in image pixels) limits invalidation to
+        the tiles it touches; without it every tile is dropped.
+        """
+        if dirty_rect is None or self.image is None or image.shape != self.image.shape:
+            self.tiles.clear()
+            self.tile_bytes = 0
+        else:
+            self.invalidate(dirty_rect)
+        self.image = image
+        self._update_size()
+        self.update()
+
+    def clear(self):
+        """Remove the displayed page"""
+        self.image = None
+        self.tiles.clear()
+        self.tile_bytes = 0
+        self.update()
+
+    def set_renderer(self, renderer):
+        """Produce full-quality tiles with renderer instead of scaling the image.
+
+        The renderer is called as renderer(zoom, tx, ty, rect, source_rect,
+        image_crop) and returns an RGB array of the tile's size, or None if
+        it cannot yet, in which case the tile is scaled from the image and
+        asked for again on the next full-quality paint. A renderer of None
+        restores plain scaling of the page image.
+        """
+        self.renderer = renderer
+        self.tiles.clear()
+        self.tile_bytes = 0
+        self.update()
+
+    def set_zoom(self, zoom):
+        """Change the zoom level; tiles of other levels stay cached"""
+        self.zoom = zoom
+        self._update_size()
+        self.update()
+
+    def set_fast(self, fast):
+        """Switch between interactive and full-quality tile scaling"""
+        if self.fast != fast:
+            self.fast = fast
+            if not fast:
+                self.update()
+
+    def invalidate(self, rect):
+        """Drop cached tiles intersecting an image-space rectangle"""
+        x0, y0, x1, y1 = rect
+        for key in list(self.tiles):
+            zoom, tx, ty = key
+            size = self.tile_source_size(zoom)
+            if tx * size < x1 and (tx + 1) * size > x0 and ty * size < y1 and (ty + 1) * size > y0:
+                self.tile_bytes -= self.tiles.pop(key)[0].sizeInBytes()
+
+    def to_image_coords(self, pos):
+        """Map a widget position to image pixel coordinates, or None if outside"""
+        if self.image is None:
+            return None
+        x = int(pos.x() / self.zoom)
+        y = int(pos.y() / self.zoom)
+        height, width = self.image.shape[:2]
+        if 0 <= x < width and 0 <= y < height:
+            return x, y
+        return None
+
+    def tile_rect(self, tx, ty):
+        """Widget-space rectangle covered by a tile at the current zoom"""
+        size = self.tile_source_size()
+        height, width = self.image.shape[:2]
+        x0 = round(tx * size * self.zoom)
+        y0 = round(ty * size * self.zoom)
+        x1 = round(min((tx + 1) * size, width) * self.zoom)
+        y1 = round(min((ty + 1) * size, height) * self.zoom)
+        return QRect(x0, y0, x1 - x0, y1 - y0)
+
+    def tile(self, tx, ty):
+        """Return the QImage for a tile, producing it if needed"""
+        key = (self.zoom, tx, ty)
+        entry = self.tiles.get(key)
+        if entry is not None and not (entry[1] and not self.fast):
+            self.tiles.move_to_end(key)
+            return entry[0]
+        
+        size = self.tile_source_size()
+        source_rect = (tx * size, ty * size, (tx + 1) * size, (ty + 1) * size)
+        crop = self.image[source_rect[1]:source_rect[3], source_rect[0]:source_rect[2]]
+        rect = self.tile_rect(tx, ty)
+        with tracer.span("tile", fast=self.fast):
+            pixels = None
+            if self.renderer is not None and not self.fast:
+                pixels = self.renderer(self.zoom, tx, ty, rect, source_rect, crop)
+                if pixels is None and entry is not None:
+                    # Still a draft, but the one already made will do
+                    self.tiles.move_to_end(key)
+                    return entry[0]
+            draft = self.fast or pixels is None
+            if pixels is None:
+                pixels = resize_image(crop, (rect.width(), rect.height()), self.fast)
+            qimage = array_to_qimage(pixels)
+        
+        if entry is not None:
+            self.tile_bytes -= entry[0].sizeInBytes()
+        self.tiles[key] = (qimage, draft)
+        self.tiles.move_to_end(key)
+        self.tile_bytes += qimage.sizeInBytes()
+        while self.tile_bytes > self.max_tile_bytes and len(self.tiles) > 1:
+            self.tile_bytes -= self.tiles.popitem(last=False)[1][0].sizeInBytes()
+        return qimage
+
+    def tiles_in(self, rect):
+        """Tile indices overlapping a widget-space rectangle"""
+        size = self.tile_source_size() * self.zoom
+        height, width = self.image.shape[:2]
+        last_tx = (width - 1) // self.tile_source_size()
+        last_ty = (height - 1) // self.tile_source_size()
+        tx0 = max(0, int(rect.left() // size))
+        ty0 = max(0, int(rect.top() // size))
+        tx1 = min(last_tx, int(rect.right() // size))
+        ty1 = min(last_ty, int(rect.bottom() // size))
+        return [(tx, ty) for ty in range(ty0, ty1 + 1) for tx in range(tx0, tx1 + 1)]
+
+    def paintEvent(self, event):
+        """Paint the tiles under the exposed region"""
+        painter = QPainter(self)
+        painter.fillRect(event.rect(), self.palette().window())
+        if self.image is None:
+            return
+        with tracer.span("paint"):
+            for tx, ty in self.tiles_in(event.rect()):
+                painter.drawImage(self.tile_rect(tx, ty).topLeft(), self.tile(tx, ty))
+            painter.end()
+        
+        # Fill in the margin once the visible tiles are on screen
+        if not self._margin_pending:
+            self._margin_pending = True
+            QTimer.singleShot(0, self._produce_margin_tiles)
+
+    def _produce_margin_tiles(self):
+        """Produce tiles just outside the viewport ahead of scrolling"""
+        self._margin_pending = False
+        if self.image is None:
+            return
+        margin = round(TILE_MARGIN * TILE_SIZE)
+        visible = self.visibleRegion().boundingRect()
+        for tx, ty in self.tiles_in(visible.adjusted(-margin, -margin, margin, margin)):
+            self.tile(tx, ty)
+
+    def _update_size(self):
+        """Size the widget to the zoomed page"""
+        if self.image is not None:
+            height, width = self.image.shape[:2]
+            self.setFixedSize(max(1, round(width * self.zoom)), max(1, round(height * self.zoom)))
+
+
+class VectorTileRenderer:
+    """Renders display tiles from the PDF's vector content at the exact zoom.
+
+    Each tile is rasterized with a clip rectangle at the display resolution
+    instead of resampling the working raster, so text and line work stay
+    sharp. Base tiles are cached per (page, zoom percent, tile) and edits are
+    composited over them from the working image wherever it differs from
+    the original render.
+
+    PyMuPDF does not support using a document from two threads, so new
+    tiles are only rasterized while can_render() says no engine task can be
+    using the document; until then the view scales the working image.
+    """
+
+    def __init__(self, max_mb=VECTOR_TILE_CACHE_MB, can_render=None):
+        self.tiles = PageCache(max_mb)
+        self.can_render = can_render
+        self.document = None
+        self.page_num = None
+        self.original = None
+        self._display_list = None
+
+    def set_page(self, pdf_document, page_num, original):
+        """Render tiles for a page whose unedited working raster is original"""
+        if page_num != self.page_num or pdf_document is not self.document:
+            # Built with the first tile, when the document is free
+            self._display_list = None
+        self.document = pdf_document
+        self.page_num = page_num
+        self.original = original
+
+    def clear(self):
+        """Forget the current document and its cached tiles"""
+        self.tiles.clear()
+        self.document = None
+        self.page_num = None
+        self.original = None
+        self._display_list = None
+
+    def __call__(self, zoom, tx, ty, rect, source_rect, edited):
+        """Return the RGB tile at rect (view pixels) with edits composited.
+
+        Returns None when the tile cannot be rasterized yet.
+        """
+        key = (self.page_num, round(zoom * 100), tx, ty)
+        base = self.tiles.get(key)
+        if base is None:
+            if self.original is None or (self.can_render is not None and not self.can_render()):
+                return None
+            base = self._render(zoom, rect)
+            self.tiles.put(key, base)
+        
+        x0, y0, x1, y1 = source_rect
+        changed = np.any(edited[..., :3] != self.original[y0:y1, x0:x1], axis=2)
+        if not changed.any():
+            return base
+        
+        size = (rect.width(), rect.height())
+        mask = cv2.resize(changed.view(np.uint8), size, interpolation=cv2.INTER_NEAREST).view(bool)
+        overlay = resize_image(np.ascontiguousarray(edited[..., :3]), size)
+        tile = base.copy()
+        tile[mask] = overlay[mask]
+        return tile
+
+    def _render(self, zoom, rect):
+        """Rasterize the PDF content under a view rectangle"""
+        with tracer.span("vector_tile", zoom=zoom):
+            if self._display_list is None:
+                self._display_list = self.document[self.page_num].get_displaylist()
+            scale = RENDER_ZOOM * zoom
+            clip = fitz.Rect(rect.left(), rect.top(),
+                             rect.left() + rect.width(), rect.top() + rect.height()) / scale
+            pix = self._display_list.get_pixmap(matrix=fitz.Matrix(scale, scale), clip=clip, alpha=False)
+            tile = pixmap_to_array(pix)
+            if tile.shape[:2] != (rect.height(), rect.width()):
+                # Clip rounding can differ from the tile grid by a pixel
+                tile = cv2.resize(tile, (rect.width(), rect.height()), interpolation=cv2.INTER_NEAREST)
+            return tile
+
+
+class PrefetchScheduler(QObject):
+    """Renders pages around the current one in a background process pool.
+
+    PyMuPDF does not support sharing documents between threads, so each
+    worker process opens its own copy of the document. Finished pages are
+    delivered on the GUI thread through the page_ready signal.
+    """
+    page_ready = pyqtSignal(int, object)
+    _finished = pyqtSignal(int, object)
+
+    def __init__(self, max_workers=2, parent=None):
+        super().__init__(parent)
+        self.max_workers = max_workers
+        self._executor = None
+        self._jobs = {}
+        # Renders of pages about to be opened, kept for take() to claim
+        self._requested = {}
+        self._finished.connect(self._deliver)
+
+    def start(self, pdf_path, disk_cache=None):
+        """Start a worker pool for the given document and its DocumentCache"""
+        self.stop()
+        # The workers would inherit sys.path as changed by an unfinished cv2 import
+        preload_modules()
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_open_worker_document,
+            initargs=(pdf_path, disk_cache),
+        )
+
+    def stop(self):
+        """Cancel outstanding jobs and shut the worker pool down"""
+        self._jobs = {}
+        self._requested = {}
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def schedule(self, page_nums):
+        """Render the given pages in order, cancelling any other pending jobs"""
+        if self._executor is None:
+            return
+        wanted = set(page_nums)
+        for page_num, future in list(self._jobs.items()):
+            if page_num not in wanted:
+                future.cancel()
+                del self._jobs[page_num]
+        for page_num in page_nums:
+            if page_num not in self._jobs and page_num not in self._requested:
+                future = self._executor.submit(_render_worker_page, page_num)
+                future.add_done_callback(
+                    lambda f, page_num=page_num: self._on_done(page_num, f)
+                )
+                self._jobs[page_num] = future
+
+    def request(self, page_num):
+        """Render a page about to be opened, ahead of any speculative jobs.
+
+        Only the latest request waits for take(). Earlier ones, superseded
+        by skipping through pages, are cancelled if not started and are
+        otherwise delivered through page_ready like speculative jobs, so
+        their renders count against the page cache budget.
+        """
+        if self._executor is None or page_num in self._requested:
+            return
+        for other, job in list(self._requested.items()):
+            del self._requested[other]
+            if not job.cancel():
+                self._jobs[other] = job
+                job.add_done_callback(lambda f, other=other: self._on_done(other, f))
+        future = self._jobs.pop(page_num, None)
+        # Speculative jobs not yet started are scheduled again after the page opens
+        for other, job in list(self._jobs.items()):
+            if job.cancel():
+                del self._jobs[other]
+        if future is None:
+            future = self._executor.submit(_render_worker_page, page_num)
+        self._requested[page_num] = future
+
+    def take(self, page_num):
+        """Claim a page needed right now.
+
+        Waits for the render if the page was requested or a worker has
+        already started it, otherwise cancels the job and returns None so
+        the caller renders it directly. May be called from a worker thread.
+        """
+        future = self._requested.pop(page_num, None)
+        if future is None:
+            future = self._jobs.pop(page_num, None)
+            if future is None or future.cancel():
+                return None
+        try:
+            return future.result()
+        except Exception:
+            return None
+
+    def _on_done(self, page_num, future):
+        """Forward a finished render (called on an executor thread)"""
+        if not future.cancelled() and self._jobs.get(page_num) is future:
+            # Emitting across threads queues delivery on the GUI thread
+            self._finished.emit(page_num, future)
+
+    def _deliver(self, page_num, future):
+        """Publish a finished render unless it was cancelled or superseded"""
+        # take() may claim the job on a task thread at any time
+        if self._jobs.pop(page_num, None) is not future:
+            return
+        if future.exception() is None:
+            self.page_ready.emit(page_num, future.result())
+
+
+class Task:
+    """A long operation queued on a TaskRunner.
+
+    The function runs on the worker thread and is passed the task, whose
+    report(done, total) publishes progress and stops the function, by
+    raising OperationCancelled, once the task has been cancelled.
+    """
+
+    def __init__(self, runner, label, function, on_done, on_cancel, on_error, key):
+        self.runner = runner
+        self.label = label
+        self.function = function
+        self.on_done = on_done
+        self.on_cancel = on_cancel
+        self.on_error = on_error
+        self.key = key
+        self.cancelled = False
+
+    def report(self, done, total):
+        """Publish progress; raises OperationCancelled once cancelled"""
+        if self.cancelled:
+            raise OperationCancelled()
+        self.runner.progress.emit(done, total)
+
+
+class TaskRunner(QObject):
+    """Runs long engine operations on a worker thread, one at a time.
+
+    OpenCV and NumPy release the GIL, so fills on the worker leave the event
+    loop free. A task starts only after the previous one's result has been
+    applied on the GUI thread, so the engine is used by one thread at a
+    time and results land in the order they were asked for. Callbacks run
+    on the GUI thread: on_done(result) normally, on_cancel(result) if the
+    task was cancelled while running (or with None if it stopped itself),
+    and on_error(exception) if it failed.
+    """
+    busy_changed = pyqtSignal(str)
+    progress = pyqtSignal(int, int)
+    _finished = pyqtSignal(object, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._queue = deque()
+        self._running = None
+        self._finished.connect(self._deliver)
+
+    @property
+    def busy(self):
+        """Whether any task is running or queued"""
+        return self._running is not None or bool(self._queue)
+
+    def submit(self, label, function, on_done=None, on_cancel=None, on_error=None, key=None):
+        """Queue function(task) to run after the tasks already submitted.
+
+        A queued task with the same key, such as an older page change, is
+        superseded and dropped.
+        """
+        if key is not None:
+            self._queue = deque(task for task in self._queue if task.key != key)
+        task = Task(self, label, function, on_done, on_cancel, on_error, key)
+        self._queue.append(task)
+        self._start_next()
+        return task
+
+    def when_idle(self, callback):
+        """Run callback on the GUI thread once the tasks ahead of it are applied"""
+        if not self.busy:
+            callback()
+        else:
+            self.submit("", None, on_done=lambda _: callback())
+
+    def cancel(self):
+        """Drop queued tasks and ask the running one to stop.
+
+        Callbacks queued by when_idle are kept; they apply settings and
+        results rather than doing work, and still run in their turn.
+        """
+        self._queue = deque(task for task in self._queue if task.function is None)
+        if self._running is not None:
+            self._running.cancelled = True
+        else:
+            self.busy_changed.emit("")
+
+    def wait(self):
+        """Process events until every submitted task has been applied"""
+        while self.busy:
+            QCoreApplication.processEvents(QEventLoop.ProcessEventsFlag.WaitForMoreEvents)
+
+    def _start_next(self):
+        """Start the next queued task unless one is running"""
+        while self._running is None and self._queue:
+            task = self._queue.popleft()
+            if task.function is None:
+                # GUI-thread work only needs its turn
+                task.on_done(None)
+                continue
+            self._running = task
+            self.busy_changed.emit(task.label)
+            future = self._executor.submit(task.function, task)
+            future.add_done_callback(lambda f: self._finished.emit(task, f))
+        if not self.busy:
+            self.busy_changed.emit("")
+
+    def _deliver(self, task, future):
+        """Apply a finished task on the GUI thread, then start the next"""
+        self._running = None
+        try:
+            result = future.result()
+        except OperationCancelled:
+            if task.on_cancel is not None:
+                task.on_cancel(None)
+        except Exception as e:
+            if task.on_error is not None:
+                task.on_error(e)
+            else:
+                print(f"{task.label} failed: {e}", flush=True)
+        else:
+            if task.cancelled and task.on_cancel is not None:
+                task.on_cancel(result)
+            elif task.on_done is not None:
+                task.on_done(result)
+        finally:
+            self._start_next()
+
 
 class PDFColorizer(QMainWindow):
-    def __init__(self):
+    def __init__(self, page_cache_mb=DEFAULT_PAGE_CACHE_MB):
         super().__init__()
         self.setWindowTitle("PDF Street Plan Colorizer")
         self.setGeometry(100, 100, 1400, 900)
         
         # State variables
         self.pdf_path = None
-        self.current_page = 0
-        self.total_pages = 0
         self.zoom_level = 1.0
         self.current_color = QColor(255, 0, 0)
-        self.pdf_images = []
-        self.colored_image = None
-        self.original_image = None
+        self.engine = ColorizerEngine(page_cache_mb)
+        self.settings = QSettings(QSettings.Format.IniFormat, QSettings.Scope.UserScope,
+                                  SETTINGS_APPLICATION, SETTINGS_APPLICATION)
+        self.prefetch_pages = DEFAULT_PREFETCH_PAGES
+        self.prefetcher = PrefetchScheduler(parent=self)
+        self.prefetcher.page_ready.connect(self.on_page_prefetched)
+        self.engine.page_source = self.prefetcher.take
+        # Vector tiles wait while a task may be using the document
+        self.vector_renderer = VectorTileRenderer(can_render=lambda: not self.tasks.busy)
+        self.region_builder = RegionIndexBuilder(parent=self)
+        self.region_builder.index_ready.connect(self.on_region_index_ready)
+        self.tasks = TaskRunner(parent=self)
         self.stroke_width = 5
         self.font_size = 20
         self.text_input = ""
@@ -92,6 +743,14 @@ class PDFColorizer(QMainWindow):
         zoom_layout.addWidget(self.zoom_label)
         left_layout.addLayout(zoom_layout)
         
+        self.vector_zoom_checkbox = QCheckBox("Crisp zoom (re-render PDF)")
+        self.vector_zoom_checkbox.setToolTip(
+            "Render the visible area from the PDF at the current zoom instead of "
+            "scaling the working image"
+        )
+        self.vector_zoom_checkbox.toggled.connect(self.on_vector_zoom_toggled)
+        left_layout.addWidget(self.vector_zoom_checkbox)
+        
         # Tool selection
         tool_label = QLabel("Tools:")
         tool_label.setFont(QFont("Arial", 10, QFont.Weight.Bold))
@@ -159,6 +818,22 @@ class PDFColorizer(QMainWindow):
         edge_strength_layout.addWidget(self.edge_strength_value_label)
         left_layout.addLayout(edge_strength_layout)
         
+        # Fill mode: precomputed regions or a flood from the clicked pixel
+        fill_mode_label = QLabel("Fill Mode:")
+        fill_mode_label.setFont(QFont("Arial", 10, QFont.Weight.Bold))
+        left_layout.addWidget(fill_mode_label)
+        
+        self.fill_mode_combo = QComboBox()
+        self.fill_mode_combo.addItems(FILL_MODES)
+        self.fill_mode_combo.setToolTip(
+            "Region Index fills the whole area enclosed by barrier lines instantly, "
+            "ignoring Fill Tolerance.\nExact Flood floods from the clicked pixel "
+            "using Fill Tolerance.\nCoarse-to-Fine fills the same pixels as Exact Flood, "
+            "faster on large open areas."
+        )
+        self.fill_mode_combo.currentTextChanged.connect(self.on_fill_mode_changed)
+        left_layout.addWidget(self.fill_mode_combo)
+        
         # Text input for text tool
         text_label = QLabel("Text Content:")
         text_label.setFont(QFont("Arial", 10, QFont.Weight.Bold))
@@ -191,9 +866,15 @@ class PDFColorizer(QMainWindow):
         left_layout.addWidget(action_label)
         
         self.undo_button = QPushButton("Undo")
+        self.undo_button.setShortcut(QKeySequence.StandardKey.Undo)
         self.undo_button.clicked.connect(self.undo)
         left_layout.addWidget(self.undo_button)
         
+        self.redo_button = QPushButton("Redo")
+        self.redo_button.setShortcut(QKeySequence.StandardKey.Redo)
+        self.redo_button.clicked.connect(self.redo)
+        left_layout.addWidget(self.redo_button)
+        
         self.reset_button = QPushButton("Reset Page")
         self.reset_button.clicked.connect(self.reset_page)
         left_layout.addWidget(self.reset_button)
@@ -202,28 +883,174 @@ class PDFColorizer(QMainWindow):
         self.save_button.clicked.connect(self.save_pdf)
         left_layout.addWidget(self.save_button)
         
+        # Edits are recorded in PDF points, so they can be saved at any resolution
+        dpi_layout = QHBoxLayout()
+        dpi_layout.addWidget(QLabel("Output DPI:"))
+        self.output_dpi_spinbox = QSpinBox()
+        self.output_dpi_spinbox.setMinimum(36)
+        self.output_dpi_spinbox.setMaximum(1200)
+        self.output_dpi_spinbox.setValue(round(RENDER_ZOOM * 72))
+        self.output_dpi_spinbox.setToolTip("Resolution the edits are rendered at when saving")
+        dpi_layout.addWidget(self.output_dpi_spinbox)
+        left_layout.addLayout(dpi_layout)
+        
+        project_layout = QHBoxLayout()
+        self.open_project_button = QPushButton("Open Project")
+        self.open_project_button.clicked.connect(self.open_project)
+        project_layout.addWidget(self.open_project_button)
+        self.save_project_button = QPushButton("Save Project")
+        self.save_project_button.clicked.connect(self.save_project)
+        project_layout.addWidget(self.save_project_button)
+        left_layout.addLayout(project_layout)
+        
+        # Compression used when saving a flattened image PDF
+        raster_label = QLabel("Flattened Export:")
+        raster_label.setFont(QFont("Arial", 10, QFont.Weight.Bold))
+        left_layout.addWidget(raster_label)
+        
+        self.raster_compression_combo = QComboBox()
+        self.raster_compression_combo.addItems(RASTER_COMPRESSIONS)
+        self.raster_compression_combo.setToolTip(
+            "Flate is lossless.\nJPEG is smallest for scanned or shaded pages.\n"
+            "Palette stores up to 256 colors and suits flat-colored plans."
+        )
+        left_layout.addWidget(self.raster_compression_combo)
+        
+        quality_layout = QHBoxLayout()
+        quality_layout.addWidget(QLabel("JPEG Quality:"))
+        self.jpeg_quality_spinbox = QSpinBox()
+        self.jpeg_quality_spinbox.setMinimum(10)
+        self.jpeg_quality_spinbox.setMaximum(100)
+        self.jpeg_quality_spinbox.setValue(DEFAULT_JPEG_QUALITY)
+        quality_layout.addWidget(self.jpeg_quality_spinbox)
+        left_layout.addLayout(quality_layout)
+        
+        # Performance settings
+        performance_label = QLabel("Performance:")
+        performance_label.setFont(QFont("Arial", 10, QFont.Weight.Bold))
+        left_layout.addWidget(performance_label)
+        
+        cache_layout = QHBoxLayout()
+        cache_layout.addWidget(QLabel("Page Cache:"))
+        self.cache_spinbox = QSpinBox()
+        self.cache_spinbox.setMinimum(64)
+        self.cache_spinbox.setMaximum(65536)
+        self.cache_spinbox.setSingleStep(64)
+        self.cache_spinbox.setSuffix(" MB")
+        self.cache_spinbox.setValue(self.engine.page_cache.max_bytes // (1024 * 1024))
+        self.cache_spinbox.valueChanged.connect(self.on_cache_size_changed)
+        cache_layout.addWidget(self.cache_spinbox)
+        left_layout.addLayout(cache_layout)
+        
+        prefetch_layout = QHBoxLayout()
+        prefetch_layout.addWidget(QLabel("Prefetch:"))
+        self.prefetch_spinbox = QSpinBox()
+        self.prefetch_spinbox.setMinimum(0)
+        self.prefetch_spinbox.setMaximum(10)
+        self.prefetch_spinbox.setSuffix(" pages")
+        self.prefetch_spinbox.setValue(self.prefetch_pages)
+        self.prefetch_spinbox.valueChanged.connect(self.on_prefetch_changed)
+        prefetch_layout.addWidget(self.prefetch_spinbox)
+        left_layout.addLayout(prefetch_layout)
+        
+        history_layout = QHBoxLayout()
+        history_layout.addWidget(QLabel("Undo History:"))
+        self.history_spinbox = QSpinBox()
+        self.history_spinbox.setMinimum(16)
+        self.history_spinbox.setMaximum(65536)
+        self.history_spinbox.setSingleStep(16)
+        self.history_spinbox.setSuffix(" MB")
+        self.history_spinbox.setValue(self.engine.history.max_bytes // (1024 * 1024))
+        self.history_spinbox.valueChanged.connect(self.on_history_size_changed)
+        history_layout.addWidget(self.history_spinbox)
+        left_layout.addLayout(history_layout)
+        
+        disk_cache_layout = QHBoxLayout()
+        disk_cache_layout.addWidget(QLabel("Disk Cache:"))
+        self.disk_cache_spinbox = QSpinBox()
+        self.disk_cache_spinbox.setMinimum(0)
+        self.disk_cache_spinbox.setMaximum(1048576)
+        self.disk_cache_spinbox.setSingleStep(256)
+        self.disk_cache_spinbox.setSuffix(" MB")
+        self.disk_cache_spinbox.setSpecialValueText("Off")
+        self.disk_cache_spinbox.setValue(0)
+        self.disk_cache_spinbox.setToolTip(
+            "Keep compressed page renders and edge maps between sessions,\n"
+            "so documents opened before skip rendering. Applies to the next PDF opened."
+        )
+        self.disk_cache_spinbox.valueChanged.connect(self.on_disk_cache_changed)
+        self.disk_cache_spinbox.setValue(self.settings.value(DISK_CACHE_SETTING, 0, type=int))
+        disk_cache_layout.addWidget(self.disk_cache_spinbox)
+        left_layout.addLayout(disk_cache_layout)
+        
+        # Renders and edits in memory-mapped files, for plan sets larger than memory
+        self.page_store_checkbox = QCheckBox("Keep pages on disk")
+        self.page_store_checkbox.setToolTip(
+            "Keep page renders and edits in memory-mapped files in the temp directory,\n"
+            "so documents larger than memory open and pages reopen without rendering.\n"
+            "Applies to the next PDF opened."
+        )
+        self.page_store_checkbox.toggled.connect(self.on_page_store_toggled)
+        left_layout.addWidget(self.page_store_checkbox)
+        
+        # Timing spans, shown in the status bar and exportable as a Chrome trace
+        self.trace_checkbox = QCheckBox("Show timings")
+        self.trace_checkbox.setToolTip("Time rendering, edge detection, fills, display and saving")
+        self.trace_checkbox.setChecked(tracer.enabled)
+        self.trace_checkbox.toggled.connect(self.on_trace_toggled)
+        left_layout.addWidget(self.trace_checkbox)
+        
+        self.export_trace_button = QPushButton("Export Trace")
+        self.export_trace_button.clicked.connect(self.export_trace)
+        left_layout.addWidget(self.export_trace_button)
+        
         left_layout.addStretch()
         main_layout.addWidget(left_panel)
         
         # Right panel - Image display
         scroll_area = QScrollArea()
-        scroll_area.setWidgetResizable(True)
         
-        self.image_label = QLabel()
-        self.image_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        self.image_label.setStyleSheet("background-color: gray;")
-        self.image_label.mousePressEvent = self.on_image_click
-        self.image_label.mouseMoveEvent = self.on_mouse_move
-        self.image_label.mouseReleaseEvent = self.on_mouse_release
+        scroll_area.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        scroll_area.setStyleSheet("background-color: gray;")
+        
+        self.page_view = PageView()
+        self.page_view.mousePressEvent = self.on_image_click
+        self.page_view.mouseMoveEvent = self.on_mouse_move
+        self.page_view.mouseReleaseEvent = self.on_mouse_release
         
-        scroll_area.setWidget(self.image_label)
+        scroll_area.setWidget(self.page_view)
         main_layout.addWidget(scroll_area)
         
         # Mouse state tracking
         self.drawing = False
         self.last_x = 0
         self.last_y = 0
-        self.undo_stack = []
+        
+        # Redraws at full quality once interaction pauses
+        self.quality_timer = QTimer(self)
+        self.quality_timer.setSingleShot(True)
+        self.quality_timer.setInterval(DISPLAY_IDLE_MS)
+        self.quality_timer.timeout.connect(lambda: self.set_display_quality(fast=False))
+        
+        # Refreshes the status bar timings while tracing
+        self.trace_timer = QTimer(self)
+        self.trace_timer.setInterval(TRACE_OVERLAY_MS)
+        self.trace_timer.timeout.connect(self.update_trace_overlay)
+        if tracer.enabled:
+            self.trace_timer.start()
+        
+        # Progress of the operation running in the background
+        self.task_label = QLabel()
+        self.task_progress = QProgressBar()
+        self.task_progress.setMaximumWidth(160)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.setShortcut(QKeySequence("Esc"))
+        self.cancel_button.clicked.connect(self.tasks.cancel)
+        for widget in (self.task_label, self.task_progress, self.cancel_button):
+            self.statusBar().addPermanentWidget(widget)
+            widget.hide()
+        self.tasks.busy_changed.connect(self.on_task_busy)
+        self.tasks.progress.connect(self.on_task_progress)
         
     def open_pdf(self):
         """Open a PDF file"""
@@ -236,80 +1063,241 @@ class PDFColorizer(QMainWindow):
             self.load_pdf()
     
     def load_pdf(self):
-        """Load PDF and convert to images"""
-        try:
-            pdf_document = fitz.open(self.pdf_path)
-            self.total_pages = pdf_document.page_count
-            self.page_spinbox.setMaximum(self.total_pages)
-            self.page_label.setText(f"of {self.total_pages}")
-            
-            # Convert all pages to images
-            self.pdf_images = []
-            for page_num in range(self.total_pages):
-                page = pdf_document[page_num]
-                pix = page.get_pixmap(matrix=fitz.Matrix(1.5, 1.5))
-                ppm_data = pix.tobytes("ppm")
-                img = Image.open(io.BytesIO(ppm_data))
-                self.pdf_images.append(img.convert("RGB"))
-            
-            pdf_document.close()
-            self.current_page = 0
-            self.undo_stack = []
-            self.display_page()
-            
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to load PDF: {str(e)}")
+        """Open the PDF; pages are rendered on demand as they are viewed"""
+        # Background work for the previous document must not reach this one
+        self.tasks.cancel()
+        self.prefetcher.stop()
+        self.region_builder.cancel()
+        # Loading closes the old document and its page store, which the
+        # view's renderer must not map by then
+        self.vector_renderer.clear()
+        self.page_view.clear()
+        pdf_path = self.pdf_path
+        self.tasks.submit("Opening PDF", lambda task: self.engine.load(pdf_path),
+                          on_done=lambda _: self.on_pdf_loaded(pdf_path),
+                          on_error=self.on_load_error)
+    
+    def on_pdf_loaded(self, pdf_path):
+        """Show the first page of a document opened in the background"""
+        self.vector_renderer.clear()
+        self.page_spinbox.setMaximum(self.engine.total_pages)
+        self.page_label.setText(f"of {self.engine.total_pages}")
+        
+        self.display_page()
+        self.prefetcher.start(pdf_path, self.engine.document_cache)
+        self.schedule_prefetch()
+    
+    def on_load_error(self, error):
+        """Report a document that failed to open"""
+        QMessageBox.critical(self, "Error", f"Failed to load PDF: {str(error)}")
+        # A file that failed to open leaves the previous document open
+        self.display_page()
+    
+    def close_pdf(self):
+        """Close the open document and drop its cached pages"""
+        # The engine must be idle before its document goes away
+        self.tasks.cancel()
+        self.tasks.wait()
+        self.prefetcher.stop()
+        self.region_builder.cancel()
+        # Views of the old pages go first so the engine can delete its page store
+        self.vector_renderer.clear()
+        self.page_view.clear()
+        self.engine.close()
+    
+    def schedule_prefetch(self):
+        """Queue background renders of the pages around the current one"""
+        engine = self.engine
+        if engine.document is None:
+            return
+        
+        # Never prefetch more pages than the cache can hold beside this one
+        page_bytes = image_nbytes(engine.original_image) if engine.original_image is not None else 1
+        budget_pages = max(0, engine.page_cache.max_bytes // page_bytes - 1)
+        
+        page_nums = []
+        for distance in range(1, self.prefetch_pages + 1):
+            for page_num in (engine.current_page + distance, engine.current_page - distance):
+                if 0 <= page_num < engine.total_pages and not engine.has_page(page_num):
+                    page_nums.append(page_num)
+        self.prefetcher.schedule(page_nums[:budget_pages])
+    
+    def on_page_prefetched(self, page_num, image):
+        """Store a page rendered in the background"""
+        def store():
+            if self.engine.document is not None and not self.engine.has_page(page_num):
+                self.engine.cache_page(page_num, image)
+        if self.engine.page_store is None:
+            self.tasks.when_idle(store)
+        else:
+            # Writing to the page store is disk I/O, kept off the GUI thread
+            self.tasks.submit("", lambda task: store())
     
     def display_page(self):
         """Display the current page"""
-        if not self.pdf_images:
+        engine = self.engine
+        if engine.document is None:
             return
         
-        self.original_image = self.pdf_images[self.current_page].copy()
-        self.colored_image = self.original_image.copy()
+        self.vector_renderer.set_page(engine.document, engine.current_page, engine.original_image)
         self.update_display()
+        self.schedule_region_index()
     
-    def update_display(self):
-        """Update the displayed image with current zoom"""
-        if self.colored_image is None:
+    def schedule_region_index(self):
+        """Build the current page's region index in the background if needed"""
+        engine = self.engine
+        if engine.original_image is None or self.fill_mode_combo.currentText() != "Region Index":
             return
-        
-        try:
-            # Apply zoom
-            new_width = int(self.colored_image.width * self.zoom_level)
-            new_height = int(self.colored_image.height * self.zoom_level)
-            display_image = self.colored_image.resize(
-                (new_width, new_height), Image.Resampling.LANCZOS
-            )
-            
-            # Save to bytes using PNG format
-            from io import BytesIO
-            buffer = BytesIO()
-            display_image.save(buffer, format="PNG")
-            buffer.seek(0)
-            
-            # Load directly into QPixmap
-            pixmap = QPixmap()
-            pixmap.loadFromData(buffer.getvalue(), "PNG")
+        key = (engine.current_page, self.edge_strength_threshold)
+        if key in engine.region_indexes:
+            return
+        # A stored edge map is read from disk by the builder, not here
+        magnitude = engine.edge_cache.edges.get(engine.current_page)
+        self.region_builder.build(*key, engine.original_image, magnitude, engine.document_cache)
+    
+    def on_region_index_ready(self, page_num, threshold, magnitude, index):
+        """Store a region index built in the background"""
+        def store():
+            if self.engine.document is not None:
+                self.engine.store_region_index(page_num, threshold, magnitude, index)
+        self.tasks.when_idle(store)
+    
+    def update_display(self, fast=False, dirty_rect=None):
+        """Push the edited page to the view.
+
+        Interactive updates (brush strokes) pass fast=True to use cheap
+        scaling, and the changed rectangle so only the tiles under it are
+        redrawn; a full-quality redraw follows once input pauses.
+        """
+        with tracer.span("display", fast=fast):
+            if self.engine.colored_image is None:
+                return
             
-            # Set the pixmap
-            self.image_label.setPixmap(pixmap)
-        except Exception as e:
-            print(f"Display error: {e}", flush=True)
-            import traceback
-            traceback.print_exc()
+            try:
+                self.page_view.set_image(self.engine.colored_image, dirty_rect)
+                self.page_view.set_zoom(self.zoom_level)
+                self.set_display_quality(fast)
+            except Exception as e:
+                print(f"Display error: {e}", flush=True)
+                import traceback
+                traceback.print_exc()
+    
+    def set_display_quality(self, fast):
+        """Use fast tile scaling now, and schedule a full-quality redraw"""
+        self.page_view.set_fast(fast)
+        if fast:
+            self.quality_timer.start()
+        else:
+            self.quality_timer.stop()
     
     def on_page_changed(self, value):
-        """Handle page change"""
-        self.current_page = value - 1
-        self.undo_stack = []
+        """Handle page change; edits stay with the page they were made on"""
+        if self.engine.document is None:
+            return
+        page_num = value - 1
+        # PyMuPDF holds the GIL while rendering, so render in a worker process
+        if not self.engine.has_page(page_num):
+            self.prefetcher.request(page_num)
+        # Skipping through pages only opens the last one asked for
+        self.tasks.submit(f"Opening page {value}", lambda task: self.engine.open_page(page_num),
+                          on_done=lambda _: self.on_page_opened(), key="page")
+    
+    def on_page_opened(self):
+        """Show a page opened in the background"""
         self.display_page()
+        self.schedule_prefetch()
+    
+    def on_cache_size_changed(self, value):
+        """Handle page cache budget change"""
+        self.tasks.when_idle(lambda: self.engine.page_cache.set_budget(value))
+    
+    def on_history_size_changed(self, value):
+        """Handle undo history budget change"""
+        self.tasks.when_idle(lambda: self.engine.history.set_budget(value))
+    
+    def on_disk_cache_changed(self, value):
+        """Handle render cache budget change; 0 turns the cache off"""
+        self.settings.setValue(DISK_CACHE_SETTING, value)
+        
+        def apply():
+            if value == 0:
+                self.engine.render_cache = None
+            elif self.engine.render_cache is None:
+                self.engine.render_cache = RenderCache(max_mb=value)
+            else:
+                self.engine.render_cache.set_budget(value)
+        self.tasks.when_idle(apply)
+    
+    def on_page_store_toggled(self, checked):
+        """Choose whether the next document opened keeps its pages on disk"""
+        self.engine.store_dir = tempfile.gettempdir() if checked else None
+    
+    def on_task_busy(self, label):
+        """Show or hide the background operation's progress"""
+        for widget in (self.task_label, self.task_progress, self.cancel_button):
+            widget.setVisible(bool(label))
+        self.task_label.setText(label)
+        # Indeterminate until the task reports progress
+        self.task_progress.setRange(0, 0)
+        if not label:
+            # Tiles drawn while the document was busy can now be rendered
+            self.page_view.update()
+    
+    def on_task_progress(self, done, total):
+        """Show how far the background operation has got"""
+        self.task_progress.setRange(0, total)
+        self.task_progress.setValue(done)
+    
+    def on_trace_toggled(self, checked):
+        """Turn timing spans and their status bar overlay on or off"""
+        tracer.enabled = checked
+        if checked:
+            self.trace_timer.start()
+        else:
+            self.trace_timer.stop()
+            self.statusBar().clearMessage()
+    
+    def update_trace_overlay(self):
+        """Show the latest duration of each main span in the status bar"""
+        timings = [f"{name} {tracer.latest[name]:.1f} ms"
+                   for name in TRACE_OVERLAY_SPANS if name in tracer.latest]
+        self.statusBar().showMessage("  |  ".join(timings) if timings else "Tracing...")
+    
+    def export_trace(self):
+        """Save the recorded timing spans as a Chrome trace"""
+        if not tracer.events:
+            QMessageBox.warning(self, "Trace Error",
+                                "No timings recorded yet; turn on Show timings first")
+            return
+        
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "Export Trace", "", "Chrome Trace (*.json)"
+        )
+        
+        if not file_path:
+            return
+        
+        try:
+            tracer.export(file_path)
+        except Exception as e:
+            print(f"Trace export error: {e}", flush=True)
+            QMessageBox.critical(self, "Trace Error", f"Failed to export trace: {str(e)}")
+    
+    def on_prefetch_changed(self, value):
+        """Handle prefetch distance change"""
+        self.prefetch_pages = value
+        self.schedule_prefetch()
     
     def on_zoom_changed(self, value):
         """Handle zoom change"""
         self.zoom_level = value / 100.0
         self.zoom_label.setText(f"{value}%")
-        self.update_display()
+        self.page_view.set_zoom(self.zoom_level)
+        self.set_display_quality(fast=self.zoom_slider.isSliderDown())
+    
+    def on_vector_zoom_toggled(self, checked):
+        """Switch between scaling the working image and re-rendering the PDF"""
+        self.page_view.set_renderer(self.vector_renderer if checked else None)
     
     def on_width_changed(self, value):
         """Handle stroke width change"""
@@ -325,6 +1313,11 @@ class PDFColorizer(QMainWindow):
         """Handle edge strength threshold change"""
         self.edge_strength_threshold = value
         self.edge_strength_value_label.setText(str(value))
+        self.tasks.when_idle(self.schedule_region_index)
+    
+    def on_fill_mode_changed(self, mode):
+        """Handle fill mode change"""
+        self.tasks.when_idle(self.schedule_region_index)
     
     def choose_color(self):
         """Open color picker dialog"""
@@ -338,61 +1331,37 @@ class PDFColorizer(QMainWindow):
         style = f"background-color: rgb({self.current_color.red()}, {self.current_color.green()}, {self.current_color.blue()});"
         self.color_button.setStyleSheet(style)
     
+    def color_tuple(self):
+        """Current color as the (r, g, b) tuple the engine takes"""
+        return (self.current_color.red(), self.current_color.green(), self.current_color.blue())
+    
     def on_image_click(self, event):
         """Handle mouse click on image"""
-        if self.colored_image is None or self.image_label.pixmap() is None:
+        if self.engine.colored_image is None:
             return
         
-        # Get the pixmap from the label
-        pixmap = self.image_label.pixmap()
-        
-        # Get the actual displayed size of the pixmap in the label
-        # This accounts for scaling and DPI settings
-        actual_pixmap_width = self.image_label.pixmap().width()
-        actual_pixmap_height = self.image_label.pixmap().height()
-        
-        # Get device pixel ratio for DPI-aware scaling
-        dpr = self.image_label.devicePixelRatio()
-        
-        # Calculate the position of the pixmap within the label (accounts for centering)
-        label_width = self.image_label.width()
-        label_height = self.image_label.height()
-        
-        # Calculate offsets due to centering alignment
-        x_offset = (label_width - actual_pixmap_width) / 2
-        y_offset = (label_height - actual_pixmap_height) / 2
-        
-        # Get click position relative to the label
-        click_x = event.pos().x()
-        click_y = event.pos().y()
-        
-        # Subtract the pixmap offset to get position relative to pixmap
-        pixmap_relative_x = click_x - x_offset
-        pixmap_relative_y = click_y - y_offset
-        
-        # Check if click is actually on the pixmap
-        if pixmap_relative_x < 0 or pixmap_relative_y < 0 or \
-           pixmap_relative_x >= actual_pixmap_width or pixmap_relative_y >= actual_pixmap_height:
-            return
-        
-        # Convert from zoomed image coordinates to original image coordinates
-        x = int(pixmap_relative_x / self.zoom_level)
-        y = int(pixmap_relative_y / self.zoom_level)
-        
-        # Bounds checking
-        if x < 0 or y < 0 or x >= self.colored_image.width or y >= self.colored_image.height:
+        # Convert from zoomed view coordinates to original image coordinates
+        position = self.page_view.to_image_coords(event.position())
+        if position is None:
             return
+        x, y = position
         
         tool = self.tool_combo.currentText()
         
         if tool == "Flood Fill (Smart)":
             self.smart_flood_fill(x, y)
         elif tool == "Brush Stroke":
+            # Strokes draw on the GUI thread, so wait for queued fills to land
+            if self.tasks.busy:
+                self.statusBar().showMessage("Busy, try again when the operation finishes", 2000)
+                return
+            # The whole stroke, until the button is released, undoes as one action
+            self.engine.begin_action()
             self.drawing = True
             self.last_x = x
             self.last_y = y
         elif tool == "Rectangle":
-            # Start rectangle (to be implemented with drag)
+            # The rectangle is drawn from here to where the button is released
             self.drawing = True
             self.last_x = x
             self.last_y = y
@@ -401,196 +1370,242 @@ class PDFColorizer(QMainWindow):
     
     def on_mouse_move(self, event):
         """Handle mouse move for brush strokes"""
-        if not self.drawing or self.colored_image is None or self.image_label.pixmap() is None:
+        if not self.drawing or self.engine.colored_image is None:
             return
         
-        # Get the pixmap from the label
-        pixmap = self.image_label.pixmap()
-        
-        # Get the actual displayed size of the pixmap in the label
-        actual_pixmap_width = pixmap.width()
-        actual_pixmap_height = pixmap.height()
-        
-        # Calculate the position of the pixmap within the label (accounts for centering)
-        label_width = self.image_label.width()
-        label_height = self.image_label.height()
-        
-        # Calculate offsets due to centering alignment
-        x_offset = (label_width - actual_pixmap_width) / 2
-        y_offset = (label_height - actual_pixmap_height) / 2
-        
-        # Get mouse position relative to the label
-        mouse_x = event.pos().x()
-        mouse_y = event.pos().y()
-        
-        # Subtract the pixmap offset to get position relative to pixmap
-        pixmap_relative_x = mouse_x - x_offset
-        pixmap_relative_y = mouse_y - y_offset
-        
-        # Check if mouse is on the pixmap
-        if pixmap_relative_x < 0 or pixmap_relative_y < 0 or \
-           pixmap_relative_x >= actual_pixmap_width or pixmap_relative_y >= actual_pixmap_height:
+        # Convert from zoomed view coordinates to original image coordinates
+        position = self.page_view.to_image_coords(event.position())
+        if position is None:
             return
-        
-        # Convert from zoomed image coordinates to original image coordinates
-        x = int(pixmap_relative_x / self.zoom_level)
-        y = int(pixmap_relative_y / self.zoom_level)
+        x, y = position
         
         if self.tool_combo.currentText() == "Brush Stroke":
-            self.undo_stack.append(self.colored_image.copy())
-            draw = ImageDraw.Draw(self.colored_image, 'RGBA')
-            color = (self.current_color.red(), self.current_color.green(), 
-                    self.current_color.blue(), 200)
-            draw.line([(self.last_x, self.last_y), (x, y)], 
-                     fill=color, width=self.stroke_width)
+            dirty_rect = self.engine.brush((self.last_x, self.last_y), (x, y),
+                                           self.color_tuple(), self.stroke_width)
             self.last_x = x
             self.last_y = y
-            self.update_display()
+            self.update_display(fast=True, dirty_rect=dirty_rect)
     
     def on_mouse_release(self, event):
         """Handle mouse release"""
+        if not self.drawing:
+            return
         self.drawing = False
+        if self.tool_combo.currentText() == "Rectangle":
+            position = self.page_view.to_image_coords(event.position())
+            if position is not None:
+                start = (self.last_x, self.last_y)
+                color, width = self.color_tuple(), self.stroke_width
+                self.tasks.when_idle(lambda: self.update_display(
+                    dirty_rect=self.engine.rectangle(start, position, color, width)))
+        else:
+            self.engine.end_action()
     
     def smart_flood_fill(self, x, y):
-        """Perform intelligent flood fill that respects edge strength"""
-        try:
-            self.undo_stack.append(self.colored_image.copy())
-            
-            # Convert image to numpy array for edge detection
-            colored_array = cv2.cvtColor(np.array(self.colored_image), cv2.COLOR_RGBA2BGR)
-            gray = cv2.cvtColor(colored_array, cv2.COLOR_BGR2GRAY)
-            
-            # Detect edges using Sobel for edge magnitude
-            sobelx = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
-            sobely = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
-            edge_magnitude = np.sqrt(sobelx**2 + sobely**2).astype(np.uint8)
-            
-            # Create a barrier mask: edges stronger than threshold act as barriers
-            edge_threshold = self.edge_strength_threshold
-            barrier_mask = (edge_magnitude > edge_threshold).astype(np.uint8) * 255
-            
-            # Convert colored image to BGR for OpenCV flood fill
-            colored_bgr = cv2.cvtColor(np.array(self.colored_image), cv2.COLOR_RGBA2BGR)
-            
-            # Prepare the seed point
-            if 0 <= x < colored_bgr.shape[1] and 0 <= y < colored_bgr.shape[0]:
-                # Check if starting point is on a barrier - if so, don't fill
-                if barrier_mask[y, x] > 200:
-                    return  # Starting point is on a strong edge, don't fill
-                
-                # Use OpenCV's flood fill with mask to respect barriers
-                color = (self.current_color.blue(), self.current_color.green(), 
-                        self.current_color.red())  # BGR format
-                
-                # Create a mask for flood fill (must be 1 pixel larger)
-                mask = np.zeros((colored_bgr.shape[0] + 2, colored_bgr.shape[1] + 2), 
-                               dtype=np.uint8)
-                
-                # Add barrier information to mask
-                mask[1:-1, 1:-1] = barrier_mask
-                
-                tolerance = self.tolerance_spinbox.value()
-                cv2.floodFill(colored_bgr, mask, (x, y), color, 
-                            (tolerance,) * 3, (tolerance,) * 3)
-                
-                # Convert back to RGBA and update
-                result_rgba = cv2.cvtColor(colored_bgr, cv2.COLOR_BGR2RGBA)
-                self.colored_image = Image.fromarray(result_rgba, 'RGBA')
-                self.update_display()
-            
-        except Exception as e:
-            print(f"Smart fill error: {e}", flush=True)
-            if self.undo_stack:
-                self.colored_image = self.undo_stack.pop()
-            QMessageBox.warning(self, "Fill Error", f"Flood fill failed: {str(e)}")
+        """Perform intelligent flood fill that respects edge strength.
+
+        The fill runs on the task thread; clicks made meanwhile queue up
+        and are applied in order.
+        """
+        color = self.color_tuple()
+        tolerance = self.tolerance_spinbox.value()
+        threshold = self.edge_strength_threshold
+        mode = self.fill_mode_combo.currentText()
+        
+        def fill(task):
+            engine = self.engine
+            index = None
+            if mode == "Region Index":
+                # Finish the background build, or build here, rather than flood
+                built = self.region_builder.wait(engine.current_page, threshold)
+                if built is None:
+                    index = engine.region_index(threshold)
+                else:
+                    index = built[1]
+                    engine.store_region_index(engine.current_page, threshold, *built)
+            return engine.flood_fill(x, y, color, tolerance=tolerance, threshold=threshold,
+                                     use_index=index is not None,
+                                     coarse=mode == "Coarse-to-Fine", index=index)
+        
+        self.tasks.submit(
+            "Filling",
+            fill,
+            on_done=self.on_fill_done,
+            on_cancel=self.on_fill_cancelled,
+            on_error=self.on_fill_error,
+        )
+    
+    def on_fill_done(self, dirty_rect):
+        """Show a fill finished in the background"""
+        if dirty_rect is not None:
+            self.update_display(dirty_rect=dirty_rect)
+    
+    def on_fill_cancelled(self, dirty_rect):
+        """Take back a fill that finished after it was cancelled"""
+        if dirty_rect is not None:
+            self.update_display(dirty_rect=self.engine.revert_action())
+    
+    def on_fill_error(self, error):
+        """Report a fill that failed in the background"""
+        print(f"Smart fill error: {error}", flush=True)
+        QMessageBox.warning(self, "Fill Error", f"Flood fill failed: {str(error)}")
     
     def add_text(self, x, y):
         """Add text to the image at the specified coordinates"""
-        try:
-            text = self.text_input_field.toPlainText().strip()
-            
-            if not text:
-                QMessageBox.warning(self, "Text Error", "Please enter some text first")
-                return
-            
-            self.undo_stack.append(self.colored_image.copy())
-            
-            # Try to use a system font, fallback to default
+        text = self.text_input_field.toPlainText().strip()
+        
+        if not text:
+            QMessageBox.warning(self, "Text Error", "Please enter some text first")
+            return
+        
+        color, font_size = self.color_tuple(), self.font_size
+        
+        def draw():
             try:
-                font = ImageFont.truetype("arial.ttf", self.font_size)
-            except:
-                try:
-                    font = ImageFont.truetype("C:\\Windows\\Fonts\\arial.ttf", self.font_size)
-                except:
-                    # Use default font if Arial is not available
-                    font = ImageFont.load_default()
-            
-            # Draw text on the image
-            draw = ImageDraw.Draw(self.colored_image, 'RGBA')
-            color = (self.current_color.red(), self.current_color.green(), 
-                    self.current_color.blue(), 255)
-            
-            draw.text((x, y), text, fill=color, font=font)
-            self.update_display()
-            
-        except Exception as e:
-            print(f"Text error: {e}", flush=True)
-            if self.undo_stack:
-                self.colored_image = self.undo_stack.pop()
-            QMessageBox.warning(self, "Text Error", f"Failed to add text: {str(e)}")
+                dirty_rect = self.engine.add_text(x, y, text, color, font_size)
+                self.update_display(dirty_rect=dirty_rect)
+            except Exception as e:
+                print(f"Text error: {e}", flush=True)
+                QMessageBox.warning(self, "Text Error", f"Failed to add text: {str(e)}")
+        
+        self.tasks.when_idle(draw)
     
     def undo(self):
         """Undo last action"""
-        if self.undo_stack:
-            self.colored_image = self.undo_stack.pop()
-            self.update_display()
+        if self.drawing:
+            return
+        self.tasks.when_idle(lambda: self.show_change(self.engine.undo()))
+    
+    def redo(self):
+        """Redo the last undone action"""
+        if self.drawing:
+            return
+        self.tasks.when_idle(lambda: self.show_change(self.engine.redo()))
+    
+    def show_change(self, dirty_rect):
+        """Redraw the part of the page an edit changed, if any"""
+        if dirty_rect is not None:
+            self.update_display(dirty_rect=dirty_rect)
     
     def reset_page(self):
         """Reset current page to original"""
-        if self.original_image:
-            self.colored_image = self.original_image.copy()
-            self.undo_stack = []
-            self.update_display()
+        def reset():
+            if self.engine.original_image is not None:
+                self.engine.reset_page()
+                self.update_display()
+        self.tasks.when_idle(reset)
     
     def save_pdf(self):
         """Save colored PDF"""
-        if not self.pdf_images or not self.colored_image:
+        if self.engine.document is None or self.engine.colored_image is None:
+            QMessageBox.warning(self, "Save Error", "No PDF loaded")
+            return
+        
+        vector_filter = "PDF - keep vectors (*.pdf)"
+        file_path, selected_filter = QFileDialog.getSaveFileName(
+            self, "Save PDF", "", f"{vector_filter};;PDF - flattened image (*.pdf)"
+        )
+        
+        if not file_path:
+            return
+        
+        dpi = self.output_dpi_spinbox.value()
+        output_format = "vector" if selected_filter == vector_filter else "raster"
+        compression = self.raster_compression_combo.currentText()
+        quality = self.jpeg_quality_spinbox.value()
+        
+        def save(task):
+            engine = self.engine
+            if dpi != round(engine.zoom * 72):
+                # Replay the recorded edits on pages rendered at the output resolution
+                engine.preserve_source(file_path)
+                export_operations(engine.source_path, engine.operations, file_path, dpi,
+                                  output_format, compression, quality, task.report)
+            elif output_format == "vector":
+                engine.save_overlay(file_path, task.report)
+            else:
+                engine.save_raster(file_path, compression, quality, progress=task.report)
+        
+        self.tasks.submit(
+            "Saving PDF", save,
+            on_done=lambda _: QMessageBox.information(self, "Success", f"PDF saved to {file_path}"),
+            on_error=self.on_save_error,
+        )
+    
+    def on_save_error(self, error):
+        """Report a save that failed in the background"""
+        print(f"Save error: {error}", flush=True)
+        QMessageBox.critical(self, "Save Error", f"Failed to save PDF: {str(error)}")
+    
+    def save_project(self):
+        """Save the recorded edits, which reference the PDF, as a project file"""
+        if self.engine.document is None:
             QMessageBox.warning(self, "Save Error", "No PDF loaded")
             return
         
         file_path, _ = QFileDialog.getSaveFileName(
-            self, "Save PDF", "", "PDF Files (*.pdf)"
+            self, "Save Project", "", "PDF Colorizer Project (*.json)"
         )
         
         if not file_path:
             return
         
+        def save():
+            try:
+                self.engine.save_project(file_path)
+            except Exception as e:
+                print(f"Project save error: {e}", flush=True)
+                QMessageBox.critical(self, "Save Error", f"Failed to save project: {str(e)}")
+        
+        self.tasks.when_idle(save)
+    
+    def open_project(self):
+        """Open a project's PDF and replay its edits"""
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "Open Project", "", "PDF Colorizer Project (*.json)"
+        )
+        
+        if file_path:
+            self.load_project(file_path)
+    
+    def load_project(self, file_path):
+        """Load the project's PDF and replay its recorded edits"""
         try:
-            # Convert all PIL images to PDF
-            images = []
-            for idx, img in enumerate(self.pdf_images):
-                if idx == self.current_page:
-                    images.append(self.colored_image.convert("RGB"))
-                else:
-                    images.append(img.convert("RGB"))
-            
-            # Save as PDF using PIL
-            images[0].save(
-                file_path,
-                save_all=True,
-                append_images=images[1:] if len(images) > 1 else []
-            )
-            QMessageBox.information(self, "Success", f"PDF saved to {file_path}")
-            
+            self.pdf_path, operations = read_project(file_path)
         except Exception as e:
-            print(f"Save error: {e}", flush=True)
-            QMessageBox.critical(self, "Save Error", f"Failed to save PDF: {str(e)}")
+            QMessageBox.critical(self, "Error", f"Failed to open project: {str(e)}")
+            return
+        
+        self.load_pdf()
+        
+        def replay(task):
+            # Nothing to replay onto if the PDF failed to open
+            if self.engine.document is not None:
+                self.engine.replay(operations, task.report)
+        
+        self.tasks.submit("Replaying project", replay,
+                          on_done=lambda _: self.display_page(),
+                          on_cancel=lambda _: self.display_page(),
+                          on_error=self.on_replay_error)
+    
+    def on_replay_error(self, error):
+        """Report a project whose edits failed to replay"""
+        print(f"Project replay error: {error}", flush=True)
+        QMessageBox.critical(self, "Error", f"Failed to replay project: {str(error)}")
+        self.display_page()
+    
+    def closeEvent(self, event):
+        """Release the open document when the window closes"""
+        self.close_pdf()
+        super().closeEvent(event)
 
 
 def main():
     app = QApplication(sys.argv)
     window = PDFColorizer()
     window.show()
+    # Load OpenCV, PyMuPDF and friends while the user picks a file
+    QTimer.singleShot(0, lambda: threading.Thread(target=preload_modules, daemon=True).start())
     sys.exit(app.exec())
 
 
@@ -11,7 +11,8 @@ setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     url="https://github.com/TimothyOgden/pdf-colorizer",
-    packages=find_packages(),
+    packages=find_packages(exclude=["tests", "tests.*", "benchmarks", "benchmarks.*"]),
+    py_modules=["pdf_colorizer", "colorizer_engine", "colorizer_batch", "colorizer_trace"],
     classifiers=[
         "Programming Language :: Python :: 3",
         "Programming Language :: Python :: 3.9",
@@ -34,6 +35,7 @@ setup(
     entry_points={
         "console_scripts": [
             "pdf-colorizer=pdf_colorizer:main",
+            "pdf-colorizer-batch=colorizer_batch:main",
         ],
     },
 )
@@ -1,7 +1,11 @@
+import os
 import pytest
 import sys
 from pathlib import Path
 
+# Allow the Qt window to be created on machines without a display
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
 # Add the project root to the path
 project_root = Path(__file__).parent
 sys.path.insert(0, str(project_root))
@@ -19,6 +23,49 @@ def sample_pdf_path(tmp_path):
     return tmp_path / "test.pdf"
 
 
+@pytest.fixture(autouse=True)
+def render_cache_dir(tmp_path, monkeypatch):
+    """Fixture keeping each test's render cache out of the user's cache directory"""
+    path = tmp_path / "render-cache"
+    monkeypatch.setenv("PDF_COLORIZER_CACHE", str(path))
+    return path
+
+
+@pytest.fixture(autouse=True)
+def settings_dir(tmp_path):
+    """Fixture keeping each test's saved settings out of the user's config directory"""
+    from PyQt6.QtCore import QSettings
+    path = tmp_path / "settings"
+    QSettings.setPath(QSettings.Format.IniFormat, QSettings.Scope.UserScope, str(path))
+    return path
+
+
+@pytest.fixture(scope="session")
+def qapp():
+    """Fixture providing the QApplication required by window tests"""
+    from PyQt6.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication([])
+    yield app
+
+
+@pytest.fixture
+def street_plan_pdf(tmp_path):
+    """Fixture providing a small multi-page PDF resembling a street plan"""
+    import fitz
+    path = tmp_path / "street_plan.pdf"
+    doc = fitz.open()
+    for page_num in range(3):
+        page = doc.new_page(width=400, height=300)
+        # Building outlines act as fill barriers
+        page.draw_rect(fitz.Rect(40, 40, 180, 140), color=(0, 0, 0), width=2)
+        page.draw_rect(fitz.Rect(220, 40, 360, 140), color=(0, 0, 0), width=2)
+        page.draw_line(fitz.Point(0, 200), fitz.Point(400, 200), color=(0, 0, 0), width=2)
+        page.insert_text(fitz.Point(50, 260), f"Page {page_num + 1}", fontsize=12)
+    doc.save(str(path))
+    doc.close()
+    return path
+
+
 def pytest_configure(config):
     """Configure pytest with custom markers"""
     config.addinivalue_line(
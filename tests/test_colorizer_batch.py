@@ -0,0 +1,138 @@
+import json
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add the project directory to the path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+# Seeds in PDF points: inside the left building, and on its outline
+SPEC = {
+    "threshold": 50,
+    "fills": [
+        {"pages": "*", "seed": [100, 80], "color": "#ff0000"},
+        {"pages": [2], "seed": [300, 80], "color": [0, 0, 255], "mode": "region"},
+        {"pages": [3], "seed": [40, 40], "color": "#00ff00"},
+    ],
+}
+
+
+class TestFillSpec:
+    """Test parsing of batch fill specifications"""
+    
+    def test_settings_are_resolved(self):
+        """Test that fills inherit top-level settings and parse colors"""
+        from colorizer_batch import fills_for_page, load_spec
+        fills = load_spec(SPEC)
+        assert fills[0]["color"] == (255, 0, 0)
+        assert fills[0]["threshold"] == 50 and fills[0]["tolerance"] == 30
+        assert fills[1]["pages"] == {2} and fills[1]["mode"] == "region"
+        assert [f["color"] for f in fills_for_page(fills, 1)] == [(255, 0, 0), (0, 0, 255)]
+    
+    @pytest.mark.parametrize("fill", [
+        {"seed": [1, 2]},
+        {"seed": [1], "color": "#ff0000"},
+        {"seed": [1, 2], "color": "red"},
+        {"seed": [1, 2], "color": [0, 0, 300]},
+        {"seed": [1, 2], "color": "#ff0000", "mode": "magic"},
+    ])
+    def test_invalid_fills_are_rejected(self, fill):
+        """Test that malformed fills raise ValueError"""
+        from colorizer_batch import load_spec
+        with pytest.raises(ValueError):
+            load_spec({"fills": [fill]})
+
+
+class TestBatchRun:
+    """Test colorizing several files in the process pool"""
+    
+    @pytest.fixture
+    def plan_set(self, street_plan_pdf, tmp_path):
+        paths = []
+        for name in ("north", "south"):
+            path = tmp_path / f"{name}.pdf"
+            shutil.copy(street_plan_pdf, path)
+            paths.append(path)
+        return paths
+    
+    def test_vector_outputs(self, plan_set, tmp_path):
+        """Test that every page of every file gets its fills"""
+        import fitz
+        from colorizer_batch import load_spec, run_batch
+        lines = []
+        results = run_batch(plan_set, load_spec(SPEC), tmp_path / "out",
+                            max_workers=2, report=lines.append)
+        assert [r["error"] for r in results] == [None, None]
+        assert len(lines) == 2 and "3 pages" in lines[0]
+        
+        for result in results:
+            with fitz.open(result["output"]) as doc:
+                assert "Page 1" in doc[0].get_text()
+                pixmaps = [page.get_pixmap() for page in doc]
+            assert all(pix.pixel(100, 80) == (255, 0, 0) for pix in pixmaps)
+            assert pixmaps[1].pixel(300, 80) == (0, 0, 255)
+            assert pixmaps[0].pixel(300, 80) == (255, 255, 255)
+    
+    def test_pages_without_fills_are_not_rendered(self, plan_set, tmp_path):
+        """Test that vector pages no fill applies to are copied as they are"""
+        import fitz
+        from colorizer_batch import _process_page, load_spec, run_batch
+        assert _process_page(str(tmp_path / "missing.pdf"), 0, [], "vector", "Flate", 85) is None
+        
+        spec = {"fills": [{"pages": [2], "seed": [100, 80], "color": "#ff0000"}]}
+        results = run_batch(plan_set[:1], load_spec(spec), tmp_path / "out",
+                            max_workers=1, report=lambda line: None)
+        assert results[0]["error"] is None
+        with fitz.open(results[0]["output"]) as doc:
+            assert doc.page_count == 3
+            pixmaps = [page.get_pixmap() for page in doc]
+        assert [pix.pixel(100, 80) for pix in pixmaps] == [
+            (255, 255, 255), (255, 0, 0), (255, 255, 255)]
+    
+    def test_raster_output_and_bad_file(self, plan_set, tmp_path):
+        """Test flattened output and that an unreadable file is reported"""
+        import fitz
+        from colorizer_batch import load_spec, run_batch
+        broken = tmp_path / "broken.pdf"
+        broken.write_bytes(b"not a pdf")
+        results = run_batch([broken, plan_set[0]], load_spec(SPEC), tmp_path / "out",
+                            output_format="raster", max_workers=2, report=lambda line: None)
+        assert results[0]["error"] is not None
+        assert results[1]["error"] is None
+        with fitz.open(results[1]["output"]) as doc:
+            assert doc.page_count == 3
+            assert doc[0].get_text() == ""
+            assert doc[2].get_pixmap().pixel(100, 80) == (255, 0, 0)
+    
+    def test_clashing_outputs_are_reported(self, plan_set, tmp_path):
+        """Test that inputs writing the same output fail instead of overwriting"""
+        from colorizer_batch import load_spec, run_batch
+        other = tmp_path / "other" / "north.pdf"
+        other.parent.mkdir()
+        shutil.copy(plan_set[1], other)
+        lines = []
+        results = run_batch([plan_set[0], other, plan_set[0]], load_spec(SPEC),
+                            tmp_path / "out", max_workers=2, report=lines.append)
+        assert results[0]["error"] is None
+        assert str(plan_set[0]) in results[1]["error"]
+        assert str(plan_set[0]) in results[2]["error"]
+        assert sum("skipped" in line for line in lines) == 2
+        assert results[0]["pages"] == 3
+    
+    def test_command_line(self, plan_set, tmp_path):
+        """Test the CLI end to end without loading Qt"""
+        spec_path = tmp_path / "spec.json"
+        spec_path.write_text(json.dumps(SPEC))
+        code = ("import sys, colorizer_batch; status = colorizer_batch.main(sys.argv[1:]); "
+                "assert not any(m.startswith('PyQt6') for m in sys.modules); sys.exit(status)")
+        result = subprocess.run(
+            [sys.executable, "-c", code, str(spec_path), *map(str, plan_set),
+             "-o", str(tmp_path / "cli"), "--workers", "2"],
+            capture_output=True, text=True, cwd=str(Path(__file__).parent.parent),
+        )
+        assert result.returncode == 0, result.stderr
+        assert "2 of 2 file(s), 6 pages" in result.stdout
+        assert (tmp_path / "cli" / "north_colored.pdf").exists()
@@ -0,0 +1,536 @@
+import subprocess
+import sys
+from pathlib import Path
+
+# Add the project directory to the path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+RED = (255, 0, 0)
+
+
+class TestHeadlessEngine:
+    """Test driving the colorizer engine without a GUI"""
+    
+    def test_engine_does_not_import_qt(self):
+        """Test that importing the engine leaves PyQt6 unloaded"""
+        code = "import sys, colorizer_engine; print(any(m.startswith('PyQt6') for m in sys.modules))"
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                cwd=str(Path(__file__).parent.parent), check=True)
+        assert result.stdout.split()[-1] == "False"
+    
+    def test_load_renders_first_page(self, street_plan_pdf):
+        """Test that loading opens the first page for editing"""
+        from colorizer_engine import ColorizerEngine
+        engine = ColorizerEngine()
+        engine.load(str(street_plan_pdf))
+        assert engine.total_pages == 3
+        assert engine.current_page == 0
+        assert engine.colored_image.shape == (450, 600, 3)
+        engine.close()
+        assert engine.document is None
+    
+    def test_fill_both_modes_agree(self, street_plan_pdf):
+        """Test that the exact flood and the region index fill the same building"""
+        import numpy as np
+        from colorizer_engine import ColorizerEngine
+        engine = ColorizerEngine()
+        engine.load(str(street_plan_pdf))
+        
+        rect = engine.flood_fill(150, 120, RED, tolerance=0, threshold=50, use_index=False)
+        assert rect is not None
+        flooded = engine.colored_image.copy()
+        engine.undo()
+        
+        engine.region_index(50)
+        engine.flood_fill(150, 120, RED, threshold=50)
+        indexed = engine.colored_image
+        assert np.array_equal(indexed, flooded)
+        assert engine.flood_fill(60, 60, RED, threshold=50) is None
+        engine.close()
+    
+    def test_seed_off_page_fills_nothing(self, street_plan_pdf):
+        """Test that seeds outside the page are ignored by every fill mode"""
+        import numpy as np
+        from colorizer_engine import ColorizerEngine
+        engine = ColorizerEngine()
+        engine.load(str(street_plan_pdf))
+        before = engine.colored_image.copy()
+        height, width = before.shape[:2]
+        
+        engine.region_index(50)
+        for x, y in [(-5, -5), (width, 10), (10, height), (-1, 100)]:
+            for use_index, coarse in [(True, False), (False, False), (False, True)]:
+                assert engine.flood_fill(x, y, RED, use_index=use_index, coarse=coarse) is None
+        assert np.array_equal(engine.colored_image, before)
+        assert engine.region_indexes.get((0, 50)).region_at(width, 0) is None
+        engine.close()
+    
+    def test_brush_stroke_and_text_undo(self, street_plan_pdf):
+        """Test that a stroke undoes as one action and text is drawn"""
+        import numpy as np
+        from colorizer_engine import ColorizerEngine
+        engine = ColorizerEngine()
+        engine.load(str(street_plan_pdf))
+        before = engine.colored_image.copy()
+        
+        rect = engine.brush_stroke([(300, 320), (350, 330), (400, 320)], (0, 0, 255), width=6)
+        assert rect[0] <= 300 and rect[2] >= 400
+        engine.add_text(100, 350, "Block A", (0, 128, 0), font_size=24)
+        assert engine.undo() is not None
+        assert engine.undo() is not None
+        assert np.array_equal(engine.colored_image, before)
+        assert engine.undo() is None
+        engine.close()
+    
+    def test_tools_edit_one_buffer_in_place(self, street_plan_pdf):
+        """Test that every tool edits the same contiguous RGB array"""
+        import numpy as np
+        from colorizer_engine import ColorizerEngine
+        engine = ColorizerEngine()
+        engine.load(str(street_plan_pdf))
+        buffer = engine.colored_image
+        assert buffer.dtype == np.uint8 and buffer.shape == (450, 600, 3)
+        assert buffer.flags.c_contiguous and buffer.flags.writeable
+        assert not np.shares_memory(buffer, engine.original_image)
+        
+        engine.flood_fill(150, 120, RED, use_index=False)
+        engine.region_index(50)
+        engine.flood_fill(450, 120, RED)
+        engine.brush_stroke([(300, 260), (400, 260)], (0, 0, 255), 5)
+        engine.rectangle((300, 300), (400, 360), (0, 0, 255), 3)
+        engine.add_text(100, 350, "Block A", (0, 128, 0), font_size=24)
+        engine.undo()
+        engine.reset_page()
+        assert engine.colored_image is buffer
+        engine.close()
+    
+    def test_strokes_blend_over_fills(self, street_plan_pdf):
+        """Test that a translucent stroke blends the same over filled pixels"""
+        from colorizer_engine import ColorizerEngine
+        engine = ColorizerEngine()
+        engine.load(str(street_plan_pdf))
+        engine.flood_fill(150, 120, RED, use_index=False)
+        engine.brush_stroke([(100, 120), (200, 120)], (0, 0, 255), 5)
+        # Alpha 200 of blue over red
+        assert tuple(engine.colored_image[120, 150]) == (55, 0, 200)
+        engine.close()
+    
+    def test_edits_saved_from_engine(self, street_plan_pdf, tmp_path):
+        """Test that edits on several pages reach a vector save"""
+        import fitz
+        from colorizer_engine import ColorizerEngine
+        engine = ColorizerEngine()
+        engine.load(str(street_plan_pdf))
+        engine.flood_fill(150, 120, RED, use_index=False)
+        engine.open_page(2)
+        engine.flood_fill(450, 120, RED, use_index=False)
+        assert engine.dirty_pages == {0, 2}
+        
+        output = tmp_path / "colored.pdf"
+        engine.save_overlay(str(output))
+        engine.close()
+        with fitz.open(str(output)) as doc:
+            assert doc[0].get_pixmap().pixel(100, 80) == RED
+            assert doc[1].get_images() == []
+            assert doc[2].get_pixmap().pixel(300, 80) == RED
+
+
+class TestOperationLog:
+    """Test recording edits in PDF points and replaying them"""
+    
+    def test_operations_recorded_in_points(self, street_plan_pdf):
+        """Test that each action logs one operation and undo/redo move it"""
+        from colorizer_engine import ColorizerEngine
+        engine = ColorizerEngine()
+        engine.load(str(street_plan_pdf))
+        engine.flood_fill(150, 120, RED, tolerance=0, threshold=50, use_index=False)
+        engine.brush_stroke([(300, 321), (351, 330), (402, 321)], RED, width=6)
+        engine.rectangle((30, 30), (90, 60), RED, width=3)
+        
+        fill, stroke, rectangle = engine.operations[0]
+        assert fill == {"tool": "fill", "seed": [100.0, 80.0], "color": [255, 0, 0],
+                        "tolerance": 0, "threshold": 50, "mode": "flood"}
+        assert stroke["points"] == [[200.0, 214.0], [234.0, 220.0], [268.0, 214.0]]
+        assert stroke["width"] == 4.0
+        assert rectangle["rect"] == [20.0, 20.0, 60.0, 40.0]
+        
+        engine.undo()
+        engine.undo()
+        assert engine.operations[0] == [fill]
+        engine.redo()
+        assert engine.operations[0] == [fill, stroke]
+        engine.reset_page()
+        assert 0 not in engine.operations
+        engine.close()
+    
+    def test_project_round_trip(self, street_plan_pdf, tmp_path):
+        """Test that a saved project replays to the same pixels"""
+        import json
+        import numpy as np
+        from colorizer_engine import ColorizerEngine
+        engine = ColorizerEngine()
+        engine.load(str(street_plan_pdf))
+        engine.open_page(1)
+        engine.flood_fill(150, 120, RED, use_index=False)
+        engine.add_text(100, 350, "Block A", (0, 128, 0), font_size=24)
+        expected = engine.colored_image.copy()
+        
+        project = tmp_path / "plan.json"
+        engine.save_project(str(project))
+        engine.close()
+        assert list(json.loads(project.read_text())["pages"]) == ["2"]
+        
+        engine = ColorizerEngine()
+        engine.load_project(str(project))
+        assert engine.current_page == 0
+        engine.open_page(1)
+        assert np.array_equal(engine.colored_image, expected)
+        assert len(engine.operations[1]) == 2
+        engine.close()
+    
+    def test_region_fill_replays_over_index_budget(self, street_plan_pdf):
+        """Test that a region fill replays as one even if its index is never cached"""
+        import numpy as np
+        from colorizer_engine import ColorizerEngine, PageCache
+        operation = {"tool": "fill", "seed": [100, 80], "color": list(RED),
+                     "tolerance": 0, "threshold": 50, "mode": "region"}
+        filled = []
+        for budget_mb in (256, 0):
+            engine = ColorizerEngine()
+            engine.region_indexes = PageCache(budget_mb)
+            engine.load(str(street_plan_pdf))
+            engine.apply_operation(operation)
+            filled.append(engine.colored_image.copy())
+            assert engine.operations[0][0]["mode"] == "region"
+            engine.close()
+        assert np.array_equal(filled[0], filled[1])
+    
+    def test_replay_at_higher_resolution(self, street_plan_pdf, tmp_path):
+        """Test that operations replayed at twice the zoom land at doubled pixels"""
+        import fitz
+        from colorizer_engine import ColorizerEngine, RENDER_ZOOM, export_operations
+        engine = ColorizerEngine()
+        engine.load(str(street_plan_pdf))
+        engine.flood_fill(150, 120, RED, use_index=False)
+        operations = engine.operations
+        engine.close()
+        
+        sharp = ColorizerEngine(zoom=2 * RENDER_ZOOM)
+        sharp.load(str(street_plan_pdf))
+        sharp.replay(operations)
+        assert sharp.colored_image.shape == (900, 1200, 3)
+        assert tuple(sharp.colored_image[240, 300]) == RED
+        sharp.close()
+        
+        output = tmp_path / "sharp.pdf"
+        export_operations(str(street_plan_pdf), operations, str(output), dpi=216)
+        with fitz.open(str(output)) as doc:
+            assert doc[0].get_pixmap().pixel(100, 80) == RED
+    
+    def test_unknown_tool_rejected(self, street_plan_pdf):
+        """Test that replaying an unknown operation raises"""
+        import pytest
+        from colorizer_engine import ColorizerEngine
+        engine = ColorizerEngine()
+        engine.load(str(street_plan_pdf))
+        with pytest.raises(ValueError):
+            engine.apply_operation({"tool": "lasso", "color": [0, 0, 0]})
+        engine.close()
+    
+    def test_cancelled_save_leaves_no_file(self, street_plan_pdf, tmp_path):
+        """Test that stopping a save from its progress callback writes nothing"""
+        import pytest
+        from colorizer_engine import ColorizerEngine, OperationCancelled
+        engine = ColorizerEngine()
+        engine.load(str(street_plan_pdf))
+        engine.flood_fill(150, 120, RED, use_index=False)
+        engine.open_page(1)
+        engine.flood_fill(450, 120, RED, use_index=False)
+        
+        reports = []
+        
+        def cancel(done, total):
+            reports.append((done, total))
+            raise OperationCancelled()
+        
+        for save in (engine.save_overlay, engine.save_raster):
+            output = tmp_path / f"{save.__name__}.pdf"
+            with pytest.raises(OperationCancelled):
+                save(str(output), progress=cancel)
+            assert not output.exists()
+        assert reports == [(1, 2), (1, 3)]
+        engine.close()
+    
+    def test_revert_action_leaves_nothing_to_redo(self, street_plan_pdf):
+        """Test that a reverted fill is gone from the image, log and redo stack"""
+        from colorizer_engine import ColorizerEngine
+        engine = ColorizerEngine()
+        engine.load(str(street_plan_pdf))
+        engine.flood_fill(150, 120, RED, use_index=False)
+        assert engine.revert_action() is not None
+        assert tuple(engine.colored_image[120, 150]) == (255, 255, 255)
+        assert engine.operations[0] == []
+        assert engine.redo() is None
+        engine.close()
+
+
+class TestPageStore:
+    """Test keeping page renders and edit layers in memory-mapped files"""
+    
+    def test_render_round_trip(self, tmp_path):
+        """Test that a stored render maps back read-only and the files go on close"""
+        import os
+        import numpy as np
+        from colorizer_engine import PageStore
+        store = PageStore(str(tmp_path))
+        image = np.random.default_rng(0).integers(0, 256, size=(40, 60, 3), dtype=np.uint8)
+        assert store.load_render(3) is None and not store.has_render(3)
+        
+        stored = store.save_render(3, image)
+        assert isinstance(stored, np.memmap) and not stored.flags.writeable
+        assert np.array_equal(stored, image)
+        assert np.array_equal(store.load_render(3), image)
+        assert store.has_render(3)
+        
+        store.close()
+        assert not os.path.exists(store.directory)
+    
+    def test_evicted_page_reopens_without_rendering(self, street_plan_pdf, tmp_path,
+                                                    monkeypatch):
+        """Test that pages come back from disk, with their edits, once out of memory"""
+        import numpy as np
+        import colorizer_engine
+        from colorizer_engine import ColorizerEngine
+        store_root = tmp_path / "store"
+        store_root.mkdir()
+        engine = ColorizerEngine(page_cache_mb=0, store_dir=str(store_root))
+        engine.load(str(street_plan_pdf))
+        engine.flood_fill(150, 120, RED, use_index=False)
+        engine.open_page(1)
+        assert 0 not in engine.page_cache and engine.has_page(0)
+        assert isinstance(engine.edit_layers[0].backing, np.memmap)
+        
+        def no_render(*args):
+            raise AssertionError("stored page was rendered again")
+        
+        monkeypatch.setattr(colorizer_engine, "render_page", no_render)
+        engine.open_page(0)
+        assert isinstance(engine.original_image, np.memmap)
+        assert tuple(engine.colored_image[120, 150]) == RED
+        monkeypatch.undo()
+        
+        output = tmp_path / "flat.pdf"
+        engine.save_raster(str(output), max_workers=1)
+        assert len(list(store_root.iterdir())) == 1
+        engine.close()
+        assert list(store_root.iterdir()) == []
+        
+        import fitz
+        with fitz.open(str(output)) as doc:
+            assert doc[0].get_pixmap().pixel(100, 80) == RED
+    
+    def test_store_closed_after_mapped_pages_dropped(self, street_plan_pdf, tmp_path):
+        """Test that close lets go of every mapped array before deleting the files"""
+        from colorizer_engine import ColorizerEngine
+        engine = ColorizerEngine(store_dir=str(tmp_path))
+        engine.load(str(street_plan_pdf))
+        engine.flood_fill(150, 120, RED, use_index=False)
+        engine.open_page(1)
+        
+        store = engine.page_store
+        held = []
+        close = store.close
+        store.close = lambda: (held.append((len(engine.page_cache), engine.original_image,
+                                            engine.edit_layers)), close())
+        engine.close()
+        assert held == [(0, None, {})]
+        assert engine.page_store is None
+
+
+class TestRenderCache:
+    """Test the on-disk render cache shared across sessions"""
+    
+    def test_reopened_document_skips_rendering(self, street_plan_pdf, render_cache_dir,
+                                               monkeypatch):
+        """Test that renders and edge maps come back from disk in a new session"""
+        import numpy as np
+        import colorizer_engine
+        from colorizer_engine import ColorizerEngine, RenderCache
+        engine = ColorizerEngine(render_cache=RenderCache())
+        engine.load(str(street_plan_pdf))
+        engine.region_index(50)
+        first = engine.original_image.copy()
+        magnitude = engine.edge_cache.edges.get(0).copy()
+        engine.close()
+        engine.render_cache.flush()
+        assert len(list(render_cache_dir.iterdir())) == 2
+        
+        def no_work(*args, **kwargs):
+            raise AssertionError("cached page was computed again")
+        
+        monkeypatch.setattr(colorizer_engine, "render_page", no_work)
+        monkeypatch.setattr(colorizer_engine, "compute_edge_magnitude", no_work)
+        engine = ColorizerEngine(render_cache=RenderCache())
+        engine.load(str(street_plan_pdf))
+        assert np.array_equal(engine.original_image, first)
+        assert engine.flood_fill(150, 120, RED, use_index=False) is not None
+        assert np.array_equal(engine.edge_cache.edges.get(0), magnitude)
+        engine.close()
+    
+    def test_key_follows_contents_and_zoom(self, street_plan_pdf, tmp_path, monkeypatch):
+        """Test that a copy shares entries, but changed contents or render zoom miss them"""
+        import shutil
+        import colorizer_engine
+        from colorizer_engine import DocumentCache, RenderCache, document_key
+        monkeypatch.setattr(colorizer_engine, "DOCUMENT_KEY_SAMPLE_BYTES", 64)
+        copy = tmp_path / "copy.pdf"
+        shutil.copy(street_plan_pdf, copy)
+        key = document_key(str(copy))
+        assert document_key(str(street_plan_pdf)) == key
+        
+        with open(copy, "r+b") as pdf_file:
+            pdf_file.seek(-8, 2)
+            pdf_file.write(b"%%%%%%%%")
+        assert document_key(str(copy)) != key
+        shutil.copy(street_plan_pdf, copy)
+        assert document_key(str(copy)) == key
+        with open(copy, "ab") as pdf_file:
+            pdf_file.write(b"\n% edited\n")
+        assert document_key(str(copy)) != key
+        
+        cache = RenderCache()
+        assert DocumentCache(cache, key, 1.5).key(0, "render") != \
+            DocumentCache(cache, key, 2).key(0, "render")
+    
+    def test_writes_happen_in_background(self, render_cache_dir, monkeypatch):
+        """Test that put returns at once and drops writes once too many are queued"""
+        import threading
+        import numpy as np
+        from colorizer_engine import RENDER_CACHE_PENDING_WRITES, RenderCache
+        cache = RenderCache()
+        release = threading.Event()
+        writers = []
+        write = cache._write
+        
+        def blocked_write(key, array):
+            release.wait()
+            writers.append(threading.current_thread())
+            write(key, array)
+        
+        monkeypatch.setattr(cache, "_write", blocked_write)
+        array = np.zeros((10, 10), dtype=np.uint8)
+        for key in range(RENDER_CACHE_PENDING_WRITES + 2):
+            cache.put(str(key), array)
+        assert cache.get("0") is None
+        release.set()
+        cache.flush()
+        assert len(writers) == RENDER_CACHE_PENDING_WRITES
+        assert threading.current_thread() not in writers
+        assert cache.get("0") is not None
+        assert cache.get(str(RENDER_CACHE_PENDING_WRITES)) is None
+    
+    def test_least_recently_used_files_evicted(self, render_cache_dir):
+        """Test that writes past the budget delete the entries read longest ago"""
+        import os
+        import time
+        import numpy as np
+        from colorizer_engine import RenderCache
+        # Noise does not compress, so each entry takes about 100 KB and three fit
+        rng = np.random.default_rng(0)
+        arrays = {key: rng.integers(0, 256, size=(100, 1000), dtype=np.uint8)
+                  for key in "abcd"}
+        cache = RenderCache(max_mb=0.35)
+        for key in "abc":
+            cache.put(key, arrays[key])
+            cache.flush()
+            # Modification times must differ for the order to be known
+            written = time.time() - 100 + ord(key)
+            os.utime(cache.path(key), (written, written))
+        assert np.array_equal(cache.get("a"), arrays["a"])
+        
+        cache.put("d", arrays["d"])
+        cache.flush()
+        assert cache.get("b") is None
+        assert all(cache.get(key) is not None for key in "acd")
+        assert sum(path.stat().st_size for path in render_cache_dir.iterdir()) <= cache.max_bytes
+        
+        cache.set_budget(0)
+        cache.flush()
+        assert list(render_cache_dir.iterdir()) == []
+
+
+class TestEdgeMagnitude:
+    """Test the banded, parallel edge magnitude"""
+    
+    def test_bands_match_whole_page_float64(self, monkeypatch):
+        """Test that any band split and worker count gives the float64 result"""
+        import cv2
+        import numpy as np
+        import colorizer_engine
+        from colorizer_engine import compute_edge_magnitude
+        
+        def whole_page(image):
+            gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+            sobelx = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
+            sobely = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
+            return np.minimum(np.sqrt(sobelx**2 + sobely**2), 255).astype(np.uint8)
+        
+        # Noise reaches every gradient size, including those just below 255
+        rng = np.random.default_rng(0)
+        monkeypatch.setattr(colorizer_engine, "EDGE_BAND_PIXELS", 1)
+        for height, width in [(1, 1), (2, 7), (64, 5), (65, 90), (300, 200)]:
+            image = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+            expected = whole_page(image)
+            for max_workers in (1, 3):
+                assert np.array_equal(compute_edge_magnitude(image, max_workers), expected)
+
+
+class TestCoarseFill:
+    """Test the coarse-to-fine flood fill against the exact flood"""
+    
+    def test_same_pixels_as_exact_flood(self, street_plan_pdf):
+        """Test that fills, including over earlier fills and undos, match exactly"""
+        import random
+        import numpy as np
+        from colorizer_engine import ColorizerEngine
+        exact, coarse = ColorizerEngine(zoom=3), ColorizerEngine(zoom=3)
+        for engine in (exact, coarse):
+            engine.load(str(street_plan_pdf))
+        height, width = exact.colored_image.shape[:2]
+        
+        rng = random.Random(0)
+        for step in range(40):
+            x, y = rng.randrange(width), rng.randrange(height)
+            color = tuple(rng.randrange(256) for _ in range(3))
+            tolerance, threshold = rng.choice([0, 30, 120]), rng.choice([30, 50, 150])
+            expected = exact.flood_fill(x, y, color, tolerance, threshold, use_index=False)
+            assert coarse.flood_fill(x, y, color, tolerance, threshold, use_index=False,
+                                     coarse=True) == expected
+            if step % 10 == 9:
+                exact.undo()
+                coarse.undo()
+            assert np.array_equal(coarse.colored_image, exact.colored_image)
+        assert coarse.operations == exact.operations
+        exact.close()
+        coarse.close()
+    
+    def test_open_area_visits_fewer_pixels(self, street_plan_pdf):
+        """Test that the exact flood only walks the borders of solid blocks"""
+        from colorizer_engine import ColorizerEngine
+        from colorizer_trace import tracer
+        engine = ColorizerEngine(zoom=3)
+        engine.load(str(street_plan_pdf))
+        tracer.enabled = True
+        try:
+            visits = {}
+            for coarse in (False, True):
+                tracer.clear()
+                engine.flood_fill(330, 330, RED, use_index=False, coarse=coarse)
+                engine.undo()
+                fill = next(event for event in tracer.events if event[0] == "fill")
+                visits[coarse] = fill[4]["visited"]
+        finally:
+            tracer.enabled = False
+            tracer.clear()
+        assert visits[True] < visits[False] / 3
+        engine.close()
@@ -0,0 +1,109 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add the project directory to the path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+@pytest.fixture
+def tracing():
+    """Fixture enabling the process-wide tracer for one test"""
+    from colorizer_trace import tracer
+    tracer.clear()
+    tracer.enabled = True
+    yield tracer
+    tracer.enabled = False
+    tracer.clear()
+
+
+class TestTracer:
+    """Test timing spans and their Chrome trace export"""
+    
+    def test_disabled_span_records_nothing(self):
+        """Test that a span is a shared no-op while tracing is off"""
+        from colorizer_trace import Tracer
+        tracer = Tracer()
+        with tracer.span("fill", mode="flood") as span:
+            span.set(on_barrier=True)
+        assert tracer.span("fill") is tracer.span("render")
+        assert not tracer.events
+        assert tracer.latest == {}
+    
+    def test_spans_export_as_chrome_trace(self, tmp_path):
+        """Test that nested spans export as complete events with their args"""
+        from colorizer_trace import Tracer
+        tracer = Tracer()
+        tracer.enabled = True
+        with tracer.span("paint"):
+            with tracer.span("tile", fast=True) as span:
+                span.set(size=256)
+        
+        output = tmp_path / "trace.json"
+        tracer.export(str(output))
+        events = json.loads(output.read_text())["traceEvents"]
+        assert [event["name"] for event in events] == ["tile", "paint"]
+        tile, paint = events
+        assert tile["ph"] == "X" and tile["args"] == {"fast": True, "size": 256}
+        assert paint["ts"] <= tile["ts"] and tile["dur"] <= paint["dur"]
+        assert tracer.summary()["tile"][0] == 1
+    
+    def test_event_buffer_is_bounded(self):
+        """Test that the oldest spans are dropped beyond the limit"""
+        from colorizer_trace import Tracer
+        tracer = Tracer(max_events=3)
+        tracer.enabled = True
+        for number in range(5):
+            with tracer.span(f"span{number}"):
+                pass
+        assert [event[0] for event in tracer.events] == ["span2", "span3", "span4"]
+    
+    def test_engine_reports_spans(self, tracing, street_plan_pdf):
+        """Test that rendering, edge detection and fills are timed"""
+        from colorizer_engine import ColorizerEngine
+        engine = ColorizerEngine()
+        engine.load(str(street_plan_pdf))
+        engine.flood_fill(150, 120, (255, 0, 0), use_index=False)
+        engine.close()
+        
+        names = {event[0] for event in tracing.events}
+        assert {"load", "render", "edges", "fill"} <= names
+        edges = next(event for event in tracing.events if event[0] == "edges")
+        assert edges[4]["max"] == 255 and edges[4]["min"] == 0
+        fill = next(event for event in tracing.events if event[0] == "fill")
+        assert fill[4]["mode"] == "flood"
+    
+    def test_window_status_bar_timings(self, qapp, tracing, street_plan_pdf):
+        """Test that the status bar overlay shows the latest span timings"""
+        from pdf_colorizer import PDFColorizer
+        window = PDFColorizer()
+        assert window.trace_checkbox.isChecked()
+        window.pdf_path = str(street_plan_pdf)
+        window.load_pdf()
+        window.tasks.wait()
+        window.smart_flood_fill(150, 120)
+        window.tasks.wait()
+        
+        window.update_trace_overlay()
+        message = window.statusBar().currentMessage()
+        assert "render" in message and "fill" in message and "display" in message
+        
+        window.trace_checkbox.setChecked(False)
+        assert not tracing.enabled
+        assert window.statusBar().currentMessage() == ""
+        window.close_pdf()
+    
+    def test_trace_env_writes_file_at_exit(self, tmp_path, street_plan_pdf):
+        """Test that PDF_COLORIZER_TRACE traces a whole run into a file"""
+        output = tmp_path / "run.json"
+        code = ("from colorizer_engine import ColorizerEngine; "
+                f"engine = ColorizerEngine(); engine.load({str(street_plan_pdf)!r})")
+        env = dict(os.environ, PDF_COLORIZER_TRACE=str(output))
+        subprocess.run([sys.executable, "-c", code], env=env, check=True, capture_output=True,
+                       cwd=str(Path(__file__).parent.parent))
+        names = {event["name"] for event in json.loads(output.read_text())["traceEvents"]}
+        assert {"load", "render"} <= names
@@ -241,6 +241,168 @@ class TestFlooding:
             "Higher threshold should produce fewer/equal barrier pixels"
 
 
+class TestEdgeMapCache:
+    """Test caching of edge maps and barrier masks between fills"""
+    
+    @pytest.fixture
+    def plan_array(self):
+        import numpy as np
+        img = Image.new('RGB', (200, 150), 'white')
+        draw = ImageDraw.Draw(img)
+        draw.rectangle([50, 40, 150, 110], outline='black', width=3)
+        draw.line([(170, 10), (170, 140)], fill=(200, 200, 200), width=1)
+        return np.asarray(img)
+    
+    def test_edge_magnitude_saturates(self, plan_array):
+        """Test that strong edges clip to 255 instead of wrapping around"""
+        import numpy as np
+        from colorizer_engine import compute_edge_magnitude
+        magnitude = compute_edge_magnitude(plan_array)
+        
+        assert magnitude.dtype == np.uint8
+        assert magnitude.shape == plan_array.shape[:2]
+        assert magnitude[40:43, 60:140].max() == 255
+    
+    def test_edges_computed_once_per_page(self, plan_array, monkeypatch):
+        """Test that repeat barrier requests reuse the page's edge map"""
+        import colorizer_engine
+        calls = []
+        original = colorizer_engine.compute_edge_magnitude
+        monkeypatch.setattr(colorizer_engine, 'compute_edge_magnitude',
+                            lambda image: calls.append(1) or original(image))
+        cache = colorizer_engine.EdgeMapCache()
+        
+        first = cache.barrier_mask(0, plan_array, 50)
+        assert cache.barrier_mask(0, plan_array, 50) is first
+        cache.barrier_mask(0, plan_array, 120)
+        assert len(calls) == 1
+        
+        cache.barrier_mask(1, plan_array, 50)
+        assert len(calls) == 2
+    
+    def test_barrier_mask_layout(self, plan_array):
+        """Test that the mask is padded for floodFill and thresholds edges"""
+        import numpy as np
+        from colorizer_engine import EdgeMapCache, compute_edge_magnitude
+        cache = EdgeMapCache()
+        mask = cache.barrier_mask(0, plan_array, 50)
+        
+        assert mask.shape == (152, 202)
+        assert not mask[0].any() and not mask[:, 0].any()
+        expected = compute_edge_magnitude(plan_array) > 50
+        assert np.array_equal(mask[1:-1, 1:-1].astype(bool), expected)
+        
+        # At a strict threshold the faint grey line stops being a barrier,
+        # while saturated black outlines still are
+        strict = cache.barrier_mask(0, plan_array, 250)
+        assert not strict[76, 165:177].any()
+        assert strict[76, 45:57].any()
+
+
+class TestRegionIndex:
+    """Test resolving fills through precomputed connected regions"""
+    
+    @pytest.fixture
+    def plan_array(self):
+        import numpy as np
+        img = Image.new('RGB', (300, 200), 'white')
+        draw = ImageDraw.Draw(img)
+        draw.rectangle([20, 20, 120, 120], outline='black', width=3)
+        draw.rectangle([160, 30, 280, 170], outline='black', width=3)
+        draw.line([(0, 150), (140, 150)], fill='black', width=3)
+        return np.asarray(img)
+    
+    def test_region_matches_flood_fill(self, plan_array):
+        """Test that each region equals the exact barrier-respecting flood"""
+        import cv2
+        import numpy as np
+        from colorizer_engine import EdgeMapCache, build_region_index
+        _, index = build_region_index(plan_array, 50)
+        barrier = EdgeMapCache().barrier_mask(0, plan_array, 50)
+        
+        for x, y in [(70, 70), (5, 5), (220, 100), (60, 180)]:
+            mask = barrier.copy()
+            cv2.floodFill(plan_array.copy(), mask, (x, y), (255, 0, 0), (30,) * 3, (30,) * 3,
+                          4 | cv2.FLOODFILL_MASK_ONLY | (2 << 8))
+            expected = mask[1:-1, 1:-1] == 2
+            
+            (x0, y0, x1, y1), region = index.region_at(x, y)
+            actual = np.zeros(expected.shape, dtype=bool)
+            actual[y0:y1, x0:x1] = region
+            assert np.array_equal(actual, expected), (x, y)
+    
+    def test_barrier_pixel_has_no_region(self, plan_array):
+        """Test that clicking on a line yields no region"""
+        from colorizer_engine import build_region_index
+        _, index = build_region_index(plan_array, 50)
+        assert index.region_at(20, 70) is None
+    
+    def test_window_fills_from_background_index(self, qapp, street_plan_pdf):
+        """Test that a click uses the index once built, matching both flood modes"""
+        import time
+        import numpy as np
+        from pdf_colorizer import PDFColorizer
+        window = PDFColorizer()
+        window.pdf_path = str(street_plan_pdf)
+        window.load_pdf()
+        window.tasks.wait()
+        key = (0, window.edge_strength_threshold)
+        deadline = time.monotonic() + 10
+        while key not in window.engine.region_indexes and time.monotonic() < deadline:
+            qapp.processEvents()
+            time.sleep(0.01)
+        assert key in window.engine.region_indexes
+        
+        # Inside the first building outline (PDF points 40..180 x 40..140)
+        window.smart_flood_fill(150, 120)
+        window.tasks.wait()
+        indexed = window.engine.colored_image.copy()
+        
+        window.reset_page()
+        window.tasks.wait()
+        window.fill_mode_combo.setCurrentText("Exact Flood")
+        window.smart_flood_fill(150, 120)
+        window.tasks.wait()
+        flooded = window.engine.colored_image.copy()
+        
+        window.reset_page()
+        window.tasks.wait()
+        window.fill_mode_combo.setCurrentText("Coarse-to-Fine")
+        window.smart_flood_fill(150, 120)
+        window.tasks.wait()
+        
+        assert tuple(indexed[120, 150]) == (255, 0, 0)
+        assert np.array_equal(indexed, flooded)
+        assert np.array_equal(window.engine.colored_image, flooded)
+        window.close_pdf()
+    
+    def test_click_before_index_is_ready_fills_by_region(self, qapp, street_plan_pdf):
+        """Test that a click while the index is building waits for it instead of flooding"""
+        from pdf_colorizer import PDFColorizer
+        window = PDFColorizer()
+        window.pdf_path = str(street_plan_pdf)
+        window.load_pdf()
+        window.tasks.wait()
+        key = (0, window.edge_strength_threshold)
+        assert key not in window.engine.region_indexes
+        
+        window.smart_flood_fill(150, 120)
+        window.tasks.wait()
+        assert window.engine.operations[0][-1]["mode"] == "region"
+        assert key in window.engine.region_indexes
+        
+        # Without a background build the fill task builds the index itself
+        window.reset_page()
+        window.tasks.wait()
+        window.engine.region_indexes.clear()
+        window.region_builder.cancel()
+        window.smart_flood_fill(150, 120)
+        window.tasks.wait()
+        assert window.engine.operations[0][-1]["mode"] == "region"
+        assert tuple(window.engine.colored_image[120, 150]) == (255, 0, 0)
+        window.close_pdf()
+
+
 class TestTextRendering:
     """Test text drawing operations"""
     
@@ -372,6 +534,524 @@ class TestDataStructures:
         assert image_y == 100
 
 
+class TestUndoHistory:
+    """Test the dirty-rectangle undo/redo history"""
+    
+    @pytest.fixture
+    def canvas(self):
+        import numpy as np
+        image = np.zeros((100, 100, 3), dtype=np.uint8)
+        
+        def read(rect):
+            x0, y0, x1, y1 = rect
+            return image[y0:y1, x0:x1].copy()
+        
+        def write(rect, patch):
+            x0, y0, x1, y1 = rect
+            image[y0:y1, x0:x1] = patch
+        
+        return image, read, write
+    
+    @staticmethod
+    def paint(history, read, image, rect, value):
+        history.record(rect, read(rect))
+        x0, y0, x1, y1 = rect
+        image[y0:y1, x0:x1] = value
+    
+    def test_stroke_undoes_as_one_action(self, canvas):
+        """Test that all steps of a group are reverted together"""
+        from colorizer_engine import UndoHistory
+        image, read, write = canvas
+        history = UndoHistory()
+        history.begin()
+        self.paint(history, read, image, (10, 10, 30, 30), 50)
+        self.paint(history, read, image, (20, 20, 40, 40), 100)
+        history.end()
+        
+        assert history.undo(read, write) == (10, 10, 40, 40)
+        assert not image.any()
+        assert not history.can_undo
+    
+    def test_redo_restores_action(self, canvas):
+        """Test that redo reapplies overlapping steps in order"""
+        import numpy as np
+        from colorizer_engine import UndoHistory
+        image, read, write = canvas
+        history = UndoHistory()
+        history.begin()
+        self.paint(history, read, image, (10, 10, 30, 30), 50)
+        self.paint(history, read, image, (20, 20, 40, 40), 100)
+        history.end()
+        after = image.copy()
+        
+        history.undo(read, write)
+        history.redo(read, write)
+        assert np.array_equal(image, after)
+        
+        history.undo(read, write)
+        assert not image.any()
+    
+    def test_new_action_clears_redo(self, canvas):
+        """Test that redo history is dropped by a new action"""
+        from colorizer_engine import UndoHistory
+        image, read, write = canvas
+        history = UndoHistory()
+        self.paint(history, read, image, (0, 0, 10, 10), 1)
+        history.end()
+        history.undo(read, write)
+        assert history.can_redo
+        
+        self.paint(history, read, image, (0, 0, 5, 5), 2)
+        history.end()
+        assert not history.can_redo
+    
+    def test_budget_evicts_oldest(self, canvas):
+        """Test that old actions are dropped beyond the byte budget"""
+        from colorizer_engine import UndoHistory
+        image, read, write = canvas
+        # Each action stores a 100 x 50 RGB patch (15000 bytes)
+        history = UndoHistory(max_mb=40000 / (1024 * 1024))
+        for value in range(1, 5):
+            self.paint(history, read, image, (0, 0, 100, 50), value)
+            history.end()
+        
+        assert history.nbytes <= history.max_bytes
+        undone = 0
+        while history.undo(read, write):
+            undone += 1
+        assert undone == 2
+        assert image[0, 0, 0] == 2
+    
+    def test_abort_restores_pixels(self, canvas):
+        """Test that an aborted action leaves no trace"""
+        from colorizer_engine import UndoHistory
+        image, read, write = canvas
+        history = UndoHistory()
+        history.begin()
+        self.paint(history, read, image, (0, 0, 10, 10), 9)
+        history.abort(write)
+        history.end()
+        
+        assert not image.any()
+        assert not history.can_undo
+    
+    def test_window_brush_stroke_history(self, qapp, street_plan_pdf):
+        """Test that a brush stroke stores patches, not page copies"""
+        import numpy as np
+        from PyQt6.QtCore import QPointF
+        from pdf_colorizer import PDFColorizer
+        
+        class Event:
+            def __init__(self, x, y):
+                self._pos = QPointF(x, y)
+            
+            def position(self):
+                return self._pos
+        
+        window = PDFColorizer()
+        window.pdf_path = str(street_plan_pdf)
+        window.load_pdf()
+        window.tasks.wait()
+        window.tool_combo.setCurrentText("Brush Stroke")
+        before = window.engine.colored_image.copy()
+        
+        window.on_image_click(Event(300, 260))
+        for x in range(310, 400, 10):
+            window.on_mouse_move(Event(x, 260))
+        window.on_mouse_release(Event(400, 260))
+        window.tasks.wait()
+        
+        page_bytes = before.nbytes
+        assert window.engine.history.nbytes < page_bytes / 10
+        assert not np.array_equal(window.engine.colored_image, before)
+        
+        window.undo()
+        window.tasks.wait()
+        assert np.array_equal(window.engine.colored_image, before)
+        assert not window.engine.history.can_undo
+        window.close_pdf()
+    
+    def test_window_rectangle_tool(self, qapp, street_plan_pdf):
+        """Test that the rectangle tool draws from press to release as one action"""
+        from PyQt6.QtCore import QPointF
+        from pdf_colorizer import PDFColorizer
+        
+        class Event:
+            def __init__(self, x, y):
+                self._pos = QPointF(x, y)
+            
+            def position(self):
+                return self._pos
+        
+        window = PDFColorizer()
+        window.pdf_path = str(street_plan_pdf)
+        window.load_pdf()
+        window.tasks.wait()
+        window.tool_combo.setCurrentText("Rectangle")
+        
+        window.on_image_click(Event(300, 300))
+        window.on_mouse_move(Event(350, 330))
+        window.on_mouse_release(Event(400, 360))
+        window.tasks.wait()
+        
+        image = window.engine.colored_image
+        assert tuple(image[330, 300]) != (255, 255, 255)
+        assert tuple(image[330, 350]) == (255, 255, 255)
+        rectangle, = window.engine.operations[0]
+        assert rectangle["tool"] == "rectangle"
+        
+        window.undo()
+        window.tasks.wait()
+        assert tuple(window.engine.colored_image[330, 300]) == (255, 255, 255)
+        assert window.engine.operations[0] == []
+        window.close_pdf()
+
+
+class TestEditLayer:
+    """Test sparse per-page edit layers"""
+    
+    @staticmethod
+    def reader(image):
+        def read(rect):
+            x0, y0, x1, y1 = rect
+            return image[y0:y1, x0:x1]
+        return read
+    
+    def test_only_touched_tiles_are_stored(self):
+        """Test that the layer allocates just the tiles containing edits"""
+        import numpy as np
+        from colorizer_engine import EditLayer
+        base = np.full((1000, 1200, 3), 255, dtype=np.uint8)
+        edited = base.copy()
+        edited[300:310, 300:310] = (255, 0, 0)
+        
+        layer = EditLayer(1200, 1000, tile_size=256)
+        layer.capture((0, 0, 1200, 1000), base, self.reader(edited))
+        
+        assert list(layer.tiles) == [(1, 1)]
+        assert layer.nbytes == 256 * 256 * 4
+    
+    def test_composite_round_trip(self):
+        """Test that compositing the layer reproduces the edited page"""
+        import numpy as np
+        from colorizer_engine import EditLayer
+        rng = np.random.default_rng(0)
+        base = rng.integers(0, 256, size=(300, 500, 3), dtype=np.uint8)
+        edited = base.copy()
+        edited[10:40, 450:500] = (0, 0, 255)
+        edited[250:300, 0:20] = (0, 255, 0)
+        
+        layer = EditLayer(500, 300, tile_size=128)
+        layer.capture((0, 0, 500, 300), base, self.reader(edited))
+        assert np.array_equal(layer.composite(base), edited)
+    
+    def test_reverted_tiles_are_released(self):
+        """Test that a tile whose edits were undone is dropped"""
+        import numpy as np
+        from colorizer_engine import EditLayer
+        base = np.zeros((100, 100, 3), dtype=np.uint8)
+        edited = base.copy()
+        edited[5, 5] = 1
+        layer = EditLayer(100, 100, tile_size=64)
+        layer.capture((0, 0, 10, 10), base, self.reader(edited))
+        assert not layer.is_empty()
+        
+        edited[5, 5] = 0
+        layer.capture((0, 0, 10, 10), base, self.reader(edited))
+        assert layer.is_empty()
+    
+    def test_edits_survive_page_navigation_and_save(self, qapp, street_plan_pdf, tmp_path):
+        """Test that coloring two pages keeps both through navigation and saving"""
+        import fitz
+        from pdf_colorizer import PDFColorizer
+        window = PDFColorizer()
+        window.pdf_path = str(street_plan_pdf)
+        window.load_pdf()
+        window.tasks.wait()
+        window.fill_mode_combo.setCurrentText("Exact Flood")
+        
+        window.smart_flood_fill(150, 120)
+        window.tasks.wait()
+        window.page_spinbox.setValue(2)
+        window.tasks.wait()
+        assert tuple(window.engine.colored_image[120, 150]) == (255, 255, 255)
+        window.smart_flood_fill(450, 120)
+        window.tasks.wait()
+        window.page_spinbox.setValue(1)
+        window.tasks.wait()
+        assert tuple(window.engine.colored_image[120, 150]) == (255, 0, 0)
+        
+        output = tmp_path / "colored.pdf"
+        window.engine.save_raster(str(output))
+        window.close_pdf()
+        
+        with fitz.open(str(output)) as doc:
+            pages = [doc[i].get_pixmap(matrix=fitz.Matrix(1.5, 1.5)) for i in range(2)]
+            assert pages[0].pixel(150, 120) == (255, 0, 0)
+            assert pages[1].pixel(450, 120) == (255, 0, 0)
+            assert pages[1].pixel(150, 120) == (255, 255, 255)
+
+
+class TestOverlaySave:
+    """Test saving edits as an overlay on the original PDF pages"""
+    
+    def test_overlay_is_cropped_to_edits(self):
+        """Test that the overlay covers exactly the edited pixels"""
+        import numpy as np
+        from colorizer_engine import EditLayer
+        base = np.full((600, 800, 3), 255, dtype=np.uint8)
+        edited = base.copy()
+        edited[100:120, 300:340] = (255, 0, 0)
+        edited[500:510, 700:705] = (0, 0, 255)
+        layer = EditLayer(800, 600, tile_size=256)
+        layer.capture((0, 0, 800, 600), base, TestEditLayer.reader(edited))
+        
+        rect, rgba = layer.overlay()
+        assert rect == (300, 100, 705, 510)
+        assert rgba.shape == (410, 405, 4)
+        assert tuple(rgba[0, 0]) == (255, 0, 0, 255)
+        assert rgba[50, 50, 3] == 0
+        assert EditLayer(800, 600).overlay() is None
+    
+    def test_overlay_placement_on_rotated_pages(self, tmp_path):
+        """Test that overlays land on the pixels they came from at any rotation"""
+        import fitz
+        import numpy as np
+        from colorizer_engine import insert_overlay, render_page
+        rgba = np.zeros((30, 60, 4), dtype=np.uint8)
+        rgba[:, :30] = (255, 0, 0, 255)
+        rgba[:, 30:] = (0, 255, 0, 255)
+        rgba[:5] = (0, 0, 255, 255)
+        for rotation in (0, 90, 180, 270):
+            doc = fitz.open()
+            page = doc.new_page(width=400, height=300)
+            page.set_rotation(rotation)
+            insert_overlay(page, (60, 30, 120, 60), rgba)
+            rendered = render_page(doc, 0)
+            assert np.array_equal(rendered[30:60, 60:120], rgba[..., :3]), rotation
+            doc.close()
+    
+    def test_vector_save_keeps_text_and_stays_small(self, qapp, street_plan_pdf, tmp_path):
+        """Test that the vector save keeps page content and adds the coloring"""
+        import fitz
+        from pdf_colorizer import PDFColorizer
+        window = PDFColorizer()
+        window.pdf_path = str(street_plan_pdf)
+        window.load_pdf()
+        window.tasks.wait()
+        window.fill_mode_combo.setCurrentText("Exact Flood")
+        window.smart_flood_fill(150, 120)
+        window.tasks.wait()
+        
+        vector_output = tmp_path / "vector.pdf"
+        raster_output = tmp_path / "raster.pdf"
+        window.engine.save_overlay(str(vector_output))
+        window.engine.save_raster(str(raster_output))
+        window.close_pdf()
+        
+        with fitz.open(str(vector_output)) as doc:
+            assert doc.page_count == 3
+            assert "Page 1" in doc[0].get_text()
+            assert len(doc[0].get_images()) == 1
+            assert len(doc[1].get_images()) == 0
+            pix = doc[0].get_pixmap()
+            assert pix.pixel(100, 80) == (255, 0, 0)
+            assert pix.pixel(300, 80) == (255, 255, 255)
+        assert vector_output.stat().st_size < raster_output.stat().st_size
+
+
+class TestIncrementalSave:
+    """Test that repeat vector saves only rewrite dirty pages"""
+    
+    @staticmethod
+    def open_window(path):
+        from pdf_colorizer import PDFColorizer
+        window = PDFColorizer()
+        window.pdf_path = str(path)
+        window.load_pdf()
+        window.tasks.wait()
+        window.fill_mode_combo.setCurrentText("Exact Flood")
+        return window
+    
+    def test_dirty_pages_are_tracked(self, qapp, street_plan_pdf, tmp_path):
+        """Test that edited and reset pages are dirty until saved"""
+        window = self.open_window(street_plan_pdf)
+        assert window.engine.dirty_pages == set()
+        window.smart_flood_fill(150, 120)
+        window.tasks.wait()
+        window.page_spinbox.setValue(3)
+        window.tasks.wait()
+        window.smart_flood_fill(150, 120)
+        window.tasks.wait()
+        assert window.engine.dirty_pages == {0, 2}
+        
+        window.engine.save_overlay(str(tmp_path / "out.pdf"))
+        assert window.engine.dirty_pages == set()
+        window.reset_page()
+        window.tasks.wait()
+        assert window.engine.dirty_pages == {2}
+        window.close_pdf()
+    
+    def test_saving_over_source_appends_updates(self, qapp, street_plan_pdf):
+        """Test that saving to the open file keeps its bytes and appends edits"""
+        import fitz
+        window = self.open_window(street_plan_pdf)
+        original = street_plan_pdf.read_bytes()
+        
+        window.smart_flood_fill(150, 120)
+        window.tasks.wait()
+        window.engine.save_overlay(str(street_plan_pdf))
+        first = street_plan_pdf.read_bytes()
+        assert first.startswith(original) and len(first) > len(original)
+        
+        # Nothing changed, so nothing is written
+        window.engine.save_overlay(str(street_plan_pdf))
+        assert street_plan_pdf.read_bytes() == first
+        
+        window.page_spinbox.setValue(2)
+        window.tasks.wait()
+        window.smart_flood_fill(450, 120)
+        window.tasks.wait()
+        window.engine.save_overlay(str(street_plan_pdf))
+        assert street_plan_pdf.read_bytes().startswith(first)
+        window.close_pdf()
+        
+        with fitz.open(str(street_plan_pdf)) as doc:
+            assert doc[0].get_pixmap().pixel(100, 80) == (255, 0, 0)
+            assert doc[1].get_pixmap().pixel(300, 80) == (255, 0, 0)
+            assert doc[2].get_images() == []
+    
+    def test_later_saves_start_from_unedited_source(self, qapp, street_plan_pdf, tmp_path):
+        """Test that saving over the source does not bake its edits into other saves"""
+        import fitz
+        window = self.open_window(street_plan_pdf)
+        window.smart_flood_fill(150, 120)
+        window.tasks.wait()
+        window.engine.save_overlay(str(street_plan_pdf))
+        window.reset_page()
+        window.tasks.wait()
+        
+        window.engine.save_overlay(str(tmp_path / "other.pdf"))
+        window.engine.save_raster(str(tmp_path / "flat.pdf"), max_workers=1)
+        copy = window.engine.source_path
+        window.close_pdf()
+        assert not os.path.exists(copy)
+        
+        for name in ("other.pdf", "flat.pdf"):
+            with fitz.open(str(tmp_path / name)) as doc:
+                assert doc[0].get_pixmap().pixel(100, 80) == (255, 255, 255), name
+        with fitz.open(str(street_plan_pdf)) as doc:
+            assert doc[0].get_pixmap().pixel(100, 80) == (255, 0, 0)
+    
+    def test_resave_replaces_page_overlay(self, qapp, street_plan_pdf, tmp_path):
+        """Test that a page's old overlay is removed when it is saved again"""
+        import fitz
+        window = self.open_window(street_plan_pdf)
+        output = tmp_path / "colored.pdf"
+        window.smart_flood_fill(150, 120)
+        window.tasks.wait()
+        window.engine.save_overlay(str(output))
+        
+        window.reset_page()
+        window.tasks.wait()
+        window.smart_flood_fill(450, 120)
+        window.tasks.wait()
+        window.engine.save_overlay(str(output))
+        window.close_pdf()
+        
+        with fitz.open(str(output)) as doc:
+            pix = doc[0].get_pixmap()
+            assert pix.pixel(100, 80) == (255, 255, 255)
+            assert pix.pixel(300, 80) == (255, 0, 0)
+    
+    def test_resave_keeps_xrefs_of_source_with_unused_objects(self, qapp, street_plan_pdf,
+                                                               tmp_path):
+        """Test that a resave removes the overlay, not an image the page already had"""
+        import fitz
+        from PIL import Image
+        source = tmp_path / "scanned.pdf"
+        with fitz.open(str(street_plan_pdf)) as doc:
+            photo = tmp_path / "photo.png"
+            Image.new("RGB", (8, 8), (0, 0, 255)).save(photo)
+            doc[0].insert_image(fitz.Rect(300, 220, 380, 280), filename=str(photo))
+            # Objects nothing refers to; compacting the file would renumber the rest
+            for number in range(5):
+                doc.update_object(doc.get_new_xref(), f"<</Unused {number}>>")
+            doc.save(str(source))
+        
+        window = self.open_window(source)
+        output = tmp_path / "colored.pdf"
+        window.smart_flood_fill(150, 120)
+        window.tasks.wait()
+        window.engine.save_overlay(str(output))
+        window.reset_page()
+        window.tasks.wait()
+        window.smart_flood_fill(450, 120)
+        window.tasks.wait()
+        window.engine.save_overlay(str(output))
+        window.close_pdf()
+        
+        with fitz.open(str(output)) as doc:
+            pix = doc[0].get_pixmap()
+            assert pix.pixel(100, 80) == (255, 255, 255)
+            assert pix.pixel(300, 80) == (255, 0, 0)
+            assert pix.pixel(340, 250) == (0, 0, 255)
+
+
+class TestRasterExport:
+    """Test the parallel flattened raster export"""
+    
+    def test_palette_is_exact_for_flat_colors(self):
+        """Test that images with few colors round-trip through a palette"""
+        import numpy as np
+        from colorizer_engine import palettize
+        image = np.full((50, 80, 3), 255, dtype=np.uint8)
+        image[10:20, 10:70] = (255, 0, 0)
+        image[30:40] = (12, 34, 56)
+        indices, palette = palettize(image)
+        assert indices.dtype == np.uint8 and len(palette) == 3
+        assert np.array_equal(palette[indices], image)
+        
+        noisy = np.random.default_rng(0).integers(0, 256, size=(64, 64, 3), dtype=np.uint8)
+        indices, palette = palettize(noisy)
+        assert indices.shape == (64, 64) and len(palette) <= 256
+    
+    def test_unknown_compression_is_rejected(self):
+        """Test that an unsupported compression name raises"""
+        import numpy as np
+        import pytest
+        from colorizer_engine import encode_raster_image
+        with pytest.raises(ValueError):
+            encode_raster_image(np.zeros((4, 4, 3), dtype=np.uint8), "LZW")
+    
+    def test_export_each_compression(self, street_plan_pdf, tmp_path):
+        """Test that every compression writes all pages with their edits"""
+        import fitz
+        import numpy as np
+        from colorizer_engine import EditLayer, RASTER_COMPRESSIONS, export_raster_pdf, render_page
+        with fitz.open(str(street_plan_pdf)) as doc:
+            base = render_page(doc, 1)
+        edited = base.copy()
+        edited[100:150, 100:200] = (255, 0, 0)
+        layer = EditLayer(base.shape[1], base.shape[0])
+        layer.capture((0, 0, base.shape[1], base.shape[0]), base, TestEditLayer.reader(edited))
+        
+        for compression in RASTER_COMPRESSIONS:
+            output = tmp_path / f"{compression}.pdf"
+            export_raster_pdf(str(street_plan_pdf), str(output), {1: layer},
+                              compression, max_workers=2)
+            with fitz.open(str(output)) as doc:
+                assert doc.page_count == 3
+                assert doc[0].rect == fitz.Rect(0, 0, 400, 300)
+                assert doc[1].get_text() == ""
+                rendered = render_page(doc, 1)
+            difference = np.abs(rendered.astype(int) - edited)
+            if compression == "JPEG":
+                assert np.abs(rendered[125, 150].astype(int) - (255, 0, 0)).max() <= 8
+            else:
+                assert difference.max() == 0, compression
+
+
 class TestEdgeCases:
     """Test edge cases and error handling"""
     
@@ -473,3 +1153,609 @@ class TestIntegration:
         assert pages[0].getpixel((0, 0)) == (50, 50, 50)
         assert pages[1].getpixel((0, 0)) == (100, 100, 100)
         assert pages[2].getpixel((0, 0)) == (150, 150, 150)
+
+
+class TestPageCache:
+    """Test the bounded LRU page cache"""
+    
+    @staticmethod
+    def make_page(value=255):
+        import numpy as np
+        # 1024 x 1024 RGB = 3 MB
+        return np.full((1024, 1024, 3), value, dtype=np.uint8)
+    
+    def test_get_missing_page(self):
+        """Test that uncached pages return None"""
+        from colorizer_engine import PageCache
+        cache = PageCache(max_mb=16)
+        assert cache.get(0) is None
+        assert 0 not in cache
+    
+    def test_evicts_least_recently_used(self):
+        """Test that the oldest page is evicted once over budget"""
+        from colorizer_engine import PageCache
+        cache = PageCache(max_mb=7)
+        cache.put(0, self.make_page())
+        cache.put(1, self.make_page())
+        cache.get(0)  # page 1 is now least recently used
+        cache.put(2, self.make_page())
+        
+        assert 0 in cache
+        assert 1 not in cache
+        assert 2 in cache
+        assert cache.current_bytes <= cache.max_bytes
+    
+    def test_dirty_pages_are_not_evicted(self):
+        """Test that pages with edits survive eviction"""
+        from colorizer_engine import PageCache
+        cache = PageCache(max_mb=4)
+        cache.put(0, self.make_page())
+        cache.mark_dirty(0)
+        cache.put(1, self.make_page())
+        cache.put(2, self.make_page())
+        
+        assert 0 in cache
+        assert 1 not in cache
+        
+        cache.mark_clean(0)
+        cache.put(1, self.make_page())
+        assert 0 not in cache
+        assert 2 not in cache
+        assert 1 in cache
+    
+    def test_page_over_budget_is_kept_until_replaced(self):
+        """Test that a page larger than the budget survives until the next put"""
+        from colorizer_engine import PageCache
+        cache = PageCache(max_mb=2)
+        cache.put(0, self.make_page())
+        assert 0 in cache
+        assert cache.get(0) is not None
+        
+        cache.put(1, self.make_page())
+        assert 0 not in cache
+        assert 1 in cache
+    
+    def test_shrinking_budget_evicts(self):
+        """Test that lowering the budget drops pages immediately"""
+        from colorizer_engine import PageCache
+        cache = PageCache(max_mb=16)
+        for page_num in range(4):
+            cache.put(page_num, self.make_page())
+        cache.set_budget(4)
+        assert len(cache) == 1
+        assert 3 in cache
+
+
+class TestPageRendering:
+    """Test rasterizing PDF pages into arrays"""
+    
+    def test_render_matches_ppm_decode(self, street_plan_pdf):
+        """Test that the zero-copy path yields the same pixels as a PPM round trip"""
+        import fitz
+        import numpy as np
+        from colorizer_engine import render_page, RENDER_ZOOM
+        
+        with fitz.open(str(street_plan_pdf)) as doc:
+            array = render_page(doc, 0)
+            pix = doc[0].get_pixmap(matrix=fitz.Matrix(RENDER_ZOOM, RENDER_ZOOM))
+            decoded = np.asarray(Image.open(BytesIO(pix.tobytes("ppm"))).convert("RGB"))
+        
+        assert array.dtype == np.uint8
+        assert array.flags.c_contiguous
+        assert np.array_equal(array, decoded)
+    
+    def test_render_outlives_document(self, street_plan_pdf):
+        """Test that the array stays valid after the pixmap and document are gone"""
+        import gc
+        import fitz
+        from colorizer_engine import render_page
+        
+        doc = fitz.open(str(street_plan_pdf))
+        array = render_page(doc, 0)
+        doc.close()
+        gc.collect()
+        
+        # Page background is white and the first building outline is black
+        assert tuple(array[5, 5]) == (255, 255, 255)
+        assert array.min() == 0
+    
+    def test_cached_renders_are_read_only(self):
+        """Test that pages stored in the cache cannot be modified in place"""
+        import numpy as np
+        from colorizer_engine import PageCache
+        cache = PageCache(max_mb=16)
+        cache.put(0, np.zeros((10, 10, 3), dtype=np.uint8))
+        with pytest.raises(ValueError):
+            cache.get(0)[0, 0] = 1
+
+
+class TestDisplayPipeline:
+    """Test converting page arrays into displayable images"""
+    
+    def test_resize_image_sizes(self):
+        """Test that both scaling modes produce the requested size"""
+        import numpy as np
+        from pdf_colorizer import resize_image
+        image = np.zeros((100, 200, 3), dtype=np.uint8)
+        
+        assert resize_image(image, (200, 100)) is image
+        assert resize_image(image, (100, 50)).shape == (50, 100, 3)
+        assert resize_image(image, (400, 200), fast=True).shape == (200, 400, 3)
+    
+    def test_array_to_qimage_pixels(self, qapp):
+        """Test that the QImage shows the array's pixels"""
+        import numpy as np
+        from pdf_colorizer import array_to_qimage
+        image = np.full((20, 30, 3), 255, dtype=np.uint8)
+        image[5, 7] = (10, 20, 30)
+        
+        qimage = array_to_qimage(image)
+        assert (qimage.width(), qimage.height()) == (30, 20)
+        assert qimage.pixelColor(7, 5).getRgb()[:3] == (10, 20, 30)
+        assert qimage.pixelColor(0, 0).getRgb()[:3] == (255, 255, 255)
+    
+    def test_array_to_qimage_rgba(self, qapp):
+        """Test that pages edited into RGBA display correctly"""
+        import numpy as np
+        from pdf_colorizer import array_to_qimage
+        image = np.zeros((4, 5, 4), dtype=np.uint8)
+        image[1, 2] = (200, 100, 50, 255)
+        
+        qimage = array_to_qimage(image)
+        assert qimage.pixelColor(2, 1).getRgb() == (200, 100, 50, 255)
+    
+    def test_fast_update_schedules_quality_redraw(self, qapp, street_plan_pdf):
+        """Test that an interactive redraw is followed by a full-quality one"""
+        from pdf_colorizer import PDFColorizer
+        window = PDFColorizer()
+        window.pdf_path = str(street_plan_pdf)
+        window.load_pdf()
+        window.tasks.wait()
+        window.zoom_level = 0.5
+        
+        window.update_display(fast=True)
+        assert window.quality_timer.isActive()
+        assert window.page_view.fast
+        assert window.page_view.width() == round(window.engine.colored_image.shape[1] / 2)
+        
+        window.update_display()
+        assert not window.quality_timer.isActive()
+        assert not window.page_view.fast
+        window.close_pdf()
+
+
+class TestTiledView:
+    """Test the tile-based page view"""
+    
+    @pytest.fixture
+    def page_image(self):
+        import numpy as np
+        rng = np.random.default_rng(0)
+        return rng.integers(0, 256, size=(3000, 4000, 3), dtype=np.uint8)
+    
+    def test_only_visible_tiles_are_produced(self, qapp, page_image):
+        """Test that a zoomed-in page only produces tiles near the viewport"""
+        from PyQt6.QtWidgets import QScrollArea
+        from pdf_colorizer import PageView
+        scroll_area = QScrollArea()
+        scroll_area.resize(400, 300)
+        view = PageView()
+        scroll_area.setWidget(view)
+        view.set_image(page_image)
+        view.set_zoom(3.0)
+        scroll_area.show()
+        qapp.processEvents()
+        qapp.processEvents()
+        
+        total_tiles = len(view.tiles_in(view.rect()))
+        assert 0 < len(view.tiles) < 30
+        assert total_tiles > 1000
+        scroll_area.close()
+    
+    def test_tiles_reproduce_image_at_full_size(self, qapp):
+        """Test that tiles painted at 100% match the page pixels exactly"""
+        import numpy as np
+        from PyQt6.QtGui import QImage
+        from pdf_colorizer import PageView
+        rng = np.random.default_rng(1)
+        image = rng.integers(0, 256, size=(300, 600, 3), dtype=np.uint8)
+        view = PageView()
+        view.set_image(image)
+        
+        grabbed = view.grab().toImage().convertToFormat(QImage.Format.Format_RGB888)
+        pixels = np.frombuffer(grabbed.constBits().asstring(grabbed.sizeInBytes()), dtype=np.uint8)
+        pixels = pixels.reshape(300, grabbed.bytesPerLine())[:, :600 * 3].reshape(300, 600, 3)
+        assert np.array_equal(pixels, image)
+    
+    def test_dirty_rect_invalidates_only_touched_tiles(self, qapp, page_image):
+        """Test that an edit only drops the tiles it overlaps"""
+        from PyQt6.QtCore import QRect
+        from pdf_colorizer import PageView
+        view = PageView()
+        view.set_image(page_image)
+        for tx, ty in view.tiles_in(QRect(0, 0, 1024, 1024)):
+            view.tile(tx, ty)
+        produced = len(view.tiles)
+        
+        view.set_image(page_image, dirty_rect=(10, 10, 20, 20))
+        assert len(view.tiles) == produced - 1
+        assert (1.0, 0, 0) not in view.tiles
+    
+    def test_view_coordinates_map_through_zoom(self, qapp, page_image):
+        """Test converting widget positions to image pixels"""
+        from PyQt6.QtCore import QPointF
+        from pdf_colorizer import PageView
+        view = PageView()
+        view.set_image(page_image)
+        view.set_zoom(2.0)
+        
+        assert view.to_image_coords(QPointF(101, 51)) == (50, 25)
+        assert view.to_image_coords(QPointF(9000, 10)) is None
+
+
+
+class TestVectorZoom:
+    """Test re-rendering tiles from the PDF at the display zoom"""
+    
+    @pytest.fixture
+    def renderer(self, street_plan_pdf):
+        import fitz
+        from colorizer_engine import render_page
+        from pdf_colorizer import VectorTileRenderer
+        doc = fitz.open(str(street_plan_pdf))
+        renderer = VectorTileRenderer()
+        renderer.set_page(doc, 0, render_page(doc, 0))
+        yield renderer, doc
+        doc.close()
+    
+    def test_tile_matches_render_at_zoom(self, qapp, renderer):
+        """Test that a vector tile equals a full render at the zoomed resolution"""
+        import fitz
+        import numpy as np
+        from PyQt6.QtCore import QRect
+        from colorizer_engine import RENDER_ZOOM, pixmap_to_array
+        renderer, doc = renderer
+        zoom = 2.0
+        rect = QRect(256, 128, 256, 256)
+        source_rect = (128, 64, 256, 192)
+        edited = renderer.original[64:192, 128:256]
+        
+        tile = renderer(zoom, 2, 1, rect, source_rect, edited)
+        scale = RENDER_ZOOM * zoom
+        full = pixmap_to_array(doc[0].get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False))
+        assert np.array_equal(tile, full[128:384, 256:512])
+        assert len(renderer.tiles) == 1
+    
+    def test_edits_are_composited(self, qapp, renderer):
+        """Test that colored pixels in the working image show over the vector tile"""
+        from PyQt6.QtCore import QRect
+        renderer, doc = renderer
+        edited = renderer.original[0:128, 0:128].copy()
+        edited[10:20, 10:20] = (255, 0, 0)
+        
+        tile = renderer(2.0, 0, 0, QRect(0, 0, 256, 256), (0, 0, 128, 128), edited)
+        assert tuple(tile[30, 30]) == (255, 0, 0)
+        assert tuple(tile[100, 100]) == tuple(renderer.tiles.get((0, 200, 0, 0))[100, 100])
+    
+    def test_view_scales_image_while_document_busy(self, qapp, renderer):
+        """Test that tiles wait for the document to be free, then render from it"""
+        from pdf_colorizer import PageView
+        renderer, doc = renderer
+        busy = [True]
+        renderer.can_render = lambda: not busy[0]
+        view = PageView()
+        view.set_image(renderer.original.copy())
+        view.set_zoom(2.0)
+        view.set_renderer(renderer)
+        
+        view.tile(0, 0)
+        assert view.tiles[(2.0, 0, 0)][1] and len(renderer.tiles) == 0
+        busy[0] = False
+        view.tile(0, 0)
+        assert not view.tiles[(2.0, 0, 0)][1] and len(renderer.tiles) == 1
+
+
+class TestLazyPageLoading:
+    """Test that pages are rendered only when they are viewed"""
+    
+    def test_load_renders_only_first_page(self, qapp, street_plan_pdf):
+        """Test that opening a document renders just the visible page"""
+        from pdf_colorizer import PDFColorizer
+        window = PDFColorizer()
+        # Opening a page waits on the render workers, which would prefetch meanwhile
+        window.prefetch_spinbox.setValue(0)
+        window.pdf_path = str(street_plan_pdf)
+        window.load_pdf()
+        window.tasks.wait()
+        
+        assert window.engine.total_pages == 3
+        assert len(window.engine.page_cache) == 1
+        assert 0 in window.engine.page_cache
+        
+        window.page_spinbox.setValue(3)
+        window.tasks.wait()
+        assert 2 in window.engine.page_cache
+        assert 1 not in window.engine.page_cache
+        window.close_pdf()
+
+
+class TestPageStoreOption:
+    """Test the option to keep pages on disk"""
+    
+    def test_checkbox_applies_to_next_document(self, qapp, street_plan_pdf):
+        """Test that opening a PDF with the option on maps its pages from disk"""
+        import threading
+        import numpy as np
+        from colorizer_engine import render_page
+        from pdf_colorizer import PDFColorizer
+        window = PDFColorizer()
+        window.prefetch_pages = 0
+        window.page_store_checkbox.setChecked(True)
+        window.pdf_path = str(street_plan_pdf)
+        window.load_pdf()
+        window.tasks.wait()
+        store = window.engine.page_store
+        assert store is not None
+        assert isinstance(window.engine.original_image, np.memmap)
+        
+        # Prefetched pages are written to the store off the GUI thread
+        threads = []
+        save_render = store.save_render
+        
+        def record_thread(*args):
+            threads.append(threading.current_thread())
+            return save_render(*args)
+        
+        store.save_render = record_thread
+        window.on_page_prefetched(1, render_page(window.engine.document, 1))
+        window.tasks.wait()
+        assert store.has_render(1)
+        assert threads and threading.main_thread() not in threads
+        
+        window.page_store_checkbox.setChecked(False)
+        window.load_pdf()
+        window.tasks.wait()
+        assert window.engine.page_store is None
+        window.close_pdf()
+
+
+class TestDiskCacheOption:
+    """Test the render cache kept between sessions"""
+    
+    def test_spinbox_controls_cache(self, qapp, street_plan_pdf, render_cache_dir):
+        """Test that the cache is off until enabled, then opened pages reach it"""
+        from pdf_colorizer import PDFColorizer
+        window = PDFColorizer()
+        assert window.disk_cache_spinbox.value() == 0
+        assert window.engine.render_cache is None
+        window.disk_cache_spinbox.setValue(512)
+        window.pdf_path = str(street_plan_pdf)
+        window.load_pdf()
+        window.tasks.wait()
+        assert window.engine.document_cache is not None
+        window.engine.render_cache.flush()
+        assert any(render_cache_dir.iterdir())
+        
+        window.disk_cache_spinbox.setValue(0)
+        window.tasks.wait()
+        assert window.engine.render_cache is None
+        window.load_pdf()
+        window.tasks.wait()
+        assert window.engine.document_cache is None
+        window.close_pdf()
+    
+    def test_setting_is_kept_between_sessions(self, qapp, settings_dir):
+        """Test that the cache budget chosen is restored by the next window"""
+        from pdf_colorizer import PDFColorizer
+        PDFColorizer().disk_cache_spinbox.setValue(512)
+        window = PDFColorizer()
+        window.tasks.wait()
+        assert window.disk_cache_spinbox.value() == 512
+        assert window.engine.render_cache.max_bytes == 512 * 1024 * 1024
+        assert any(settings_dir.rglob("*.ini"))
+
+
+class TestPrefetch:
+    """Test background rendering of neighbouring pages"""
+    
+    def test_prefetch_fills_cache(self, qapp, street_plan_pdf):
+        """Test that neighbouring pages arrive in the cache in the background"""
+        import time
+        from pdf_colorizer import PDFColorizer
+        window = PDFColorizer()
+        window.pdf_path = str(street_plan_pdf)
+        window.load_pdf()
+        window.tasks.wait()
+        
+        deadline = time.monotonic() + 30
+        while 1 not in window.engine.page_cache and time.monotonic() < deadline:
+            qapp.processEvents()
+            time.sleep(0.01)
+        
+        assert 1 in window.engine.page_cache
+        assert window.engine.page_cache.get(1).shape == window.engine.page_cache.get(0).shape
+        window.close_pdf()
+    
+    def test_schedule_cancels_stale_jobs(self, qapp, street_plan_pdf):
+        """Test that jumping away drops jobs for pages no longer wanted"""
+        from pdf_colorizer import PrefetchScheduler
+        scheduler = PrefetchScheduler(max_workers=1)
+        scheduler.start(str(street_plan_pdf))
+        try:
+            scheduler.schedule([0, 1, 2])
+            scheduler.schedule([2])
+            assert set(scheduler._jobs) <= {2}
+            
+            # Claiming a page either waits for its render or hands it back
+            image = scheduler.take(2)
+            assert image is None or image.shape[2] == 3
+            assert 2 not in scheduler._jobs
+        finally:
+            scheduler.stop()
+    
+    def test_superseded_requests_are_delivered(self, qapp, street_plan_pdf):
+        """Test that only the last page requested is held back for take()"""
+        import time
+        from pdf_colorizer import PrefetchScheduler
+        scheduler = PrefetchScheduler(max_workers=1)
+        delivered = []
+        scheduler.page_ready.connect(lambda page_num, image: delivered.append(page_num))
+        scheduler.start(str(street_plan_pdf))
+        try:
+            for page_num in range(3):
+                scheduler.request(page_num)
+            assert set(scheduler._requested) == {2}
+            
+            # Earlier pages were either cancelled or go to page_ready as they finish
+            deadline = time.monotonic() + 30
+            while scheduler._jobs and time.monotonic() < deadline:
+                qapp.processEvents()
+                time.sleep(0.01)
+            assert not scheduler._jobs and set(delivered) <= {0, 1}
+            assert scheduler.take(2).shape[2] == 3
+            assert not scheduler._requested
+        finally:
+            scheduler.stop()
+
+
+class TestStartup:
+    """Test that the window does not wait for the heavy imports"""
+    
+    def test_import_defers_heavy_modules(self):
+        """Test that importing the GUI loads neither OpenCV, PyMuPDF nor NumPy"""
+        import subprocess
+        code = ("import sys, pdf_colorizer; "
+                "print(sorted(m for m in ('cv2', 'fitz', 'numpy', 'PIL.Image') if m in sys.modules))")
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                cwd=str(Path(__file__).parent.parent), check=True)
+        assert result.stdout.strip().splitlines()[-1] == "[]"
+    
+    def test_lazy_module_loads_on_first_use(self):
+        """Test that a deferred module behaves like the module once used"""
+        import colorsys
+        from colorizer_engine import LazyModule
+        lazy = LazyModule("colorsys")
+        assert "_module" not in vars(lazy)
+        assert lazy.rgb_to_hsv(1, 0, 0) == colorsys.rgb_to_hsv(1, 0, 0)
+        assert vars(lazy)["_module"] is colorsys
+
+
+class TestTaskRunner:
+    """Test running long operations off the GUI thread"""
+    
+    def test_tasks_run_on_worker_and_apply_in_order(self, qapp):
+        """Test that functions run off the GUI thread and results land in order"""
+        import threading
+        import time
+        from pdf_colorizer import TaskRunner
+        runner = TaskRunner()
+        threads = []
+        applied = []
+        
+        def work(number):
+            def function(task):
+                threads.append(threading.get_ident())
+                time.sleep(0.02 * (3 - number))
+                return number
+            return function
+        
+        for number in range(3):
+            runner.submit("Working", work(number),
+                          on_done=lambda result: applied.append((result, threading.get_ident())))
+        assert runner.busy
+        runner.wait()
+        
+        main = threading.get_ident()
+        assert [result for result, _ in applied] == [0, 1, 2]
+        assert all(thread == main for _, thread in applied)
+        assert main not in threads
+    
+    def test_cancel_drops_queued_and_flags_running(self, qapp):
+        """Test that cancelling stops progress reports and skips queued tasks only"""
+        import threading
+        from pdf_colorizer import TaskRunner
+        runner = TaskRunner()
+        started = threading.Event()
+        release = threading.Event()
+        outcome = []
+        
+        def long_task(task):
+            started.set()
+            release.wait(10)
+            for done in range(1, 4):
+                task.report(done, 3)
+            return "finished"
+        
+        runner.submit("Long", long_task, on_done=lambda _: outcome.append("done"),
+                      on_cancel=lambda result: outcome.append(("cancelled", result)))
+        runner.submit("Queued", lambda task: outcome.append("queued ran"))
+        runner.when_idle(lambda: outcome.append("idle callback"))
+        assert started.wait(10)
+        runner.cancel()
+        release.set()
+        runner.wait()
+        # GUI-thread callbacks such as setting changes are not work to cancel
+        assert outcome == [("cancelled", None), "idle callback"]
+        assert not runner.busy
+    
+    def test_superseded_page_change_is_dropped(self, qapp):
+        """Test that a queued task is replaced by a newer one with its key"""
+        import threading
+        from pdf_colorizer import TaskRunner
+        runner = TaskRunner()
+        release = threading.Event()
+        opened = []
+        runner.submit("Busy", lambda task: release.wait(10))
+        for page_num in range(3):
+            runner.submit("Page", lambda task, page_num=page_num: opened.append(page_num),
+                          key="page")
+        release.set()
+        runner.wait()
+        assert opened == [2]
+    
+    def test_window_fill_does_not_block(self, qapp, street_plan_pdf):
+        """Test that a fill is queued, applied later, and reverted if cancelled"""
+        from pdf_colorizer import PDFColorizer
+        window = PDFColorizer()
+        window.pdf_path = str(street_plan_pdf)
+        window.load_pdf()
+        window.tasks.wait()
+        window.fill_mode_combo.setCurrentText("Exact Flood")
+        
+        window.smart_flood_fill(150, 120)
+        assert window.tasks.busy
+        assert window.cancel_button.isVisibleTo(window)
+        window.tasks.wait()
+        assert not window.cancel_button.isVisibleTo(window)
+        assert tuple(window.engine.colored_image[120, 150]) == (255, 0, 0)
+        
+        # Whether or not it had finished, a cancelled fill leaves no trace
+        window.smart_flood_fill(450, 120)
+        window.tasks.cancel()
+        window.tasks.wait()
+        assert tuple(window.engine.colored_image[120, 450]) == (255, 255, 255)
+        assert len(window.engine.operations[0]) == 1
+        assert window.engine.redo() is None
+        window.close_pdf()
+    
+    def test_window_save_reports_progress(self, qapp, street_plan_pdf, tmp_path, monkeypatch):
+        """Test that saving runs as a task whose progress reaches the status bar"""
+        from PyQt6.QtWidgets import QFileDialog, QMessageBox
+        from pdf_colorizer import PDFColorizer
+        output = tmp_path / "colored.pdf"
+        monkeypatch.setattr(QFileDialog, "getSaveFileName",
+                            staticmethod(lambda *args, **kwargs: (str(output), "")))
+        monkeypatch.setattr(QMessageBox, "information", staticmethod(lambda *args, **kwargs: None))
+        window = PDFColorizer()
+        window.pdf_path = str(street_plan_pdf)
+        window.load_pdf()
+        window.tasks.wait()
+        progress = []
+        window.tasks.progress.connect(lambda done, total: progress.append((done, total)))
+        
+        window.smart_flood_fill(150, 120)
+        window.save_pdf()
+        window.tasks.wait()
+        assert output.exists()
+        assert progress[-1] == (3, 3)
+        window.close_pdf()